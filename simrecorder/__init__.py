@@ -1,8 +1,51 @@
-from .datastore import InMemoryDataStore
-from .hdf_datastore import HDF5DataStore
+import importlib
+
+from .datastore import InMemoryDataStore, DataStoreError
 from .recorder import Recorder
-from .zarr_datastore import ZarrDataStore, DatastoreType, CompressionType
-from .redis_datastore import RedisDataStore, RedisServer
-from .serialization import Serialization
+from .registry import register_datastore, create_datastore
+
+# Everything else is imported on first access, so that `import simrecorder` stays fast for processes that use only
+# some of the datastores
+_lazy_attributes = {
+    'AsyncDataStore': '.async_datastore',
+    'QueueFullPolicy': '.async_datastore',
+    'HDF5DataStore': '.hdf_datastore',
+    'MemmapDataStore': '.memmap_datastore',
+    'TieredDataStore': '.tiered_datastore',
+    'EvictionPolicy': '.tiered_datastore',
+    'ZarrDataStore': '.zarr_datastore',
+    'DatastoreType': '.zarr_datastore',
+    'CompressionType': '.zarr_datastore',
+    'ObjectCodec': '.zarr_datastore',
+    'RedisDataStore': '.redis_datastore',
+    'RedisServer': '.redis_datastore',
+    'RedisList': '.redis_datastore',
+    'Serialization': '.serialization',
+    'PoolType': '.serialization',
+    'RecordSequence': '.sequence',
+    'ReducerDataStore': '.reducers',
+    'MeanVariance': '.reducers',
+    'MinMax': '.reducers',
+    'Histogram': '.reducers',
+    'ExponentialMovingAverage': '.reducers',
+    'ChromeTraceExporter': '.tracing',
+    'TraceEvent': '.tracing',
+}
+
+__all__ = ['Recorder', 'InMemoryDataStore', 'HDF5DataStore', 'MemmapDataStore', 'TieredDataStore', 'EvictionPolicy', 'ZarrDataStore', 'RedisDataStore', 'RedisServer', 'RedisList', 'Serialization', 'PoolType', 'DatastoreType', 'CompressionType', 'ObjectCodec',
+           'AsyncDataStore', 'QueueFullPolicy', 'DataStoreError', 'RecordSequence', 'register_datastore', 'create_datastore',
+           'ReducerDataStore', 'MeanVariance', 'MinMax', 'Histogram', 'ExponentialMovingAverage', 'ChromeTraceExporter',
+           'TraceEvent']
+
+
+def __getattr__(name):
+    module_name = _lazy_attributes.get(name)
+    if module_name is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
 
-__all__ = ['Recorder', 'InMemoryDataStore', 'HDF5DataStore', 'ZarrDataStore', 'RedisDataStore', 'RedisServer', 'Serialization', 'DatastoreType', 'CompressionType']
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes))
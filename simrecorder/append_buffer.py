@@ -0,0 +1,226 @@
+import time
+
+import numpy as np
+
+
+class FlushPolicy:
+    """
+    Decides when buffered appends should be flushed to the underlying storage.
+
+    :param every_n_records: Flush after this many records have been appended (across all keys). None disables this
+        trigger.
+    :param every_seconds: Flush when at least this many seconds have passed since the last flush. The clock is checked
+        on every append, so no flush happens while nothing is being recorded. None disables this trigger.
+
+    If both are None, data is only flushed when the datastore is closed (or when a key is read back).
+    """
+
+    def __init__(self, every_n_records=None, every_seconds=None):
+        assert every_n_records is None or every_n_records > 0, "every_n_records must be positive or None"
+        assert every_seconds is None or every_seconds > 0, "every_seconds must be positive or None"
+        self.every_n_records = every_n_records
+        self.every_seconds = every_seconds
+        self.n_records = 0
+        self.last_flush_time = time.monotonic()
+
+    def record_appended(self):
+        """
+        Register one appended record.
+        :return: True if a flush is due
+        """
+        self.n_records += 1
+        if self.every_n_records is not None and self.n_records >= self.every_n_records:
+            return True
+        if self.every_seconds is not None and time.monotonic() - self.last_flush_time >= self.every_seconds:
+            return True
+        return False
+
+    def flushed(self):
+        """
+        Reset the counters after a flush
+        :return:
+        """
+        self.n_records = 0
+        self.last_flush_time = time.monotonic()
+
+
+class AppendBuffer:
+    """
+    Collects fixed-shape records in memory and writes them to a growable array (h5py Dataset or zarr Array) in
+    chunk-aligned blocks. The capacity of the array is grown geometrically, so the array is usually longer than the
+    number of records stored in it, until :meth:`.trim` is called.
+
+    :param array: The array to write to. Its first axis is the record axis.
+    :param length: Number of valid records already in `array`
+    :param block_rows: Number of records per block. This should be the chunk size of `array` along the first axis, so
+        that every write covers whole chunks.
+    :param resize: Function called as `resize(n)` to change the size of the first axis of `array` to `n`
+    :param growth_factor: Factor by which the capacity is grown when the array is full
+    """
+
+    def __init__(self, array, length, block_rows, resize, growth_factor=2.):
+        assert growth_factor > 1., "growth_factor must be larger than 1"
+        self.array = array
+        self.length = length
+        self.block_rows = block_rows
+        self.block = np.empty((block_rows, *array.shape[1:]), dtype=array.dtype)
+        self.n_buffered = 0
+        self.resize = resize
+        self.growth_factor = growth_factor
+
+    def __len__(self):
+        return self.length + self.n_buffered
+
+    def append(self, obj):
+        self.block[self.n_buffered] = obj
+        self.n_buffered += 1
+        # Write as soon as the next chunk boundary is reached, so that writes stay chunk-aligned even after a
+        # partial block was flushed
+        if (self.length + self.n_buffered) % self.block_rows == 0:
+            self.write()
+
+    def write(self):
+        """
+        Write all buffered records to the array, growing it if necessary
+        :return:
+        """
+        if self.n_buffered == 0:
+            return
+        end = self.length + self.n_buffered
+        capacity = self.array.shape[0]
+        if end > capacity:
+            new_capacity = max(end, int(capacity * self.growth_factor))
+            # Round up to whole chunks
+            new_capacity = -(-new_capacity // self.block_rows) * self.block_rows
+            self.resize(new_capacity)
+        self.array[self.length:end, ...] = self.block[:self.n_buffered]
+        self.length = end
+        self.n_buffered = 0
+
+    def trim(self):
+        """
+        Write all buffered records and shrink the array to the number of records actually stored
+        :return:
+        """
+        self.write()
+        if self.array.shape[0] != self.length:
+            self.resize(self.length)
+
+
+class PackedAppendBuffer:
+    """
+    Appends variable-length records to a packed log made of two growable 1-D arrays: `data` holding the values of all
+    records back to back, and `offsets` (int64) holding the end offset of every record in `data`. Record `i` is
+    therefore ``data[offsets[i - 1]:offsets[i]]`` (with ``offsets[-1] == 0``). For byte strings (e.g. pickled
+    objects), `data` is a uint8 array.
+
+    Records are collected in memory and written once `block_values` values or `block_records` records are pending.
+    Both arrays are grown geometrically, until :meth:`.trim` is called, unless `exact_offsets` is True.
+
+    :param data: The data array
+    :param offsets: The int64 offsets array
+    :param n_values: Number of valid values already in `data`
+    :param n_records: Number of valid records already in `offsets`
+    :param resize_data: Function called as `resize_data(n)` to resize `data` to `n` values
+    :param resize_offsets: Function called as `resize_offsets(n)` to resize `offsets` to `n` records
+    :param block_values: Write when at least these many values are pending
+    :param block_records: Write when these many records are pending
+    :param growth_factor: Factor by which the capacity of the arrays is grown when they are full
+    :param exact_offsets: Grow `offsets` only by the number of records written, so that it never has unused entries
+        at the end and the log can be read even if it is never trimmed (e.g. when the process is killed). Values past
+        the last offset in `data` are ignored by readers anyway
+    """
+
+    def __init__(self, data, offsets, n_values, n_records, resize_data, resize_offsets, block_values, block_records,
+                 growth_factor=2., exact_offsets=False):
+        assert growth_factor > 1., "growth_factor must be larger than 1"
+        self.data = data
+        self.offsets = offsets
+        self.n_values = n_values
+        self.n_records = n_records
+        self.resize_data = resize_data
+        self.resize_offsets = resize_offsets
+        self.block_values = block_values
+        self.block_records = block_records
+        self.growth_factor = growth_factor
+        self.exact_offsets = exact_offsets
+        self.pending = []
+        self.n_pending_values = 0
+        self.pending_offsets = []
+
+    def __len__(self):
+        return self.n_records + len(self.pending_offsets)
+
+    def append(self, values):
+        """
+        :param values: A bytes-like object (for a uint8 `data` array) or a 1-D numpy array
+        """
+        if not isinstance(values, np.ndarray):
+            values = np.frombuffer(values, dtype=np.uint8)
+        self.pending.append(values)
+        self.n_pending_values += len(values)
+        self.pending_offsets.append(self.n_values + self.n_pending_values)
+        if self.n_pending_values >= self.block_values or len(self.pending_offsets) >= self.block_records:
+            self.write()
+
+    def write(self):
+        """
+        Write all pending records to the arrays, growing them if necessary
+        :return:
+        """
+        if not self.pending_offsets:
+            return
+        end_values = self.n_values + self.n_pending_values
+        end_records = self.n_records + len(self.pending_offsets)
+        # The values are written before the offsets that refer to them
+        self._grow(self.data, end_values, self.resize_data)
+        if self.n_pending_values > 0:
+            self.data[self.n_values:end_values] = np.concatenate(self.pending)
+        if self.exact_offsets:
+            self.resize_offsets(end_records)
+        else:
+            self._grow(self.offsets, end_records, self.resize_offsets)
+        self.offsets[self.n_records:end_records] = np.array(self.pending_offsets, dtype=np.int64)
+        self.n_values = end_values
+        self.n_records = end_records
+        self.pending = []
+        self.n_pending_values = 0
+        self.pending_offsets = []
+
+    def trim(self):
+        """
+        Write all pending records and shrink the arrays to their actual length
+        :return:
+        """
+        self.write()
+        if self.data.shape[0] != self.n_values:
+            self.resize_data(self.n_values)
+        if self.offsets.shape[0] != self.n_records:
+            self.resize_offsets(self.n_records)
+
+    def _grow(self, array, size, resize):
+        capacity = array.shape[0]
+        if size > capacity:
+            resize(max(size, int(capacity * self.growth_factor)))
+
+
+def check_cast(key, dtype, key_dtype):
+    """
+    Raise a TypeError if values of `dtype` can't be appended to the key `key` of `key_dtype` without casting them to a
+    different kind of dtype (e.g. a float to an int)
+    """
+    if not np.can_cast(dtype, key_dtype, casting='same_kind'):
+        raise TypeError("Cannot append a value of type {} to key {} of type {}".format(dtype, key, key_dtype))
+
+
+def split_packed(data, offsets, first_offset=0):
+    """
+    Split the values of a packed log (see :class:`.PackedAppendBuffer`) into the individual records.
+    :param data: numpy array with the values of all the records in `offsets`, starting at `first_offset`
+    :param offsets: int64 numpy array of end offsets
+    :param first_offset: Offset of the start of the first record (i.e. of `data[0]`)
+    :return: List of views into `data`
+    """
+    ends = np.asarray(offsets, dtype=np.int64) - first_offset
+    starts = np.concatenate([[0], ends[:-1]])
+    return [data[start:end] for start, end in zip(starts.tolist(), ends.tolist())]
@@ -0,0 +1,157 @@
+import contextlib
+import logging
+import queue
+import threading
+from enum import Enum
+
+import numpy as np
+
+from simrecorder.datastore import DataStore, DataStoreError
+
+QueueFullPolicy = Enum('QueueFullPolicy', ['BLOCK', 'DROP'])
+
+logger = logging.getLogger('simrecorder.async_datastore')
+
+_STOP = object()
+
+
+class AsyncDataStore(DataStore):
+    """
+    Wraps another datastore so that :meth:`.set` and :meth:`.append` return immediately and the actual work
+    (serialization, compression and I/O) is done on background writer threads.
+
+    Operations are put in bounded queues. With more than one writer thread, keys are distributed over the threads, so
+    that all operations on one key are still done in order. The threads only call the wrapped datastore at the same
+    time if it is thread-safe (see :attr:`.DataStore.thread_safe`), otherwise they take turns. Any exception raised by
+    the wrapped datastore is stored and raised (as a :class:`.DataStoreError`) on the next call.
+
+    :param datastore: The datastore to wrap
+    :param max_queue_size: Maximum number of pending operations per writer thread
+    :param n_writer_threads: Number of writer threads. More than one thread only helps for thread-safe datastores
+        (e.g. redis), since the threads take turns calling any other datastore
+    :param queue_full_policy: If :attr:`QueueFullPolicy.BLOCK`, the caller waits until there is space in the queue.
+        If :attr:`QueueFullPolicy.DROP`, the operation is dropped (and counted in `n_dropped`)
+    :param copy_arrays: Copy numpy arrays before queueing them, so that the caller can reuse its buffers right away
+    """
+
+    def __init__(self, datastore, max_queue_size=1000, n_writer_threads=1, queue_full_policy=QueueFullPolicy.BLOCK,
+                 copy_arrays=True):
+        assert n_writer_threads >= 1, "Need at least one writer thread"
+        self.datastore = datastore
+        self.queue_full_policy = queue_full_policy
+        self.copy_arrays = copy_arrays
+
+        self.errors = []
+        self.n_dropped = 0
+        self._lock = threading.Lock()
+        # Held by the writer threads while they call a datastore that is not thread-safe
+        if n_writer_threads > 1 and not datastore.thread_safe:
+            self._datastore_lock = threading.Lock()
+        else:
+            self._datastore_lock = contextlib.nullcontext()
+
+        self.queues = [queue.Queue(maxsize=max_queue_size) for _ in range(n_writer_threads)]
+        self.threads = [
+            threading.Thread(target=self._writer, args=(q, ), name='simrecorder-writer-{}'.format(i), daemon=True)
+            for i, q in enumerate(self.queues)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def connect(self):
+        self.datastore.connect()
+        return self
+
+    def set(self, key, value):
+        self.raise_errors()
+        self._put(key, ('set', key, value))
+
+    def get(self, key):
+        self.flush()
+        return self.datastore.get(key)
+
+    def append(self, key, obj):
+        self.raise_errors()
+        self._put(key, ('append', key, obj))
+
+    def get_all(self, key):
+        self.flush()
+        return self.datastore.get_all(key)
+
+    def flush(self):
+        """
+        Wait until all queued operations are done, and flush the wrapped datastore.
+        :return:
+        """
+        self.drain()
+        self.datastore.flush()
+        self.raise_errors()
+
+    def drain(self):
+        """
+        Wait until all queued operations are done, without raising any errors.
+        :return:
+        """
+        for q in self.queues:
+            q.join()
+
+    def close(self):
+        self.drain()
+        for q in self.queues:
+            q.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+        self.datastore.close()
+        self.raise_errors()
+
+    @property
+    def queue_depth(self):
+        """
+        Number of operations waiting to be written
+        """
+        return sum(q.qsize() for q in self.queues)
+
+    def pop_errors(self):
+        """
+        Return and clear the errors raised by the wrapped datastore so far.
+        :return: List of `(datastore, exception)` tuples
+        """
+        with self._lock:
+            errors, self.errors = self.errors, []
+        return [(self.datastore, e) for e in errors]
+
+    def raise_errors(self):
+        errors = self.pop_errors()
+        if errors:
+            raise DataStoreError(errors) from errors[0][1]
+
+    def _put(self, key, item):
+        if self.copy_arrays and isinstance(item[2], np.ndarray):
+            item = (item[0], item[1], item[2].copy())
+        q = self.queues[hash(key) % len(self.queues)]
+        if self.queue_full_policy == QueueFullPolicy.BLOCK:
+            q.put(item)
+        else:
+            try:
+                q.put_nowait(item)
+            except queue.Full:
+                with self._lock:
+                    self.n_dropped += 1
+                    n_dropped = self.n_dropped
+                if n_dropped == 1:
+                    logger.warning('Write queue for %s is full, dropping records', type(self.datastore).__name__)
+
+    def _writer(self, q):
+        while True:
+            item = q.get()
+            try:
+                if item is _STOP:
+                    return
+                op, key, val = item
+                with self._datastore_lock:
+                    getattr(self.datastore, op)(key, val)
+            except Exception as e:
+                with self._lock:
+                    self.errors.append(e)
+            finally:
+                q.task_done()
@@ -0,0 +1,103 @@
+from enum import Enum
+
+import numpy as np
+
+ReadPattern = Enum('ReadPattern', ['PER_TIMESTEP', 'TIME_SERIES', 'WHOLE_RUN'])
+
+# Number of records per chunk for ReadPattern.TIME_SERIES if the expected number of records is not known
+DEFAULT_TIME_SERIES_ROWS = 1024
+
+
+def plan_chunks(record_shape,
+                dtype,
+                desired_chunk_size_bytes,
+                read_pattern=ReadPattern.PER_TIMESTEP,
+                expected_n_records=None,
+                pack_records=False):
+    """
+    Plans the chunk shape of an array of records of shape `record_shape` that are appended along a new first axis, so
+    that the chunk size is close to `desired_chunk_size_bytes`.
+
+    * :attr:`ReadPattern.PER_TIMESTEP`: Records are mostly read one at a time (``l[i]``). A chunk never contains more
+      than one record (unless `pack_records` is True). Records larger than a chunk are split along all but the last
+      dimension, which is kept whole.
+    * :attr:`ReadPattern.TIME_SERIES`: Individual elements are mostly read over all records (``l[:, i, j]``). A chunk
+      spans many records (`expected_n_records`, or :data:`DEFAULT_TIME_SERIES_ROWS` if not known) and a small part of
+      each record.
+    * :attr:`ReadPattern.WHOLE_RUN`: Everything is mostly read at once. As many whole records as fit are put into a
+      chunk, and records larger than a chunk are split into contiguous (C-order) slabs.
+
+    :param record_shape: Shape of a single record
+    :param dtype: dtype of the records
+    :param desired_chunk_size_bytes: Desired size of a chunk. If <= 0, True is returned so that the backend chooses the
+        chunk size itself
+    :param read_pattern: A :class:`.ReadPattern`
+    :param expected_n_records: Expected total number of records, if known. Chunks never span more records than this
+    :param pack_records: (PER_TIMESTEP only) Put as many records into a chunk as fit. This is only a good idea if
+        records are written in chunk-sized blocks (e.g. with buffered appends), since otherwise every append rewrites a
+        partially filled chunk
+    :return: The chunk shape as a tuple of length `len(record_shape) + 1`
+    """
+    if desired_chunk_size_bytes <= 0:
+        return True
+
+    record_shape = tuple(int(s) for s in record_shape)
+    budget = max(1, int(desired_chunk_size_bytes // np.dtype(dtype).itemsize))
+    record_size = int(np.prod(record_shape, dtype=np.int64))
+    max_rows = expected_n_records if expected_n_records else np.inf
+
+    if record_size == 0:
+        return (1, ) + tuple(max(1, s) for s in record_shape)
+
+    if read_pattern == ReadPattern.TIME_SERIES:
+        rows = int(min(budget, expected_n_records or DEFAULT_TIME_SERIES_ROWS))
+        per_record = max(1, budget // rows)
+        if per_record >= record_size:
+            rows = int(min(budget // record_size, max_rows))
+            return (max(1, rows), ) + record_shape
+        return (rows, ) + _split_evenly(record_shape, per_record)
+
+    if record_size <= budget:
+        if read_pattern == ReadPattern.WHOLE_RUN or pack_records:
+            rows = int(min(budget // record_size, max_rows))
+        else:
+            rows = 1
+        return (max(1, rows), ) + record_shape
+
+    if read_pattern == ReadPattern.WHOLE_RUN:
+        return (1, ) + _split_contiguous(record_shape, budget)
+    elif read_pattern == ReadPattern.PER_TIMESTEP:
+        last = min(record_shape[-1], budget)
+        return (1, ) + _split_evenly(record_shape[:-1], budget // last) + (last, )
+    else:
+        raise ValueError("Unknown read pattern: {}".format(read_pattern))
+
+
+def _split_evenly(shape, n_elements):
+    """
+    Chunk shape for `shape` with about `n_elements` elements, split as evenly as possible over all dimensions
+    """
+    chunk = [1] * len(shape)
+    remaining = float(n_elements)
+    # Small dimensions first, so that what they can't use is given to the larger ones
+    order = sorted(range(len(shape)), key=lambda i: shape[i])
+    for k, i in enumerate(order):
+        s = min(shape[i], max(1, int(np.floor(remaining**(1 / (len(shape) - k)) + 1e-9))))
+        chunk[i] = s
+        remaining /= s
+    return tuple(chunk)
+
+
+def _split_contiguous(shape, n_elements):
+    """
+    Chunk shape for `shape` with at most `n_elements` elements, such that every chunk is a contiguous slab in C order
+    """
+    chunk = [1] * len(shape)
+    remaining = n_elements
+    for i in reversed(range(len(shape))):
+        s = min(shape[i], remaining)
+        chunk[i] = s
+        remaining //= s
+        if s < shape[i]:
+            break
+    return tuple(chunk)
@@ -0,0 +1,85 @@
+"""
+Automatic choice of the compression of a key, by trial-compressing a sample of its records with candidate codecs.
+"""
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# Default minimum write throughput for automatic compression, in MB/s of uncompressed data
+DEFAULT_MIN_WRITE_MB_PER_S = 100.
+
+# Samples smaller than this say little about how the key compresses (e.g. single scalars or small pickled objects),
+# so the backend's default codec is used for them
+MIN_SAMPLE_BYTES = 4096
+
+# Samples are cut to at most this size, so that the trials stay short
+MAX_SAMPLE_BYTES = 1024 ** 2
+
+# Every candidate is timed for at least this long
+_MIN_TRIAL_SECONDS = 0.002
+_MAX_TRIAL_REPEATS = 100
+
+CodecTrial = namedtuple('CodecTrial', ['codec', 'ratio', 'mb_per_s'])
+
+
+def trial_compress(codec, compress, sample_nbytes):
+    """
+    Times `compress` (which compresses the sample with `codec`), repeating it until at least a few milliseconds have
+    passed.
+    :param codec: The candidate codec, in whatever form the backend uses
+    :param compress: Function called without arguments, which compresses the sample and returns the compressed size
+        in bytes
+    :param sample_nbytes: Uncompressed size of the sample in bytes
+    :return: A :class:`CodecTrial`
+    """
+    n_repeats = 0
+    start = time.perf_counter()
+    while True:
+        compressed_nbytes = compress()
+        n_repeats += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= _MIN_TRIAL_SECONDS or n_repeats >= _MAX_TRIAL_REPEATS:
+            break
+    mb_per_s = sample_nbytes * n_repeats / max(elapsed, 1e-9) / 1e6
+    return CodecTrial(codec, sample_nbytes / max(compressed_nbytes, 1), mb_per_s)
+
+
+def select_codec(trials, min_write_mb_per_s=DEFAULT_MIN_WRITE_MB_PER_S):
+    """
+    Choose the codec with the best compression ratio among those that compress at least `min_write_mb_per_s`. If none
+    is fast enough, the fastest codec is chosen.
+    :param trials: List of :class:`CodecTrial`
+    :param min_write_mb_per_s: Minimum throughput in MB/s of uncompressed data
+    :return: The chosen :class:`CodecTrial`
+    """
+    fast_enough = [t for t in trials if t.mb_per_s >= min_write_mb_per_s]
+    if not fast_enough:
+        return max(trials, key=lambda t: t.mb_per_s)
+    return max(fast_enough, key=lambda t: (t.ratio, t.mb_per_s))
+
+
+def selection_metadata(trial, min_write_mb_per_s, codec_description):
+    """
+    Metadata describing the choice, to be stored in the attributes of the key. Ratio and throughput are None if they
+    were not measured
+    """
+
+    def measured(value):
+        return float(value) if value is not None and np.isfinite(value) else None
+
+    return dict(codec=codec_description, ratio=measured(trial.ratio), mb_per_s=measured(trial.mb_per_s),
+                min_write_mb_per_s=float(min_write_mb_per_s))
+
+
+def as_sample(obj):
+    """
+    The contiguous numpy array that is trial-compressed for `obj` (a numpy array, number or bytes). Large arrays are
+    cut along the first axis to about :data:`MAX_SAMPLE_BYTES`.
+    """
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        obj = np.frombuffer(obj, dtype=np.uint8)
+    obj = np.asarray(obj)
+    if obj.ndim > 0 and obj.nbytes > MAX_SAMPLE_BYTES:
+        obj = obj[:max(1, MAX_SAMPLE_BYTES * len(obj) // obj.nbytes)]
+    return np.ascontiguousarray(obj)
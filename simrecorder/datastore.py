@@ -1,8 +1,38 @@
+import sys
+
+import numpy as np
+
+from simrecorder.sequence import ArraySequence, ListSequence
+
+# Upper bound of the memory allocated for the growth buffer of a key when it is created, so that keys of large
+# records start with space for fewer records
+INITIAL_CAPACITY_BYTES = 1 << 20
+
+
+class DataStoreError(RuntimeError):
+    """
+    Raised when operations on one or more datastores failed.
+
+    :param errors: List of `(datastore, exception)` tuples
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join('{}: {!r}'.format(type(datastore).__name__, e) for datastore, e in errors))
+
+
 class DataStore:
     """
     Interface for datastore. Any DataStore implementation must inherit from this.
     """
 
+    # :class:`simrecorder.stats.DataStoreStats` set by the :class:`.Recorder`, to which datastores can report the time
+    # spent in the phases of their operations and the bytes before and after compression
+    stats = None
+    # Whether several threads may call the methods of one instance at the same time. The writer threads of an
+    # :class:`.AsyncDataStore` take turns calling datastores that are not
+    thread_safe = False
+
     def connect(self):
         """
         Connect to the instance of the datastore if necessary (e.g. with redis or other databases)
@@ -38,11 +68,31 @@ class DataStore:
         """
         pass
 
+    def extend(self, key, objs):
+        """
+        Append every object in `objs` to the list under the key `key`, like calling :meth:`.append` for each of them.
+        Datastores override this where writing many records at once is cheaper.
+
+        :param key:
+        :param objs: An iterable of objects, or a numpy array with one record per row
+        :return:
+        """
+        for obj in objs:
+            self.append(key, obj)
+
     def get_all(self, key):
         """
         Get a list of values stored under key using :meth:`.append`. For some datastores, getting a list is a different
         call than getting a single value
         :param key:
+        :return: A :class:`simrecorder.sequence.RecordSequence`, which reads the values lazily
+        """
+        pass
+
+    def flush(self):
+        """
+        Make sure everything stored so far has been written out (to disk, or to the server), if the datastore buffers
+        anything.
         :return:
         """
         pass
@@ -54,13 +104,53 @@ class DataStore:
         """
         pass
 
+    def storage_size(self, key=None):
+        """
+        Size of the values stored under `key` in files (after compression), in bytes. Values that are still buffered in
+        memory are not counted. :meth:`simrecorder.Recorder.stats` reports this for every key, so the growth between
+        two snapshots is what the recorded data took on disk.
+        :param key: The key. If None, the sizes of all keys are returned
+        :return: Number of bytes, or a dictionary of the number of bytes of every key if `key` is None. None for
+            datastores that don't store their data in files
+        """
+        return None
+
+    def add_trace_hook(self, on_start=None, on_end=None):
+        """
+        Call `on_start(event)` before and `on_end(event)` after every operation of this datastore (set, get, append,
+        extend, get_all, flush and close), with a :class:`simrecorder.tracing.TraceEvent` carrying the key, operation,
+        size and timings. Datastores wrapped in an :class:`.AsyncDataStore` are called on the writer threads. Without
+        any hooks, tracing costs nothing.
+        :return: A handle to pass to :meth:`.remove_trace_hook`
+        """
+        from simrecorder.tracing import DATASTORE_OPS, add_trace_hook
+        return add_trace_hook(self, DATASTORE_OPS, on_start, on_end)
+
+    def remove_trace_hook(self, hook):
+        """
+        Remove a hook added with :meth:`.add_trace_hook`
+        :param hook:
+        :return:
+        """
+        from simrecorder.tracing import remove_trace_hook
+        remove_trace_hook(self, hook)
+
 
 class InMemoryDataStore(DataStore):
     """
-    Simple datastore that stores everything in memory
+    Simple datastore that stores everything in memory.
+
+    Numbers and numeric arrays appended to a key are copied into one contiguous numpy array per key, whose capacity is
+    doubled when it is full, so :meth:`.get_all` returns a view of the records without copying them. Once a record of
+    a different shape or dtype (or any other object) is appended to a key, the key falls back to a list of records.
+
+    :param initial_capacity: Number of records for which space is allocated when a key is created. At most
+        `INITIAL_CAPACITY_BYTES` are allocated up front (but always space for at least one record)
     """
 
-    def __init__(self):
+    def __init__(self, initial_capacity=16):
+        assert initial_capacity > 0, "initial_capacity must be positive"
+        self.initial_capacity = initial_capacity
         self.data = {}
 
     def connect(self):
@@ -73,7 +163,85 @@ class InMemoryDataStore(DataStore):
         return self.data.get(key)
 
     def append(self, key, obj):
-        self.data.setdefault(key, []).append(obj)
+        records = self.data.get(key)
+        if records is None:
+            if isinstance(obj, (int, float, complex, np.number, np.bool_, np.ndarray)) and \
+                    np.asarray(obj).dtype.kind in 'biufc':
+                records = _GrowableArray(np.asarray(obj), self.initial_capacity)
+                self.data[key] = records
+                return
+            records = self.data[key] = []
+        elif isinstance(records, _GrowableArray):
+            if records.accepts(obj):
+                records.append(obj)
+                return
+            records = self.data[key] = list(records.view())
+        records.append(obj)
+
+    def pop_all(self, key):
+        """
+        Remove the list under `key` and return its records
+        :param key:
+        :return: A numpy array with one record per row (for records kept in a growth buffer) or a list. An empty list
+            if `key` doesn't exist
+        """
+        records = self.data.pop(key, [])
+        if isinstance(records, _GrowableArray):
+            return records.view()
+        return records
 
     def get_all(self, key):
-        return self.data.get(key, [])
+        records = self.data.get(key, [])
+        if isinstance(records, _GrowableArray):
+            return ArraySequence(records.view())
+        return ListSequence(records)
+
+    def memory_usage(self, key=None):
+        """
+        Memory used by the values stored under `key`, in bytes. For arrays this includes the unused capacity of the
+        growth buffer. For lists of objects, only the list and the objects themselves are counted (not the objects
+        they refer to, except for the data of numpy arrays).
+        :param key: The key. If None, the memory usage of all keys is returned
+        :return: Number of bytes, or a dictionary of the number of bytes of every key if `key` is None
+        """
+        if key is None:
+            return {key: self.memory_usage(key) for key in self.data}
+        return _memory_usage(self.data[key])
+
+
+class _GrowableArray:
+    """
+    Contiguous numpy array of records of the same shape and dtype, whose capacity is doubled when it is full
+    """
+
+    def __init__(self, first, capacity):
+        capacity = max(1, min(capacity, INITIAL_CAPACITY_BYTES // max(first.nbytes, 1)))
+        self.array = np.empty((capacity, *first.shape), dtype=first.dtype)
+        self.array[0] = first
+        self.length = 1
+
+    def accepts(self, obj):
+        return isinstance(obj, (int, float, complex, np.number, np.bool_, np.ndarray)) and \
+            np.shape(obj) == self.array.shape[1:] and np.asarray(obj).dtype == self.array.dtype
+
+    def append(self, obj):
+        if self.length == len(self.array):
+            # Views returned before keep the old array alive
+            array = np.empty((2 * len(self.array), *self.array.shape[1:]), dtype=self.array.dtype)
+            array[:self.length] = self.array
+            self.array = array
+        self.array[self.length] = obj
+        self.length += 1
+
+    def view(self):
+        return self.array[:self.length]
+
+
+def _memory_usage(value):
+    if isinstance(value, _GrowableArray):
+        return value.array.nbytes
+    elif isinstance(value, np.ndarray):
+        return value.nbytes
+    elif isinstance(value, list):
+        return sys.getsizeof(value) + sum(_memory_usage(v) for v in value)
+    return sys.getsizeof(value)
@@ -0,0 +1,71 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from simrecorder.datastore import DataStoreError
+
+
+class FanOutExecutor:
+    """
+    Runs the same operation on several datastores at once. Every datastore gets its own single worker thread, so
+    operations on one datastore are always done in the order they were submitted, and a call takes as long as the
+    slowest datastore rather than the sum of all of them.
+
+    :param datastores: The datastores to create workers for
+    """
+
+    def __init__(self, datastores):
+        self.datastores = datastores
+        self.executors = {
+            id(datastore): ThreadPoolExecutor(max_workers=1, thread_name_prefix='simrecorder-fanout-{}'.format(i))
+            for i, datastore in enumerate(datastores)
+        }
+
+    def run(self, datastores, op, *args, on_done=None):
+        """
+        Call `datastore.<op>(*args)` for every datastore in parallel, and wait for all of them to finish.
+        :param datastores: The datastores to call (all of them must have been passed to the constructor)
+        :param op: Name of the method to call
+        :param args: Arguments of the method
+        :param on_done: If given, `on_done(datastore, seconds)` is called on the worker thread of every datastore
+            after its call (even if it failed), with the time the call took on that datastore
+        :return: List of the return values, in the same order as `datastores`
+        :raises DataStoreError: If any of the calls failed. All calls are done before this is raised, and the error
+            contains the exceptions of all datastores that failed
+        """
+        futures = [(datastore, self.executors[id(datastore)].submit(call, datastore, op, args, on_done))
+                   for datastore in datastores]
+        results, errors = [], []
+        for datastore, future in futures:
+            try:
+                results.append(future.result())
+            except DataStoreError as e:
+                errors.extend(e.errors)
+            except Exception as e:
+                errors.append((datastore, e))
+        if errors:
+            raise DataStoreError(errors) from errors[0][1]
+        return results
+
+    def append(self, key, obj):
+        """
+        Append `obj` to `key` on all datastores at once, so that the executor can stand in for the datastores in the
+        loop of :meth:`.Recorder.record`
+        """
+        self.run(self.datastores, 'append', key, obj)
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown()
+
+
+def call(datastore, op, args, on_done=None):
+    """
+    `datastore.<op>(*args)`, timed if `on_done` is given (see :meth:`.FanOutExecutor.run`)
+    """
+    if on_done is None:
+        return getattr(datastore, op)(*args)
+    start = time.perf_counter()
+    try:
+        return getattr(datastore, op)(*args)
+    finally:
+        on_done(datastore, time.perf_counter() - start)
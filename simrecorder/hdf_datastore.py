@@ -1,8 +1,19 @@
+import itertools
+import json
 import os
+import pickle
+import time
+import zlib
 
 import numpy as np
 
+from simrecorder.append_buffer import AppendBuffer, FlushPolicy, PackedAppendBuffer, check_cast
+from simrecorder.chunking import ReadPattern, plan_chunks
+from simrecorder.codec_selection import (DEFAULT_MIN_WRITE_MB_PER_S, MIN_SAMPLE_BYTES, CodecTrial, as_sample,
+                                         select_codec, selection_metadata, trial_compress)
 from simrecorder.datastore import DataStore
+from simrecorder.sequence import ArraySequence, ListSequence, PackedSequence
+from simrecorder.stats import record_nbytes
 
 
 class HDF5DataStore(DataStore):
@@ -14,13 +25,42 @@ class HDF5DataStore(DataStore):
                  data_file_pth,
                  chunk_cache_mem_size_bytes=20 * 1024 ** 3,
                  desired_chunk_size_bytes=0.1 * 1024 ** 2,
-                 compression='lzf'):
+                 compression='lzf',
+                 buffered_append=False,
+                 flush_every_n_records=None,
+                 flush_every_seconds=None,
+                 growth_factor=2.,
+                 read_pattern=ReadPattern.PER_TIMESTEP,
+                 expected_n_records=None,
+                 min_write_mb_per_s=DEFAULT_MIN_WRITE_MB_PER_S):
         """
 
         :param data_file_pth: Path to the hdf5 file
         :param chunk_cache_mem_size_bytes: HDF5 chunk cache size. Larger the better. Default is 20GiB
         :param desired_chunk_size_bytes: Chunk size for individual chunks. h5py docs recommends keeping this between
             10 KiB and 1 MiB. Default is 0.1 MiB. Pass in -1 to switch to h5py automagic chunk size.
+        :param compression: Compression filter of all datasets ('lzf', 'gzip' or None). With 'auto', the filter of
+            every key is chosen when the key is created, by trial-compressing its first record with lzf and gzip at
+            several levels, with and without shuffle: the one with the best compression ratio that still compresses
+            at least `min_write_mb_per_s` is used. The choice is recorded in the attribute `compression_selection`
+            of the dataset.
+        :param buffered_append: If True, appended arrays and scalars are collected in memory and written a whole chunk
+            at a time. The datasets are grown geometrically and trimmed to their actual length on :meth:`.close` (or
+            when the key is read back with :meth:`.get_all`). If False, every append resizes the dataset by one and
+            writes the record immediately. Scalars are stored in a 1-D dataset per key. A key of Python ints is
+            stored as int64, and converted to float64 when the first Python float is appended to it
+        :param flush_every_n_records: (buffered_append only) Write out all buffers and flush the file every these many
+            appended records. None disables this trigger.
+        :param flush_every_seconds: (buffered_append only) Write out all buffers and flush the file when these many
+            seconds have passed since the last flush. None disables this trigger. If both triggers are None, data is
+            flushed only on close.
+        :param growth_factor: (buffered_append only) Factor by which the capacity of a dataset is grown when it is full
+        :param read_pattern: How the recorded arrays will mostly be read, which determines the shape of the chunks. See
+            :class:`simrecorder.chunking.ReadPattern`. Chunks spanning several records (TIME_SERIES, WHOLE_RUN) are best
+            combined with `buffered_append`
+        :param expected_n_records: Expected number of records per key, if known. Used to plan the chunks
+        :param min_write_mb_per_s: (compression='auto' only) Minimum compression throughput in MB/s of uncompressed
+            data
         """
         import h5py
         import h5py_cache
@@ -38,9 +78,18 @@ class HDF5DataStore(DataStore):
                 libver='latest',
                 w0=0.1,
                 n_cache_chunks=int(chunk_cache_mem_size_bytes / desired_chunk_size_bytes))
-        self.i = 0
         self.is_swmr_hdf_version = h5py.version.hdf5_version_tuple >= (1, 9, 178)
         self.compression = compression
+        self.min_write_mb_per_s = min_write_mb_per_s
+
+        self.buffered_append = buffered_append
+        self.flush_policy = FlushPolicy(flush_every_n_records, flush_every_seconds)
+        self.growth_factor = growth_factor
+        self.read_pattern = read_pattern
+        self.expected_n_records = expected_n_records
+        self.buffers = {}
+        # Sizes of the keys when the file was closed, for the last snapshot of the statistics
+        self._storage_size_on_close = None
 
     def set(self, key, value):
         d = self.f.get(key)
@@ -53,69 +102,324 @@ class HDF5DataStore(DataStore):
         return self.f.get(key)
 
     def append(self, key, obj):
-        if isinstance(obj, np.ndarray):
+        stats = self.stats
+        if stats is not None and stats.sample():
+            self._timed_append(stats, key, obj)
+            return
+        self._append(key, obj)
+
+    def _timed_append(self, stats, key, obj):
+        """
+        :meth:`._append`, reporting the time spent (as 'io', which includes the filters) and the size of the record
+        (pickled, for objects). How much is stored after compression is reported by :meth:`.storage_size`.
+        """
+        encoded_before = _encoded_nbytes(self.buffers.get(key))
+        start = time.perf_counter()
+        self._append(key, obj)
+        stats.add_phase('io', time.perf_counter() - start)
+        nbytes = record_nbytes(obj)
+        if nbytes is None:
+            nbytes = _encoded_nbytes(self.buffers.get(key)) - encoded_before
+        stats.add_bytes(nbytes)
+
+    def _append(self, key, obj):
+        layout = self._layout(key)
+        if layout not in (None, 'array') or not isinstance(obj, (int, float, complex, np.number, np.bool_,
+                                                                   np.ndarray)):
+            # Once a key holds a packed log, numbers and arrays are pickled into it as well
+            if layout == 'array':
+                raise TypeError("Cannot append an object of type {} to key {}, which holds an array".format(
+                    type(obj).__name__, key))
+            self._packed_append(key, obj)
+        elif not isinstance(obj, np.ndarray):
+            obj = self._scalar_array(key, obj)
+            if self.buffered_append:
+                self._buffered_append(key, obj)
+            else:
+                # Chunks of many scalars, since a chunk per scalar costs much more than the value itself
+                self._unbuffered_append(key, obj, check_dtype=True, pack_records=True)
+        elif self.buffered_append:
+            self._buffered_append(key, obj)
+        else:
+            self._unbuffered_append(key, obj)
+
+    def _layout(self, key):
+        """
+        How the records of `key` are stored: 'array' (a dataset with one row per record), 'packed' (a packed log of
+        pickles, see :meth:`._packed_append`), 'records' (a group with a dataset per record, written by older versions)
+        or None if the key doesn't exist yet
+        """
+        buffer = self.buffers.get(key)
+        if buffer is not None:
+            return 'packed' if isinstance(buffer, PackedAppendBuffer) else 'array'
+        d = self.f.get(key)
+        if d is None:
+            return None
+        elif isinstance(d, self.h5py.Dataset):
+            return 'array'
+        return 'packed' if d.attrs.get('layout') == 'packed' else 'records'
+
+    def extend(self, key, objs):
+        """
+        Append all records in `objs`. If `objs` is a numeric numpy array (one record per row, or a 1-D array of
+        scalars), and `key` is not appended to with a buffer, the records are written with a single resize and write.
+        Scalars are checked and converted like in :meth:`.append`.
+        """
+        if not (isinstance(objs, np.ndarray) and objs.dtype.kind in 'biufc' and objs.ndim > 0 and
+                not self.buffered_append and key not in self.buffers and self._layout(key) in (None, 'array')):
+            return super().extend(key, objs)
+        if len(objs) == 0:
+            return
+
+        d = self.f.get(key)
+        if d is not None:
+            if objs.ndim == 1:
+                if objs.dtype.kind == 'f' and d.dtype == np.int64:
+                    self._promote_to_float64(key)
+                    d = self.f[key]
+                check_cast(key, objs.dtype, d.dtype)
+            n = d.shape[0]
+            d.resize(n + len(objs), axis=0)
+            d[n:, ...] = objs
+            if self.is_swmr_hdf_version:
+                d.flush()
+        else:
+            # Records are written in batches, so chunks can span several of them
+            self._create_dataset(
+                self.f,
+                key,
+                objs,
+                data=objs,
+                maxshape=(None, *objs.shape[1:]),
+                chunks=self._get_chunk_size(objs[0], pack_records=True))
+
+    def _scalar_array(self, key, obj):
+        """
+        `obj` as a 0-d array. A key whose first value is a Python int holds int64 values, and is converted to float64
+        when the first Python float is appended to it (see :meth:`._promote_to_float64`). Python numbers appended to a
+        key of another dtype are converted to that dtype if that is exact (floats are never converted to integers)
+        """
+        if not isinstance(obj, (int, float)) or isinstance(obj, bool):
+            return np.asarray(obj)
+        buffer = self.buffers.get(key)
+        d = buffer.array if buffer is not None else self.f.get(key)
+        if not isinstance(d, self.h5py.Dataset):
+            return np.asarray(obj, dtype=np.int64 if isinstance(obj, int) else np.float64)
+        if isinstance(obj, float) and d.dtype == np.int64:
+            self._promote_to_float64(key)
+            return np.asarray(obj, dtype=np.float64)
+        if isinstance(obj, float) and d.dtype.kind in 'iub':
+            raise TypeError("Cannot append a value of type float to key {} of type {}".format(key, d.dtype))
+        try:
+            value = np.asarray(obj, dtype=d.dtype)
+        except OverflowError:
+            value = None
+        if value is None or value.item() != obj:
+            raise TypeError("Cannot append {} to key {} of type {} without losing precision".format(obj, key, d.dtype))
+        return value
+
+    def _promote_to_float64(self, key):
+        """
+        Convert the integer dataset `key` to float64, so that Python floats can be appended to a key whose first values
+        were Python ints. Raises a TypeError if any of its values can't be represented exactly as float64
+        """
+        buffer = self.buffers.pop(key, None)
+        if buffer is not None:
+            buffer.trim()
+        d = self.f[key]
+        values = d[...]
+        as_float = values.astype(np.float64)
+        if not (np.all(np.abs(as_float) < 2. ** 63) and np.array_equal(as_float.astype(values.dtype), values)):
+            raise TypeError("Cannot append a float to key {} of type {}, since its values can't be converted to "
+                            "float64 without losing precision".format(key, d.dtype))
+        kwargs = dict(maxshape=d.maxshape, chunks=d.chunks, compression=d.compression,
+                      compression_opts=d.compression_opts, shuffle=d.shuffle)
+        attrs = dict(d.attrs)
+        del self.f[key]
+        d = self.f.create_dataset(key, data=as_float, **kwargs)
+        d.attrs.update(attrs)
+
+    def _unbuffered_append(self, key, obj, check_dtype=False, pack_records=False):
+        d = self.f.get(key)
+        if d is not None:
+            assert isinstance(d, self.h5py.Dataset)
+            if check_dtype:
+                check_cast(key, obj.dtype, d.dtype)
+            # https://stackoverflow.com/a/25656175
+            d.resize(d.shape[0] + 1, axis=0)
+            # d[-1:, ...] = obj
+            d[-1, ...] = obj
+            if self.is_swmr_hdf_version:
+                d.flush()
+        else:
+            self._create_dataset(
+                self.f,
+                key,
+                obj,
+                data=obj[None, ...],
+                maxshape=(None, *obj.shape),
+                chunks=self._get_chunk_size(obj, pack_records=pack_records))
+
+    def _buffered_append(self, key, obj):
+        buffer = self.buffers.get(key)
+        if buffer is None:
             d = self.f.get(key)
             if d is not None:
                 assert isinstance(d, self.h5py.Dataset)
-                # https://stackoverflow.com/a/25656175
-                d.resize(d.shape[0] + 1, axis=0)
-                # d[-1:, ...] = obj
-                d[-1, ...] = obj
-                if self.is_swmr_hdf_version:
-                    d.flush()
             else:
-                self.f.create_dataset(
+                chunks = self._get_chunk_size(obj, pack_records=True)
+                d = self._create_dataset(
+                    self.f,
                     key,
-                    data=obj[None, ...],
-                    compression=self.compression,
+                    obj,
+                    shape=(0, *obj.shape),
+                    dtype=obj.dtype,
                     maxshape=(None, *obj.shape),
-                    chunks=self._get_chunk_size(obj))
-        else:
-            self.f.create_dataset("{}/{}".format(key, self.i), data=obj)
-            self.i += 1
+                    chunks=chunks)
+            buffer = AppendBuffer(d, d.shape[0], d.chunks[0], lambda n, d=d: d.resize(n, axis=0), self.growth_factor)
+            self.buffers[key] = buffer
+
+        check_cast(key, obj.dtype, buffer.array.dtype)
+        buffer.append(obj)
+        if self.flush_policy.record_appended():
+            self.flush()
+
+    def _packed_append(self, key, obj):
+        """
+        Objects that are not arrays are pickled and appended to a packed log in the group `key`: a uint8 dataset `data`
+        with all pickles back to back, and an int64 dataset `offsets` with the end offset of every pickle.
+        """
+        record = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            g = self.f.get(key)
+            if g is None:
+                g = self.f.create_group(key)
+                g.attrs['layout'] = 'packed'
+                chunk_bytes = int(self.desired_chunk_size_bytes) if self.desired_chunk_size_bytes > 0 else 64 * 1024
+                self._create_dataset(g, 'data', record, shape=(0, ), maxshape=(None, ), dtype=np.uint8,
+                                     chunks=(chunk_bytes, ))
+                g.create_dataset('offsets', shape=(0, ), maxshape=(None, ), dtype=np.int64,
+                                 chunks=(max(1, chunk_bytes // 8), ))
+            elif g.attrs.get('layout') != 'packed':
+                raise TypeError("Cannot append to key {}, which holds one dataset per record".format(key))
+            data, offsets = g['data'], g['offsets']
+            if self.buffered_append:
+                block_bytes, block_records = data.chunks[0], offsets.chunks[0]
+            else:
+                # Write every record right away, and keep the offsets exactly as long as the log, so that it
+                # can be read even if the file is never closed
+                block_bytes, block_records = 0, 1
+            buffer = PackedAppendBuffer(
+                data, offsets, int(offsets[-1]) if offsets.shape[0] > 0 else 0, offsets.shape[0],
+                lambda n, d=data: d.resize(n, axis=0), lambda n, d=offsets: d.resize(n, axis=0),
+                block_bytes, block_records, self.growth_factor, exact_offsets=not self.buffered_append)
+            self.buffers[key] = buffer
+
+        buffer.append(record)
+        if self.buffered_append and self.flush_policy.record_appended():
+            self.flush()
+
+    def _create_dataset(self, parent, name, sample, **kwargs):
+        """
+        Create the dataset `name` in the group `parent` with the compression of the datastore. For compression='auto',
+        the compression is chosen by trial-compressing `sample`, and the choice is recorded in the attribute
+        `compression_selection` of the dataset (as JSON).
+        """
+        if self.compression != 'auto':
+            return parent.create_dataset(name, compression=self.compression, **kwargs)
+        trial = self._select_compression(as_sample(sample))
+        d = parent.create_dataset(name, **trial.codec, **kwargs)
+        d.attrs['compression_selection'] = json.dumps(
+            selection_metadata(trial, self.min_write_mb_per_s, _describe_filters(trial.codec)))
+        return d
+
+    def _select_compression(self, sample):
+        candidates = [dict()] + [dict(compression='lzf', shuffle=shuffle) for shuffle in (False, True)] + [
+            dict(compression='gzip', compression_opts=level, shuffle=shuffle)
+            for level in (1, 4, 9) for shuffle in (False, True)
+        ]
+        if sample.nbytes < MIN_SAMPLE_BYTES:
+            return CodecTrial(dict(compression='lzf'), None, None)
+
+        trials = []
+        # Every candidate compresses the sample as one chunk of an in-memory file
+        with self.h5py.File('trial-{}.h5'.format(id(sample)), 'w', driver='core', backing_store=False) as f:
+            for i, candidate in enumerate(candidates):
+                d = f.create_dataset(str(i), shape=sample.shape, dtype=sample.dtype, chunks=sample.shape, **candidate)
+
+                def compress(d=d):
+                    d[...] = sample
+                    return d.id.get_storage_size()
 
-    def _get_chunk_size(self, obj):
+                trials.append(trial_compress(candidate, compress, sample.nbytes))
+
+        # Only count the time of the filters, not what writing the chunk through h5py costs anyway (measured with the
+        # uncompressed candidate), since that dominates for small samples
+        overhead_seconds = sample.nbytes / (trials[0].mb_per_s * 1e6)
+        trials = [trials[0]] + [
+            t._replace(mb_per_s=sample.nbytes / max(sample.nbytes / (t.mb_per_s * 1e6) - overhead_seconds, 1e-9) / 1e6)
+            for t in trials[1:]
+        ]
+        return select_codec(trials, self.min_write_mb_per_s)
+
+    def flush(self):
         """
-        Tries to optimize the chunk size (assuming 32-bit floats used) so that the chunk size is close to 1MB. The last
-        dimension size is maintained without change.
+        Write out all buffered records and flush the file to disk. The datasets keep their extra capacity.
+        :return:
+        """
+        for buffer in self.buffers.values():
+            buffer.write()
+        self.f.flush()
+        self.flush_policy.flushed()
+
+    def _get_chunk_size(self, obj, pack_records=False):
+        """
+        Chunk shape for an array of records like `obj`, planned by :func:`simrecorder.chunking.plan_chunks` according to
+        the dtype of `obj`, the declared read pattern and the expected number of records.
         :param obj:
+        :param pack_records: Put several small records into one chunk even for the PER_TIMESTEP read pattern
         :return:
         """
-        ## Makes sure chunk size is always 1MB!
-        desired_chunk_size_bytes = self.desired_chunk_size_bytes  # 8K # 1024**2  # 1MB
-        if desired_chunk_size_bytes <= 0:
-            # Switch to h5py's automagic chunk size calculation
-            return True
+        return plan_chunks(obj.shape, obj.dtype, self.desired_chunk_size_bytes, read_pattern=self.read_pattern,
+                           expected_n_records=self.expected_n_records, pack_records=pack_records)
 
-        element_size_bytes = 4
-        # Assuming storage of 32-bit floats
-        if np.prod(obj.shape) * element_size_bytes <= desired_chunk_size_bytes:
-            return tuple([1] + list(obj.shape))
-        else:
-            ndim = len(obj.shape)
-            total_elements = desired_chunk_size_bytes / element_size_bytes
-            cum_el = total_elements
-            last_el_s = obj.shape[-1]
-            cum_el /= last_el_s
-            shape = [1]
-            for i in range(ndim - 1):
-                s = np.minimum(obj.shape[i], np.power(cum_el, 1 / (ndim - i - 1)))
-                s = np.floor(s)
-                cum_el /= s
-                shape.append(int(s))
-            shape.append(int(last_el_s))
-            assert len(shape) == len(obj.shape) + 1
-            return tuple(shape)
+    def storage_size(self, key=None):
+        """
+        Size of the chunks of the datasets of `key` in the file, after the filters. See
+        :meth:`simrecorder.datastore.DataStore.storage_size`. This reads the index of all chunks of the key, so it takes
+        time proportional to their number.
+        """
+        if self._storage_size_on_close is not None:
+            return self._storage_size_on_close if key is None else self._storage_size_on_close[key]
+        if key is None:
+            return {key: self.storage_size(key) for key in _keys(self.f, self.h5py)}
+        d = self.f[key]
+        if isinstance(d, self.h5py.Dataset):
+            return d.id.get_storage_size()
+        # A packed log, or a dataset per record in older versions
+        return sum(v.id.get_storage_size() for v in d.values())
 
     def get_all(self, key):
+        buffer = self.buffers.get(key)
+        if buffer is not None:
+            buffer.trim()
         d = self.f.get(key)
         if d is not None:
             if isinstance(d, self.h5py.Dataset):
-                return d
+                return HDF5ArraySequence(d)
+            elif d.attrs.get('layout') == 'packed':
+                return PackedSequence(d['data'], d['offsets'], decode=pickle.loads)
             else:
-                return list(map(lambda x: x[1], sorted(d.items(), key=lambda x: int(x[0]))))
+                # Layout of older versions, with one dataset per record
+                return ListSequence(list(map(lambda x: x[1], sorted(d.items(), key=lambda x: int(x[0])))))
 
     def close(self):
+        for buffer in self.buffers.values():
+            buffer.trim()
+        self.buffers = {}
+        if self.stats is not None:
+            self._storage_size_on_close = self.storage_size()
         self.f.close()
 
     def enable_swmr(self):
@@ -127,3 +431,94 @@ class HDF5DataStore(DataStore):
         "If you have libhdf5 version >= 1.10 but get this error, try installing h5py from source"
         "See: http://docs.h5py.org/en/latest/build.html#source-installation"
         self.f.swmr_mode = True
+
+
+def _encoded_nbytes(buffer):
+    """
+    Size of the pickled records in the packed log of `buffer` (including the ones that are not written yet), or 0
+    """
+    if isinstance(buffer, PackedAppendBuffer):
+        return buffer.n_values + buffer.n_pending_values
+    return 0
+
+
+def _keys(group, h5py):
+    """
+    The keys stored in `group` and its subgroups: datasets, packed logs and groups with a dataset per record (of older
+    versions)
+    """
+    for v in group.values():
+        if isinstance(v, h5py.Dataset) or v.attrs.get('layout') == 'packed' or \
+                (len(v) > 0 and all(name.isdigit() for name in v)):
+            yield v.name.lstrip('/')
+        else:
+            yield from _keys(v, h5py)
+
+
+def _describe_filters(filters):
+    if not filters:
+        return 'none'
+    description = filters['compression']
+    if 'compression_opts' in filters:
+        description += '(level={})'.format(filters['compression_opts'])
+    if filters.get('shuffle'):
+        description += '+shuffle'
+    return description
+
+
+class HDF5ArraySequence(ArraySequence):
+    """
+    :class:`simrecorder.sequence.ArraySequence` of an h5py Dataset. h5py serializes all calls into the HDF5 library
+    with one global lock, so threads reading through h5py would only take turns. For parallel reads of datasets that
+    are uncompressed or compressed with gzip (with or without shuffle), the raw chunks are therefore read with the
+    direct chunk read API, which decodes nothing, and are decompressed (zlib releases the GIL) and unshuffled by the
+    reading threads. Datasets with other filters (e.g. lzf) are read through h5py as usual.
+    """
+
+    def __init__(self, array, length=None):
+        import h5py
+
+        super().__init__(array, length)
+        self.filters = None
+        if array.chunks is not None and array.dtype.kind not in 'OSUV' and not array.fletcher32:
+            dcpl = array.id.get_create_plist()
+            filters = [dcpl.get_filter(i)[0] for i in range(dcpl.get_nfilters())]
+            if set(filters) <= {h5py.h5z.FILTER_DEFLATE, h5py.h5z.FILTER_SHUFFLE}:
+                self.filters = filters
+        self.h5z = h5py.h5z
+
+    def _read_into(self, out, start, stop):
+        if self.filters is None:
+            if out.flags.c_contiguous:
+                self.array.read_direct(out, np.s_[start:stop])
+            else:
+                out[...] = self.array[start:stop]
+            return
+
+        chunks = self.array.chunks
+        shape = self.array.shape
+        # [start, stop) lies within one chunk along the record axis
+        chunk_row = start - start % chunks[0]
+        for chunk_start in itertools.product(*(range(0, s, c) for s, c in zip(shape[1:], chunks[1:]))):
+            source = (slice(start - chunk_row, stop - chunk_row), ) + tuple(
+                slice(0, min(c, s - o)) for o, c, s in zip(chunk_start, chunks[1:], shape[1:]))
+            dest = (slice(None), ) + tuple(slice(o, o + sl.stop) for o, sl in zip(chunk_start, source[1:]))
+            try:
+                filter_mask, raw = self.array.id.read_direct_chunk((chunk_row, *chunk_start))
+            except RuntimeError:
+                # The chunk was never written, so h5py fills in the fill value
+                out[dest] = self.array[(slice(start, stop), ) + dest[1:]]
+                continue
+            out[dest] = self._decode_chunk(filter_mask, raw)[source]
+
+    def _decode_chunk(self, filter_mask, raw):
+        # Filters are undone in reverse order. Bit i of filter_mask is set if filter i was skipped for this chunk
+        for i in reversed(range(len(self.filters))):
+            if filter_mask & (1 << i):
+                continue
+            if self.filters[i] == self.h5z.FILTER_DEFLATE:
+                raw = zlib.decompress(raw)
+            else:
+                itemsize = self.array.dtype.itemsize
+                raw = np.frombuffer(raw, dtype=np.uint8).reshape(itemsize, -1).T.tobytes()
+        return np.frombuffer(raw, dtype=self.array.dtype).reshape(self.array.chunks)
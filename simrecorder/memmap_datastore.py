@@ -0,0 +1,260 @@
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+
+from simrecorder.datastore import DataStore
+from simrecorder.sequence import ArraySequence
+from simrecorder.stats import record_nbytes
+
+# Version of the layout of the binary and sidecar files
+MEMMAP_FORMAT_VERSION = 2
+# Size of the header of the binary files, which holds the number of records as a little-endian int64. The records
+# start at this offset, so they stay aligned
+HEADER_NBYTES = 64
+
+
+class MemmapDataStore(DataStore):
+    """
+    Datastore that stores every appended key as a raw, uncompressed binary file that is written through a memory map.
+    This is the fastest way to write and read fixed-shape numeric records, at the cost of disk space (nothing is
+    compressed), so it is meant for scratch runs.
+
+    Every key `a/b` is stored in the directory `data_dir_pth` as
+
+    * `a/b.bin`: A header of 64 bytes with the number of records (a little-endian int64), followed by the records
+      back to back in C order. The file is preallocated and grown geometrically (with ``ftruncate``), and shrunk to
+      the actual number of records on :meth:`.close`. The number of records in the header is updated through the
+      memory map on every append, so that the records survive if the process is killed without closing the
+      datastore.
+    * `a/b.json`: A small sidecar with the dtype and the shape of a record.
+
+    Values stored with :meth:`.set` are saved as `.npy` (for numeric values) or `.pkl` files.
+
+    Records that are not numbers or numpy arrays with a numeric dtype cannot be appended. Use the
+    :class:`.HDF5DataStore` or the :class:`.ZarrDataStore` for these.
+    """
+
+    def __init__(self, data_dir_pth, initial_capacity=1024, growth_factor=2.):
+        """
+        :param data_dir_pth: Path to the directory with the data files. Created if it doesn't exist.
+        :param initial_capacity: Number of records for which space is allocated when a key is created
+        :param growth_factor: Factor by which the capacity of a file is grown when it is full
+        """
+        assert initial_capacity > 0, "initial_capacity must be positive"
+        assert growth_factor > 1., "growth_factor must be larger than 1"
+        self.data_dir_pth = data_dir_pth
+        self.initial_capacity = initial_capacity
+        self.growth_factor = growth_factor
+        os.makedirs(data_dir_pth, exist_ok=True)
+        self.files = {}
+
+    def _path(self, key, extension):
+        return os.path.join(self.data_dir_pth, *key.split('/')) + extension
+
+    def set(self, key, value):
+        pth = self._path(key, '')
+        os.makedirs(os.path.dirname(pth), exist_ok=True)
+        for extension in ['.npy', '.pkl']:
+            if os.path.exists(pth + extension):
+                os.remove(pth + extension)
+        if isinstance(value, (int, float, complex, np.number, np.bool_, np.ndarray)) and \
+                np.asarray(value).dtype.kind in 'biufc':
+            np.save(pth + '.npy', np.asarray(value))
+        else:
+            with open(pth + '.pkl', 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def get(self, key):
+        pth = self._path(key, '')
+        if os.path.exists(pth + '.npy'):
+            return np.load(pth + '.npy', mmap_mode='r')
+        elif os.path.exists(pth + '.pkl'):
+            with open(pth + '.pkl', 'rb') as f:
+                return pickle.load(f)
+
+    def append(self, key, obj):
+        stats = self.stats
+        if stats is not None and stats.sample():
+            start = time.perf_counter()
+            self._append(key, obj)
+            stats.add_phase('io', time.perf_counter() - start)
+            # Records are stored uncompressed, in the dtype of the key
+            stats.add_bytes(record_nbytes(obj), self.files[key].record_nbytes)
+            return
+        self._append(key, obj)
+
+    def _append(self, key, obj):
+        if not isinstance(obj, (int, float, complex, np.number, np.bool_, np.ndarray)):
+            raise TypeError("MemmapDataStore can only append numbers and numpy arrays, not {}".format(
+                type(obj).__name__))
+        f = self.files.get(key)
+        if f is None:
+            f = self._open(key, obj)
+        f.check(key, obj)
+        f.append(obj)
+
+    def _open(self, key, obj):
+        obj = np.asarray(obj)
+        if obj.dtype.kind not in 'biufc':
+            raise TypeError("MemmapDataStore can only append numeric arrays, not arrays of dtype {}".format(obj.dtype))
+        if os.path.exists(self._path(key, '.json')):
+            f = _MemmapFile.open(self._path(key, ''), self.growth_factor)
+        else:
+            os.makedirs(os.path.dirname(self._path(key, '')), exist_ok=True)
+            f = _MemmapFile.create(self._path(key, ''), obj.dtype, obj.shape, self.initial_capacity,
+                                   self.growth_factor)
+        self.files[key] = f
+        return f
+
+    def get_all(self, key):
+        """
+        :return: An :class:`simrecorder.sequence.ArraySequence` of a read-only memory map of the records, so no data
+            is copied or decoded (`to_numpy()` returns the memory map itself). None if the key doesn't exist
+        """
+        f = self.files.get(key)
+        if f is not None:
+            return ArraySequence(f.view())
+        if not os.path.exists(self._path(key, '.json')):
+            return None
+        dtype, record_shape = _MemmapFile.read_sidecar(self._path(key, ''))
+        length = _MemmapFile.read_length(self._path(key, ''))
+        if length == 0:
+            return ArraySequence(np.empty((0, *record_shape), dtype=dtype))
+        return ArraySequence(np.memmap(self._path(key, '.bin'), dtype=dtype, mode='r', offset=HEADER_NBYTES,
+                                       shape=(length, *record_shape)))
+
+    def storage_size(self, key=None):
+        """
+        Size of the files of `key`, including the capacity preallocated for records that are not appended yet. See
+        :meth:`simrecorder.datastore.DataStore.storage_size`.
+        """
+        if key is None:
+            sizes = {}
+            for dir_pth, _, file_names in os.walk(self.data_dir_pth):
+                for file_name in file_names:
+                    stem, extension = os.path.splitext(file_name)
+                    if extension in ('.bin', '.npy', '.pkl'):
+                        key = os.path.relpath(os.path.join(dir_pth, stem), self.data_dir_pth).replace(os.sep, '/')
+                        sizes[key] = sizes.get(key, 0) + os.path.getsize(os.path.join(dir_pth, file_name))
+            return sizes
+        return sum(os.path.getsize(self._path(key, extension)) for extension in ('.bin', '.npy', '.pkl')
+                   if os.path.exists(self._path(key, extension)))
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+class _MemmapFile:
+    """
+    The binary file and sidecar of a key of the :class:`.MemmapDataStore`, opened for appending
+    """
+
+    def __init__(self, pth, dtype, record_shape, length, growth_factor):
+        self.pth = pth
+        self.dtype = np.dtype(dtype)
+        self.record_shape = tuple(record_shape)
+        self.record_nbytes = int(np.prod(self.record_shape, dtype=np.int64)) * self.dtype.itemsize
+        self.length = length
+        self.growth_factor = growth_factor
+        self.fd = os.open(pth + '.bin', os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self.fd).st_size < HEADER_NBYTES:
+            os.ftruncate(self.fd, HEADER_NBYTES)
+        self.capacity = (os.fstat(self.fd).st_size - HEADER_NBYTES) // max(1, self.record_nbytes)
+        self.header = np.memmap(pth + '.bin', dtype='<i8', mode='r+', shape=(1, ))
+        self.header[0] = length
+        self.mm = None
+        self._map()
+
+    @classmethod
+    def create(cls, pth, dtype, record_shape, capacity, growth_factor):
+        f = cls(pth, dtype, record_shape, 0, growth_factor)
+        f.resize(capacity)
+        f.write_sidecar()
+        return f
+
+    @classmethod
+    def open(cls, pth, growth_factor):
+        dtype, record_shape = cls.read_sidecar(pth)
+        return cls(pth, dtype, record_shape, cls.read_length(pth), growth_factor)
+
+    @staticmethod
+    def read_sidecar(pth):
+        with open(pth + '.json') as f:
+            sidecar = json.load(f)
+        assert sidecar['version'] == MEMMAP_FORMAT_VERSION, \
+            "{}.json was written by another version of simrecorder".format(pth)
+        return np.dtype(sidecar['dtype']), tuple(sidecar['shape'])
+
+    @staticmethod
+    def read_length(pth):
+        return int(np.fromfile(pth + '.bin', dtype='<i8', count=1)[0])
+
+    def write_sidecar(self):
+        sidecar = dict(version=MEMMAP_FORMAT_VERSION, dtype=self.dtype.str, shape=self.record_shape)
+        # Write to a temporary file first, so that the sidecar is never half written
+        with open(self.pth + '.json.tmp', 'w') as f:
+            json.dump(sidecar, f)
+        os.replace(self.pth + '.json.tmp', self.pth + '.json')
+
+    def _map(self):
+        if self.capacity > 0 and self.record_nbytes > 0:
+            self.mm = np.memmap(self.pth + '.bin', dtype=self.dtype, mode='r+', offset=HEADER_NBYTES,
+                                shape=(self.capacity, *self.record_shape))
+        else:
+            self.mm = np.empty((self.capacity, *self.record_shape), dtype=self.dtype)
+
+    def resize(self, capacity):
+        if isinstance(self.mm, np.memmap):
+            self.mm.flush()
+        # Views returned by view() keep the old mapping alive, which stays valid for the old size
+        self.mm = None
+        os.ftruncate(self.fd, HEADER_NBYTES + capacity * self.record_nbytes)
+        self.capacity = capacity
+        self._map()
+
+    def check(self, key, obj):
+        """
+        Raise an error if `obj` can't be stored as a record of this file without changing its shape or casting it to a
+        different kind of dtype (e.g. a float to an int)
+        """
+        shape = np.shape(obj)
+        if shape != self.record_shape:
+            raise ValueError("Cannot append a record of shape {} to key {} with records of shape {}".format(
+                shape, key, self.record_shape))
+        dtype = np.asarray(obj).dtype
+        if not np.can_cast(dtype, self.dtype, casting='same_kind'):
+            raise TypeError("Cannot append a value of type {} to key {} of type {}".format(dtype, key, self.dtype))
+
+    def append(self, obj):
+        if self.length == self.capacity:
+            self.resize(max(self.length + 1, int(self.capacity * self.growth_factor)))
+        self.mm[self.length] = obj
+        self.length += 1
+        # The record is written before the length, so the header never counts a record that is not there yet
+        self.header[0] = self.length
+
+    def view(self):
+        view = self.mm[:self.length]
+        view.flags.writeable = False
+        return view
+
+    def flush(self):
+        if isinstance(self.mm, np.memmap):
+            self.mm.flush()
+        self.header.flush()
+
+    def close(self):
+        self.resize(self.length)
+        self.header.flush()
+        self.mm = None
+        self.header = None
+        os.close(self.fd)
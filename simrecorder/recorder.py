@@ -1,13 +1,82 @@
+import time
+
+from simrecorder.async_datastore import AsyncDataStore, QueueFullPolicy
+from simrecorder.datastore import DataStoreError
+from simrecorder.fanout import FanOutExecutor, call
+from simrecorder.stats import DEFAULT_SAMPLE_EVERY, DataStoreStats, StatsExporter, record_nbytes
+
+
 class Recorder:
-    def __init__(self, *datastores):
+    def __init__(self, *datastores, asynchronous=False, max_queue_size=1000, n_writer_threads=1,
+                 queue_full_policy=QueueFullPolicy.BLOCK, parallel=False, stats_sample_every=DEFAULT_SAMPLE_EVERY,
+                 stats_path=None, stats_interval_seconds=60., trace_path=None):
         """
         Initialize Recorder with list of datastores
         :param datastores:
+        :param asynchronous: If True, :meth:`.set` and :meth:`.record` only queue the value, and each datastore is
+            written to by its own background writer thread(s) (see :class:`.AsyncDataStore`). Errors from the writer
+            threads are raised as :class:`.DataStoreError` on the next call. Use :meth:`.flush` to wait until
+            everything has been written.
+        :param max_queue_size: (asynchronous only) Maximum number of pending operations per writer thread
+        :param n_writer_threads: (asynchronous only) Number of writer threads per datastore
+        :param queue_full_policy: (asynchronous only) Whether to block or drop records when the queue is full
+        :param parallel: If True, every datastore gets its own worker thread, and :meth:`.set`, :meth:`.record`,
+            :meth:`.flush` and :meth:`.close` call all datastores at the same time, so that a call takes as long as the
+            slowest datastore instead of the sum of all of them. Operations on each datastore stay in order. If any
+            datastore fails, the others still complete the operation, and a :class:`.DataStoreError` with all failures
+            is raised.
+        :param stats_sample_every: All operations are counted (see :meth:`.stats`), but only one in these many
+            :meth:`.record` calls is timed, to keep the overhead low. Other operations are always timed. Set to 1 to
+            time every call
+        :param stats_path: If given, :meth:`.stats` is written as JSON to this file every `stats_interval_seconds`
+            (by a background thread) and on :meth:`.close`
+        :param stats_interval_seconds: Interval between two exports of the statistics to `stats_path`
+        :param trace_path: If given, all operations of the recorder and of the datastores (on the writer threads, if
+            asynchronous) are traced, and written as a Chrome trace to this file on :meth:`.close` (see
+            :class:`simrecorder.tracing.ChromeTraceExporter`). The exporter is available as `trace_exporter`, e.g. to
+            mark simulation steps
         """
-        self.datastores = datastores
+        if asynchronous:
+            self.datastores = tuple(
+                AsyncDataStore(datastore, max_queue_size=max_queue_size, n_writer_threads=n_writer_threads,
+                               queue_full_policy=queue_full_policy) for datastore in datastores)
+        else:
+            self.datastores = datastores
+        self.asynchronous = asynchronous
+        # Maps the datastores passed in by the user to the ones actually used
+        self._datastore_map = {id(datastore): wrapped for datastore, wrapped in zip(datastores, self.datastores)}
+        self._executor = None
+        if parallel and len(self.datastores) > 1:
+            self._executor = FanOutExecutor(self.datastores)
+        # What :meth:`.record` appends to on its hot path: the datastores themselves, or the executor that calls all
+        # of them at once
+        self._append_targets = self.datastores if self._executor is None else (self._executor, )
         for datastore in self.datastores:
             datastore.connect()
 
+        self._stats_sample_every = stats_sample_every
+        self._stats = []
+        for datastore in self.datastores:
+            inner = datastore.datastore if isinstance(datastore, AsyncDataStore) else datastore
+            stats = DataStoreStats(type(inner).__name__, sample_every=stats_sample_every)
+            # Lets the datastore report the phases of its operations
+            inner.stats = stats
+            self._stats.append(stats)
+        self._stats_map = {id(datastore): stats for datastore, stats in zip(self.datastores, self._stats)}
+        self._append_stats = [stats.op('append') for stats in self._stats]
+        # Number of :meth:`.record` calls (on all datastores) left until the next one is timed
+        self._record_countdown = stats_sample_every
+        self._stats_exporter = None
+        if stats_path is not None:
+            self._stats_exporter = StatsExporter(self.stats, stats_path, stats_interval_seconds)
+
+        self.trace_exporter = None
+        if trace_path is not None:
+            from simrecorder.tracing import ChromeTraceExporter
+            self.trace_exporter = ChromeTraceExporter(trace_path).attach(self)
+            for datastore in self.datastores:
+                self.trace_exporter.attach(datastore.datastore if isinstance(datastore, AsyncDataStore) else datastore)
+
     def set(self, key, val, datastore=None):
         """
         Set a key to a particular value
@@ -18,10 +87,10 @@ class Recorder:
         """
         datastores = self.datastores
         if datastore is not None:
-            datastores = [datastore]
+            datastores = [self._resolve(datastore)]
 
-        for datastore in datastores:
-            datastore.set(key, val)
+        self._raise_async_errors()
+        self._timed_call_all(datastores, 'set', key, val)
 
     def get(self, key, datastore=None):
         """
@@ -30,10 +99,8 @@ class Recorder:
         :param datastore:
         :return:
         """
-        if datastore is not None:
-            return datastore.get(key)
-        else:
-            return self.datastores[0].get(key)
+        datastore = self.datastores[0] if datastore is None else self._resolve(datastore)
+        return self._timed_call_all([datastore], 'get', key)[0]
 
     def record(self, key, val, datastore=None):
         """
@@ -43,12 +110,30 @@ class Recorder:
         :param datastore:
         :return:
         """
-        datastores = self.datastores
-        if datastore is not None:
-            datastores = [datastore]
+        if datastore is None:
+            # Hot path: only count down until the next timed call
+            # Asynchronous datastores raise the errors of their writer threads themselves
+            self._record_countdown -= 1
+            if self._record_countdown:
+                for target in self._append_targets:
+                    target.append(key, val)
+                return
+            self._record_countdown = self._stats_sample_every
+            if self._executor is None:
+                self._timed_append(key, val)
+                return
+            # Account for the calls that were only counted down since the last timed one
+            for stats in self._stats:
+                stats.op('append').count += self._stats_sample_every - 1
+            datastores = self.datastores
+        else:
+            datastores = [self._resolve(datastore)]
 
-        for datastore in datastores:
-            datastore.append(key, val)
+        self._raise_async_errors()
+        # Calls on the hot path above are timed whenever they get here, calls with a given datastore are sampled
+        # separately
+        self._timed_call_all(datastores, 'append', key, val,
+                             sample_every=1 if datastore is None else self._stats_sample_every)
 
     def get_all(self, key, datastore=None):
         """
@@ -57,15 +142,151 @@ class Recorder:
         :param datastore:
         :return:
         """
-        if datastore is not None:
-            return datastore.get_all(key)
-        else:
-            return self.datastores[0].get_all(key)
+        datastore = self.datastores[0] if datastore is None else self._resolve(datastore)
+        return self._timed_call_all([datastore], 'get_all', key)[0]
+
+    def flush(self):
+        """
+        Wait until all queued values have been written (in asynchronous mode) and flush all datastores.
+        :return:
+        """
+        self._timed_call_all(self.datastores, 'flush', aggregate_errors=True)
 
     def close(self):
         """
         Close all datastores in the recorder.
         :return:
         """
+        try:
+            self._timed_call_all(self.datastores, 'close', aggregate_errors=True)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+            if self._stats_exporter is not None:
+                self._stats_exporter.stop()
+            if self.trace_exporter is not None:
+                self.trace_exporter.detach()
+                self.trace_exporter.save()
+
+    def add_trace_hook(self, on_start=None, on_end=None):
+        """
+        Call `on_start(event)` before and `on_end(event)` after every call of :meth:`.set`, :meth:`.get`,
+        :meth:`.record`, :meth:`.get_all`, :meth:`.flush` and :meth:`.close`, with a
+        :class:`simrecorder.tracing.TraceEvent` carrying the key, operation, size and timings. Use
+        :meth:`.DataStore.add_trace_hook` to trace the operations of the datastores themselves. Without any hooks,
+        tracing costs nothing.
+        :return: A handle to pass to :meth:`.remove_trace_hook`
+        """
+        from simrecorder.tracing import RECORDER_OPS, add_trace_hook
+        return add_trace_hook(self, RECORDER_OPS, on_start, on_end)
+
+    def remove_trace_hook(self, hook):
+        """
+        Remove a hook added with :meth:`.add_trace_hook`
+        :param hook:
+        :return:
+        """
+        from simrecorder.tracing import remove_trace_hook
+        remove_trace_hook(self, hook)
+
+    def stats(self):
+        """
+        Snapshot of the performance counters of all datastores. For every datastore, this contains the number of calls
+        of every operation with their (sampled) latencies in microseconds and a latency histogram, the estimated bytes
+        recorded, the time spent in the phases of the operations (e.g. serialize, compress, io) and the bytes before
+        and after compression if the datastore reports them, the size of every key in the files of the datastore (see
+        :meth:`.DataStore.storage_size`), and the queue depth of asynchronous datastores.
+        :return: A dict that can be serialized as JSON
+        """
+        # Calls on the hot path of :meth:`.record` since the last timed one are not counted yet
+        n_pending_records = self._stats_sample_every - self._record_countdown
+        datastores = []
+        for datastore, stats in zip(self.datastores, self._stats):
+            snapshot = stats.snapshot({'append': n_pending_records} if n_pending_records else None)
+            inner = datastore.datastore if isinstance(datastore, AsyncDataStore) else datastore
+            storage_size = inner.storage_size()
+            if storage_size is not None:
+                snapshot['storage_bytes'] = storage_size
+            if isinstance(datastore, AsyncDataStore):
+                snapshot['queue_depth'] = datastore.queue_depth
+                snapshot['n_dropped'] = datastore.n_dropped
+            datastores.append(snapshot)
+        return dict(time=time.time(), sample_every=self._stats_sample_every, datastores=datastores)
+
+    def _timed_append(self, key, val):
+        """
+        The timed call of the hot path of :meth:`.record`: append to every datastore and time it, and count all calls
+        since the last timed one. This does the same as :meth:`._timed_call_all` for sequential calls, in a fraction
+        of the time, since it is done once every `stats_sample_every` records
+        """
+        nbytes = record_nbytes(val)
+        for datastore, op_stats in zip(self.datastores, self._append_stats):
+            op_stats.count += self._stats_sample_every
+            start = time.perf_counter()
+            try:
+                datastore.append(key, val)
+            finally:
+                op_stats.add_sample(time.perf_counter() - start, nbytes)
+
+    def _timed_call_all(self, datastores, op, *args, aggregate_errors=False, sample_every=1):
+        """
+        :meth:`._call_all`, counting the call in the statistics of every datastore and timing the call of every
+        datastore on its own.
+        :param sample_every: Only time the call if the number of calls of `op` on the datastore is a multiple of this
+        :return: List of the return values, in the same order as `datastores`
+        """
+        nbytes = record_nbytes(args[1]) if len(args) > 1 else None
+
+        def on_done(datastore, seconds):
+            stats = self._stats_map.get(id(datastore))
+            if stats is None:
+                return
+            op_stats = stats.op(op)
+            op_stats.count += 1
+            if op_stats.count % sample_every == 0:
+                op_stats.add_sample(seconds, nbytes)
+
+        return self._call_all(datastores, op, *args, aggregate_errors=aggregate_errors, on_done=on_done)
+
+    def _call_all(self, datastores, op, *args, aggregate_errors=False, on_done=None):
+        """
+        Call `datastore.<op>(*args)` on all `datastores`, in parallel if enabled.
+        :param aggregate_errors: (sequential calls only) Call all datastores even if some fail, and raise one
+            :class:`.DataStoreError` at the end. Otherwise the first exception is raised immediately. Parallel calls
+            always aggregate errors.
+        :param on_done: If given, `on_done(datastore, seconds)` is called after the call of every datastore (see
+            :meth:`.FanOutExecutor.run`)
+        """
+        if self._executor is not None and len(datastores) > 1:
+            return self._executor.run(datastores, op, *args, on_done=on_done)
+
+        results, errors = [], []
+        for datastore in datastores:
+            try:
+                if on_done is None:
+                    results.append(getattr(datastore, op)(*args))
+                else:
+                    results.append(call(datastore, op, args, on_done))
+            except DataStoreError as e:
+                if not aggregate_errors:
+                    raise
+                errors.extend(e.errors)
+            except Exception as e:
+                if not aggregate_errors:
+                    raise
+                errors.append((datastore, e))
+        if errors:
+            raise DataStoreError(errors) from errors[0][1]
+        return results
+
+    def _resolve(self, datastore):
+        return self._datastore_map.get(id(datastore), datastore)
+
+    def _raise_async_errors(self):
+        if not self.asynchronous:
+            return
+        errors = []
         for datastore in self.datastores:
-            datastore.close()
+            errors.extend(datastore.pop_errors())
+        if errors:
+            raise DataStoreError(errors) from errors[0][1]
@@ -1,14 +1,80 @@
 from simrecorder.datastore import DataStore
-from simrecorder.serialization import Serialization, SerializationMixin
+from simrecorder.serialization import PoolType, Serialization, SerializationMixin
+from simrecorder.sequence import RecordSequence
 import json
+import threading
+import time
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import logging
 
 from numbers import Integral
 import os
 
+import numpy as np
+
 REDIS_PORT = 65535
 
+# Serialized values larger than this are stored in parts of this size by default (see `part_size_bytes` of
+# :class:`RedisServer`)
+DEFAULT_PART_SIZE_BYTES = 8 * 1024 ** 2
+
+# Prefix of the manifests stored in place of values that were split into parts. Neither pickle, lz4 frames nor the
+# NUMPY serialization start with a zero byte
+PART_MANIFEST_MAGIC = b'\x00SIMRECORDER-PARTS\x00'
+# Sets KEYS[1] to ARGV[2], and deletes the parts KEYS[2] of its previous value if that was a manifest (starting with
+# ARGV[1]). This replaces an unconditional DELETE before every SET in a single command
+SET_DELETING_PARTS_SCRIPT = """
+if redis.call('TYPE', KEYS[1]).ok == 'string' and
+        redis.call('GETRANGE', KEYS[1], 0, string.len(ARGV[1]) - 1) == ARGV[1] then
+    redis.call('DEL', KEYS[2])
+end
+return redis.call('SET', KEYS[1], ARGV[2])
+"""
+
+# Hosts on which a unix socket announced by the server is used instead of TCP
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+_connection_pools = {}
+_connection_pools_lock = threading.Lock()
+# Clients that need to reset their connections and threads in the child after a fork
+_clients = weakref.WeakSet()
+
+
+def get_connection_pool(host, port, unix_socket_path=None):
+    """
+    Returns the connection pool shared by all clients in this process that connect to the server at `host` and `port`
+    (or through the unix socket at `unix_socket_path`, if given). Pools are per process: a forked child gets new pools
+    instead of the connections of its parent.
+    """
+    import redis
+    key = (os.getpid(), host, port, unix_socket_path)
+    with _connection_pools_lock:
+        pool = _connection_pools.get(key)
+        if pool is None:
+            if unix_socket_path is not None:
+                pool = redis.ConnectionPool(connection_class=redis.UnixDomainSocketConnection, path=unix_socket_path)
+            else:
+                pool = redis.ConnectionPool(host=host, port=port)
+            _connection_pools[key] = pool
+    return pool
+
+
+def _reset_after_fork():
+    global _connection_pools_lock
+    # The lock may have been held by another thread of the parent at the time of the fork
+    _connection_pools_lock = threading.Lock()
+    _connection_pools.clear()
+    for client in list(_clients):
+        client._reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
 logger = logging.getLogger('simrecorder.redis_datastore')
 
 
@@ -20,60 +86,304 @@ class RedisDataStore(DataStore, SerializationMixin):
 
     :param server_host: The string identifying the host containing the redis server
     :param redis_port: The port number on which the redis port is active
+    :param pipeline_max_commands: If not None, writes are buffered in a redis pipeline and sent to the server in one
+        round trip once this many writes are pending
+    :param pipeline_max_bytes: If not None, writes are buffered in a redis pipeline and sent to the server once the
+        pending (serialized) data is larger than this many bytes
+    :param pipeline_flush_seconds: If not None, writes are buffered in a redis pipeline, and a background thread sends
+        pending writes to the server every these many seconds
+    :param page_size: Number of list elements fetched per LRANGE call when reading lists returned by :meth:`.get_all`
+    :param deserialization_pool_type: If the server is configured with `use_multiprocess_deserialization`, whether
+        lists are decoded in a pool of worker processes (:attr:`PoolType.PROCESS`) or threads (:attr:`PoolType.THREAD`).
+        The pool is started on first use and shut down by :meth:`.close`.
+    :param n_deserialization_workers: Size of the deserialization pool. None uses the number of CPUs
+    :param n_part_fetch_threads: Number of connections over which the parts of large values are fetched in parallel
+    :param unix_socket_path: Path of the unix socket of the server. If 'auto', the unix socket of a :class:`RedisServer`
+        started with `unix_socket_path` is used if `server_host` is the local host. None always uses TCP
+
+    All clients in a process that connect to the same server share one connection pool. After a fork, clients
+    reconnect in the child process on their own (with new pools), and writes that were pending in the pipeline at the
+    time of the fork are left to the parent.
+
+    If any of the `pipeline_*` options are given, :meth:`.set` and :meth:`.append` are buffered and sent whenever any
+    of the given thresholds is reached. Reads (:meth:`.get`, :meth:`.get_all`) and :meth:`.close` send all pending
+    writes first.
+
+    If the server is configured with a `part_size_bytes`, (serialized and compressed) values larger than that are split
+    into parts, which are stored in a hash under a sub-key (`<key>/__parts__/...`), and only a small manifest is put in
+    the list. This keeps single commands small, so that the server is not blocked by huge values. Reads fetch the parts
+    over several connections at once, into one preallocated buffer.
+
+    Writes can be done from several threads at once (e.g. the writer threads of an :class:`.AsyncDataStore`).
     """
 
-    def __init__(self, server_host, redis_port=REDIS_PORT):
+    thread_safe = True
+
+    def __init__(self, server_host, redis_port=REDIS_PORT,
+                 pipeline_max_commands=None, pipeline_max_bytes=None, pipeline_flush_seconds=None,
+                 page_size=100, deserialization_pool_type=PoolType.PROCESS, n_deserialization_workers=None,
+                 n_part_fetch_threads=4, unix_socket_path='auto'):
 
         self.server_host = server_host
         self.redis_port = redis_port
+        self.unix_socket_path = None
         self.rj = None
 
         import redis
-        self.rj = redis.StrictRedis(host=self.server_host, port=self.redis_port)  # , decode_responses=True)
-        config_dict = self._get_config()['client']
+        self.rj = redis.StrictRedis(connection_pool=get_connection_pool(server_host, redis_port))
+        config = self._get_config()
+        if unix_socket_path == 'auto':
+            unix_socket_path = config['server'].get('unix_socket_path') if server_host in LOCAL_HOSTS else None
+            if unix_socket_path is not None and not os.path.exists(unix_socket_path):
+                unix_socket_path = None
+        if unix_socket_path is not None:
+            self.unix_socket_path = unix_socket_path
+            self.rj = redis.StrictRedis(connection_pool=get_connection_pool(server_host, redis_port, unix_socket_path))
+        config_dict = config['client']
 
         serialization = config_dict['serialization']
         use_multiprocess_deserialization = config_dict['use_multiprocess_deserialization']
         use_compression = config_dict['use_compression']
+        # Databases created before values were split into parts have no part size
+        self.part_size_bytes = config_dict.get('part_size_bytes')
+        self.n_part_fetch_threads = n_part_fetch_threads
+        self._part_executor = None
 
         if serialization == Serialization.PICKLE:
             self._serialize = self._pickle_serialize
             self._deserialize = self._pickle_deserialize
         elif serialization == Serialization.PYARROW:
+            import pyarrow
+            if not hasattr(pyarrow, 'serialize'):
+                raise RuntimeError("pyarrow {} does not support serialization anymore (removed in pyarrow 2.0). Use "
+                                   "Serialization.NUMPY instead".format(pyarrow.__version__))
             self._serialize = self._pyarrow_serialize
             self._deserialize = self._pyarrow_deserialize
+        elif serialization == Serialization.NUMPY:
+            # Compression is done per buffer by the serialization itself
+            self._serialize = partial(self._numpy_serialize, compress=use_compression)
+            self._deserialize = self._numpy_deserialize
 
         if use_multiprocess_deserialization:
             self._deserialize_list = self._multiprocess_deserialize_list
         else:
             self._deserialize_list = self._singleprocess_deserialize_list
 
-        self.use_compression = use_compression
+        # Whether whole serialized payloads are compressed
+        self.use_compression = use_compression and serialization != Serialization.NUMPY
+        self.deserialization_pool_type = deserialization_pool_type
+        self.n_deserialization_workers = n_deserialization_workers
 
         self.config = dict(
             server_host=server_host,
             redis_port=redis_port,
+            unix_socket_path=self.unix_socket_path,
             serialization=str(serialization),
             use_multiprocess_deserialization=use_multiprocess_deserialization,
-            use_compression=use_compression)
+            use_compression=use_compression,
+            part_size_bytes=self.part_size_bytes)
+
+        self.page_size = page_size
+
+        self.pipeline_max_commands = pipeline_max_commands
+        self.pipeline_max_bytes = pipeline_max_bytes
+        self.pipeline_flush_seconds = pipeline_flush_seconds
+        self.pipeline = None
+        self._flush_thread = None
+        if pipeline_max_commands is not None or pipeline_max_bytes is not None or pipeline_flush_seconds is not None:
+            self.pipeline = self.rj.pipeline(transaction=False)
+            self._n_pipelined_commands = 0
+            self._n_pipelined_bytes = 0
+            self._pipeline_lock = threading.Lock()
+            if pipeline_flush_seconds is not None:
+                self._start_flush_thread()
+        _clients.add(self)
 
     def set(self, key, value):
-        serialized_obj = self._compress(self._serialize(value))
-        self.rj.set(key, serialized_obj)
+        self._write('set', key, value)
 
     def get(self, key):
-        val = self.rj.get(key)
+        self.flush()
+        val = self._join_parts(self.rj.get(key))
         if val is not None:
             return self._deserialize(self._decompress(val))
 
     def append(self, key, obj):
-        serialized_obj = self._compress(self._serialize(obj))
-        self.rj.rpush(key, serialized_obj)
+        self._write('rpush', key, obj)
+
+    def flush(self):
+        """
+        Send all pending pipelined writes to the server
+        :return:
+        """
+        if self.pipeline is None:
+            return
+        with self._pipeline_lock:
+            if self._n_pipelined_commands > 0:
+                self.pipeline.execute()
+            self._n_pipelined_commands = 0
+            self._n_pipelined_bytes = 0
+
+    def close(self):
+        if self._flush_thread is not None:
+            self._stop_flush_thread.set()
+            self._flush_thread.join()
+            self._flush_thread = None
+        self.flush()
+        self._close_pool()
+        if self._part_executor is not None:
+            self._part_executor.shutdown()
+            self._part_executor = None
+
+    def _write(self, command, key, obj):
+        stats = self.stats
+        if stats is not None and stats.sample():
+            self._timed_write(stats, command, key, obj)
+            return
+        self._send(command, key, self._compress(self._serialize(obj)))
+
+    def _timed_write(self, stats, command, key, obj):
+        """
+        :meth:`._write`, reporting the time spent serializing, compressing and sending to the server (or adding to the
+        pipeline) and the sizes before and after compression. With `Serialization.NUMPY`, buffers are compressed during
+        serialization, so all of that counts as 'serialize'.
+        """
+        start = time.perf_counter()
+        serialized_obj = self._serialize(obj)
+        serialized = time.perf_counter()
+        compressed_obj = self._compress(serialized_obj)
+        compressed = time.perf_counter()
+        self._send(command, key, compressed_obj)
+        sent = time.perf_counter()
+        stats.add_phase('serialize', serialized - start)
+        stats.add_phase('compress', compressed - serialized)
+        stats.add_phase('io', sent - compressed)
+        stats.add_bytes(len(serialized_obj), len(compressed_obj))
+
+    def _send(self, command, key, serialized_obj):
+        if self.part_size_bytes is None or (command != 'set' and len(serialized_obj) <= self.part_size_bytes):
+            commands = [(command, key, serialized_obj)]
+        else:
+            commands = self._split_parts(command, key, serialized_obj)
+
+        if self.pipeline is not None:
+            for args in commands:
+                self._pipelined(*args)
+        elif len(commands) == 1:
+            command, *args = commands[0]
+            getattr(self.rj, command)(*args)
+        else:
+            pipeline = self.rj.pipeline(transaction=False)
+            for part_command, *args in commands:
+                getattr(pipeline, part_command)(*args)
+            pipeline.execute()
+
+    def _split_parts(self, command, key, serialized_obj):
+        """
+        The commands that store `serialized_obj` in parts of at most `part_size_bytes`, followed by the command that
+        stores the manifest of the parts under `key`. The parts are sent as views of `serialized_obj`, without copying.
+        A `set` of a value that fits in one part is a single command, which also deletes the parts of the previous
+        value of `key` if there are any.
+        :return: List of `(command, *args)` tuples
+        """
+        commands = []
+        if command == 'set':
+            parts_key = '{}/__parts__'.format(key)
+            if len(serialized_obj) <= self.part_size_bytes:
+                # The parts of the previous value of the key are removed only if there are any
+                return [('eval', SET_DELETING_PARTS_SCRIPT, 2, key, parts_key, PART_MANIFEST_MAGIC, serialized_obj)]
+            # Remove the parts of the previous value of the key
+            commands.append(('delete', parts_key))
+        else:
+            parts_key = '{}/__parts__/{}'.format(key, uuid.uuid4().hex)
+
+        view = memoryview(serialized_obj)
+        n_parts = 0
+        for offset in range(0, len(view), self.part_size_bytes):
+            commands.append(('hset', parts_key, n_parts, view[offset:offset + self.part_size_bytes]))
+            n_parts += 1
+        manifest = dict(parts_key=parts_key, n_parts=n_parts, part_size_bytes=self.part_size_bytes,
+                        nbytes=len(serialized_obj))
+        commands.append((command, key, PART_MANIFEST_MAGIC + json.dumps(manifest).encode('utf-8')))
+        return commands
+
+    def _join_parts(self, val):
+        """
+        If `val` is the manifest of a value stored in parts, fetch all parts (in parallel) into one buffer and return
+        it. Otherwise return `val` as it is.
+        """
+        if val is None or not val.startswith(PART_MANIFEST_MAGIC):
+            return val
+        manifest = json.loads(val[len(PART_MANIFEST_MAGIC):].decode('utf-8'))
+        parts_key, part_size_bytes = manifest['parts_key'], manifest['part_size_bytes']
+        buffer = bytearray(manifest['nbytes'])
+        view = memoryview(buffer)
+
+        def fetch(i):
+            part = self.rj.hget(parts_key, i)
+            if part is None:
+                raise RuntimeError("Part {} of {} is missing".format(i, parts_key))
+            view[i * part_size_bytes:i * part_size_bytes + len(part)] = part
+
+        if self._part_executor is None:
+            self._part_executor = ThreadPoolExecutor(max_workers=self.n_part_fetch_threads,
+                                                     thread_name_prefix='simrecorder-redis-parts')
+        # Every thread uses its own connection from the pool of the client
+        list(self._part_executor.map(fetch, range(manifest['n_parts'])))
+        return buffer
+
+    def _pipelined(self, command, *args):
+        with self._pipeline_lock:
+            getattr(self.pipeline, command)(*args)
+            self._n_pipelined_commands += 1
+            if not isinstance(args[-1], str):
+                self._n_pipelined_bytes += len(args[-1])
+            if (self.pipeline_max_commands is not None and self._n_pipelined_commands >= self.pipeline_max_commands) or \
+                    (self.pipeline_max_bytes is not None and self._n_pipelined_bytes >= self.pipeline_max_bytes):
+                self.pipeline.execute()
+                self._n_pipelined_commands = 0
+                self._n_pipelined_bytes = 0
+
+    def _start_flush_thread(self):
+        self._stop_flush_thread = threading.Event()
+        self._flush_thread = threading.Thread(
+            target=self._flush_periodically, name='simrecorder-redis-flush', daemon=True)
+        self._flush_thread.start()
+
+    def _reset_after_fork(self):
+        """
+        Called in the child process after a fork. The connections, threads and worker pools of the parent can't be
+        used in the child, so they are replaced (threads and pools are started again when needed).
+        """
+        import redis
+        self.rj = redis.StrictRedis(
+            connection_pool=get_connection_pool(self.server_host, self.redis_port, self.unix_socket_path))
+        self._part_executor = None
+        self._pool = None
+        if self.pipeline is not None:
+            # Pending writes are sent by the parent
+            self.pipeline = self.rj.pipeline(transaction=False)
+            self._n_pipelined_commands = 0
+            self._n_pipelined_bytes = 0
+            self._pipeline_lock = threading.Lock()
+            if self._flush_thread is not None:
+                self._start_flush_thread()
+
+    def _flush_periodically(self):
+        while not self._stop_flush_thread.wait(self.pipeline_flush_seconds):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Sending pipelined writes to the redis server failed')
 
     def get_all(self, key):
+        """
+        Returns a lazy :class:`.RedisList` view of the list stored under key (or None if there is no list under key).
+        Nothing is fetched from the server until the view is indexed or iterated over.
+        """
+        self.flush()
         if self.rj.type(key) == b'list':
-            results = self.rj.lrange(key, 0, -1)
-            return self._deserialize_list(results)
+            return RedisList(self, key, page_size=self.page_size)
 
     def _get_config(self):
         """
@@ -98,6 +408,93 @@ class RedisDataStore(DataStore, SerializationMixin):
         return dict(client=client_config_dict, server=server_config_dict)
 
 
+class RedisList(RecordSequence):
+    """
+    A lazy, read-only view of a list stored in redis under `key`, as returned by :meth:`RedisDataStore.get_all`.
+    The view always reflects the current contents of the list on the server.
+
+    * ``len(l)`` is a single LLEN call
+    * ``l[i]`` fetches and decodes only element `i`
+    * ``l[start:stop]`` fetches and decodes only the elements in the slice, using LRANGE windows of `page_size`
+      elements
+    * Iterating over the view fetches one page at a time, and the next page is fetched while the current one is being
+      decoded. So at most two pages are held in memory at once.
+    * ``np.array(l)`` (or :meth:`.to_numpy`) decodes page by page into one preallocated array
+
+    :param datastore: The :class:`.RedisDataStore` the list belongs to
+    :param key: The key of the list
+    :param page_size: Number of elements fetched per LRANGE call
+    """
+
+    def __init__(self, datastore, key, page_size=100):
+        assert page_size > 0, "page_size must be positive"
+        self.datastore = datastore
+        self.key = key
+        self.page_size = page_size
+
+    @property
+    def block_size(self):
+        return self.page_size
+
+    def __len__(self):
+        self.datastore.flush()
+        return self.datastore.rj.llen(self.key)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return list(self.iter_pages(start, stop, step))
+        return super().__getitem__(index)
+
+    def _read(self, start, stop):
+        return [obj for page in self.iter_pages(start, stop) for obj in page]
+
+    def _get(self, index):
+        val = self.datastore._join_parts(self.datastore.rj.lindex(self.key, index))
+        return self.datastore._deserialize(self.datastore._decompress(val))
+
+    def iter_blocks(self, block_size=None, start=0, stop=None):
+        if block_size is not None and block_size != self.page_size:
+            return RedisList(self.datastore, self.key, block_size).iter_pages(start, stop)
+        return self.iter_pages(start, stop)
+
+    def iter_pages(self, start=0, stop=None, step=1):
+        """
+        Iterate over pages (lists of decoded elements) of the list in the range [start, stop). The next page is
+        fetched on a background thread while the current one is being decoded.
+        :param start: First index
+        :param stop: Index after the last one. None for the end of the list
+        :param step: Only every `step`-th element is returned (if not 1, the elements are returned one by one rather
+            than as pages)
+        :return: Generator of lists
+        """
+        if stop is None:
+            stop = len(self)
+        if start >= stop:
+            return
+        # Fetch a whole number of steps per page
+        page_size = max(step, self.page_size - self.page_size % step)
+        page_starts = range(start, stop, page_size)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(self._fetch, page_starts[0], min(page_starts[0] + page_size, stop))
+            for i, page_start in enumerate(page_starts):
+                results = future.result()
+                if i + 1 < len(page_starts):
+                    next_start = page_starts[i + 1]
+                    future = executor.submit(self._fetch, next_start, min(next_start + page_size, stop))
+                if step != 1:
+                    results = results[::step]
+                    yield from self.datastore._deserialize_list(results)
+                else:
+                    yield self.datastore._deserialize_list(results)
+                del results
+
+    def _fetch(self, start, stop):
+        self.datastore.flush()
+        return [self.datastore._join_parts(val) for val in self.datastore.rj.lrange(self.key, start, stop - 1)]
+
+
 class RedisServer:
     """
     This is a Redis server instance that starts a redis server with a particular
@@ -111,16 +508,29 @@ class RedisServer:
         server. If None, uses the default config file installed by the redis-
         installer package. Note that daemonize must be set to true for any config
         file that you may want to use.
+    :param unix_socket_path: If given, the server also listens on a unix socket at this
+        path, which :class:`RedisDataStore` clients on the same host use instead of TCP.
+        The server is then started directly with the `redis-server` executable, with
+        `config_file_path` if given. The port, directory, unix socket and daemonize
+        options of the config file are overridden
+    :param redis_server_executable: Path of the `redis-server` executable used with
+        `unix_socket_path`. If None, `redis-server` is looked up in the PATH
 
     :param serialization: The serialization type used by :class:`RedisDataStore`
-        instances to store data.
+        instances to store data. :attr:`Serialization.NUMPY` stores numpy arrays as raw
+        buffers (pickle protocol 5 with out-of-band buffers) that are read back without
+        copying, and compresses each buffer separately. Arrays read back this way are
+        read-only. :attr:`Serialization.PYARROW` requires pyarrow < 2.0.
     :param use_multiprocess_deserialization: Whether the :class:`RedisDataStore`
         clients use multiprocessing to deserialize data from the database
     :param use_compression: `bool` value, whether the :class:`RedisDataStore`
         clients use compression when storing and retrieving data
+    :param part_size_bytes: (Serialized and compressed) values larger than this are
+        stored by the :class:`RedisDataStore` clients in parts of this size, which are
+        fetched in parallel when reading. None stores every value in one piece
 
     The parameters `serialization` `use_multiprocess_deserialization`
-    `use_compression` are configuration options that affect the way the class
+    `use_compression` `part_size_bytes` are configuration options that affect the way the class
     :class:`.RedisDataStore` handles the data. These options are termed as the
     client configuration options. They are specified when creating the server as
     this is the only way they can be recorded and enforced consistently across
@@ -135,7 +545,10 @@ class RedisServer:
     def __init__(self, data_directory, redis_port=REDIS_PORT, config_file_path=None,
                  serialization=Serialization.PICKLE,
                  use_multiprocess_deserialization=False,
-                 use_compression=True):
+                 use_compression=True,
+                 part_size_bytes=DEFAULT_PART_SIZE_BYTES,
+                 unix_socket_path=None,
+                 redis_server_executable=None):
         """
         """
         assert isinstance(redis_port, Integral) or \
@@ -147,48 +560,110 @@ class RedisServer:
 
         self.data_directory = data_directory
         self.config_file_path = config_file_path
+        self.unix_socket_path = unix_socket_path
+        self.redis_server_executable = redis_server_executable
         self._redis_port_arg = redis_port
         self._redis_port_value = None  # only assigned once the server is started
         self._rj = None
+        self._process = None
 
         self.server_config = dict(
             data_directory=data_directory,
-            config_file_path=config_file_path)
+            config_file_path=config_file_path,
+            unix_socket_path=unix_socket_path)
 
         self.client_config = dict(
             serialization=serialization.name,
             use_multiprocess_deserialization=use_multiprocess_deserialization,
-            use_compression=use_compression)
+            use_compression=use_compression,
+            part_size_bytes=part_size_bytes)
 
     def start(self):
         """
         Start the redis server
         """
         import redis
-        from rediscontroller import is_redis_running, start_redis
-        if not isinstance(self._redis_port_arg, str):
-            if is_redis_running(redis_port=self._redis_port_arg):
-                raise RuntimeError(
-                    "Redis is already running at port {} (maybe from a previous experiment?). Did "
-                    "you forget to change the port?".format(self._redis_port_arg))
+        if self.unix_socket_path is not None:
+            self._start_with_unix_socket()
+        else:
+            from rediscontroller import is_redis_running, start_redis
+            if not isinstance(self._redis_port_arg, str):
+                if is_redis_running(redis_port=self._redis_port_arg):
+                    raise RuntimeError(
+                        "Redis is already running at port {} (maybe from a previous experiment?). Did "
+                        "you forget to change the port?".format(self._redis_port_arg))
 
-        self._redis_port_value = start_redis(data_directory=self.data_directory, redis_port=self._redis_port_arg)
-        self._rj = redis.StrictRedis(host='localhost', port=self._redis_port_value)  # , decode_responses=True)
+            self._redis_port_value = start_redis(data_directory=self.data_directory, redis_port=self._redis_port_arg)
+        self._rj = redis.StrictRedis(
+            connection_pool=get_connection_pool('localhost', self._redis_port_value, self.unix_socket_path))
 
         existing_client_config = self._rj.get('client_config')
         if existing_client_config is None:
             self._rj.set('client_config', json.dumps(self.client_config))
-            self._rj.set('server_config', json.dumps(self.server_config))
         else:
-            logger.warn('Found existing database in directory %s, ignoring specified'
-                        ' client and server configuration', self.data_directory)
+            logger.warning('Found existing database in directory %s, ignoring specified'
+                           ' client configuration', self.data_directory)
+        # Describes how to reach the server that is running now
+        self._rj.set('server_config', json.dumps(self.server_config))
+
+    def _start_with_unix_socket(self):
+        import redis
+        import shutil
+        import socket
+        import subprocess
+
+        executable = self.redis_server_executable or shutil.which('redis-server')
+        if executable is None:
+            raise RuntimeError("Cannot find the redis-server executable to start a server with a unix socket. Pass "
+                               "its path as redis_server_executable")
+        redis_port = self._redis_port_arg
+        if redis_port == 'random':
+            with socket.socket() as sock:
+                sock.bind(('localhost', 0))
+                redis_port = sock.getsockname()[1]
+        else:
+            try:
+                redis.StrictRedis(port=redis_port).ping()
+            except redis.ConnectionError:
+                pass
+            else:
+                raise RuntimeError(
+                    "Redis is already running at port {} (maybe from a previous experiment?). Did "
+                    "you forget to change the port?".format(redis_port))
+
+        # Options on the command line override the ones in the config file. The server is stopped through its
+        # process, so it must not daemonize
+        config_file_args = [self.config_file_path] if self.config_file_path is not None else []
+        self._process = subprocess.Popen(
+            [executable, *config_file_args, '--port', str(redis_port), '--dir', self.data_directory,
+             '--unixsocket', self.unix_socket_path, '--unixsocketperm', '700', '--daemonize', 'no'],
+            stdout=subprocess.DEVNULL)
+        rj = redis.StrictRedis(unix_socket_path=self.unix_socket_path)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                rj.ping()
+                break
+            except redis.ConnectionError:
+                if self._process.poll() is not None or time.monotonic() > deadline:
+                    self._process.kill()
+                    self._process = None
+                    raise RuntimeError("Could not start redis-server with unix socket {}".format(self.unix_socket_path))
+                time.sleep(0.05)
+        rj.connection_pool.disconnect()
+        self._redis_port_value = redis_port
 
     def stop(self):
         """
         Stop the redis server
         """
-        from rediscontroller import stop_redis
-        stop_redis(redis_host='localhost', redis_port=self._redis_port_value)
+        if self._process is not None:
+            self._rj.shutdown(save=True)
+            self._process.wait()
+            self._process = None
+        else:
+            from rediscontroller import stop_redis
+            stop_redis(redis_host='localhost', redis_port=self._redis_port_value)
         self._redis_port_value = None
         self._rj = None
 
@@ -0,0 +1,324 @@
+"""
+Streaming reducers, which keep running statistics of the records of a key instead of the records themselves, and the
+:class:`ReducerDataStore` that applies them.
+
+All reducers work element-wise on records of a fixed shape (numbers or numeric numpy arrays), with vectorized numpy
+operations, and accumulate in float64.
+"""
+import copy
+import fnmatch
+
+import numpy as np
+
+from simrecorder.datastore import DataStore
+
+
+class Reducer:
+    """
+    Interface for streaming reducers. A reducer is updated with every record of a key, and :meth:`.result` returns its
+    statistics so far.
+
+    :param name: Name under which the statistics of the reducer are stored
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def update(self, x):
+        """
+        Update the statistics with one record
+        :param x: float64 numpy array (0-d for numbers)
+        """
+        raise NotImplementedError
+
+    def update_batch(self, xs):
+        """
+        Update the statistics with several records at once
+        :param xs: float64 numpy array with one record per row
+        """
+        for x in xs:
+            self.update(x)
+
+    def result(self):
+        """
+        :return: Dictionary of the statistics (numpy arrays or numbers) by name. Empty if there were no records
+        """
+        raise NotImplementedError
+
+
+class MeanVariance(Reducer):
+    """
+    Element-wise mean and variance with Welford's algorithm (batches are merged with Chan's parallel algorithm), which
+    stays accurate over long runs, unlike summing values and squares.
+
+    :param ddof: Delta degrees of freedom of the variance (0 for the population variance, 1 for the sample variance)
+    :param name:
+    """
+
+    def __init__(self, ddof=0, name='moments'):
+        super().__init__(name)
+        self.ddof = ddof
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+    def update(self, x):
+        if self.mean is None:
+            self.count = 1
+            self.mean = x.copy()
+            self.m2 = np.zeros_like(x)
+            return
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def update_batch(self, xs):
+        if len(xs) == 0:
+            return
+        n = len(xs)
+        batch_mean = xs.mean(axis=0)
+        batch_m2 = ((xs - batch_mean) ** 2).sum(axis=0)
+        if self.mean is None:
+            self.count, self.mean, self.m2 = n, batch_mean, batch_m2
+            return
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * (n / total)
+        self.m2 = self.m2 + batch_m2 + delta ** 2 * (self.count * n / total)
+        self.count = total
+
+    def result(self):
+        if self.mean is None:
+            return {}
+        var = self.m2 / max(self.count - self.ddof, 1)
+        return dict(count=self.count, mean=self.mean, var=var, std=np.sqrt(var))
+
+
+class MinMax(Reducer):
+    """
+    Element-wise minimum and maximum
+    """
+
+    def __init__(self, name='extrema'):
+        super().__init__(name)
+        self.min = None
+        self.max = None
+
+    def update(self, x):
+        if self.min is None:
+            self.min, self.max = x.copy(), x.copy()
+        else:
+            np.minimum(self.min, x, out=self.min)
+            np.maximum(self.max, x, out=self.max)
+
+    def update_batch(self, xs):
+        if len(xs) > 0:
+            self.update(xs.min(axis=0))
+            np.maximum(self.max, xs.max(axis=0), out=self.max)
+
+    def result(self):
+        if self.min is None:
+            return {}
+        return dict(min=self.min, max=self.max)
+
+
+class Histogram(Reducer):
+    """
+    Histogram of all elements of all records, with fixed bins. Values outside of `range` are counted in `underflow` and
+    `overflow`, NaNs are not counted.
+
+    :param bins: Number of bins
+    :param range: `(low, high)` of the bins
+    :param name:
+    """
+
+    def __init__(self, bins, range, name='histogram'):
+        super().__init__(name)
+        assert range[0] < range[1], "range must be (low, high)"
+        self.bin_edges = np.linspace(range[0], range[1], bins + 1)
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+        self.n_records = 0
+
+    def update(self, x):
+        self.update_batch(x[np.newaxis])
+
+    def update_batch(self, xs):
+        self.n_records += len(xs)
+        counts, _ = np.histogram(xs, bins=self.bin_edges)
+        self.counts += counts
+        self.underflow += int(np.count_nonzero(xs < self.bin_edges[0]))
+        self.overflow += int(np.count_nonzero(xs > self.bin_edges[-1]))
+
+    def result(self):
+        if self.n_records == 0:
+            return {}
+        return dict(counts=self.counts, bin_edges=self.bin_edges, underflow=self.underflow, overflow=self.overflow)
+
+
+class ExponentialMovingAverage(Reducer):
+    """
+    Element-wise exponential moving average `ema = alpha * x + (1 - alpha) * ema`, starting at the first record.
+
+    :param alpha: Weight of the newest record, in (0, 1]
+    :param name:
+    """
+
+    def __init__(self, alpha, name='ema'):
+        super().__init__(name)
+        assert 0 < alpha <= 1, "alpha must be in (0, 1]"
+        self.alpha = alpha
+        self.ema = None
+
+    def update(self, x):
+        if self.ema is None:
+            self.ema = x.copy()
+        else:
+            self.ema *= 1 - self.alpha
+            self.ema += self.alpha * x
+
+    def update_batch(self, xs):
+        if len(xs) == 0:
+            return
+        if self.ema is None:
+            self.ema = xs[0].copy()
+            xs = xs[1:]
+        # Closed form of len(xs) updates: the weight of the i-th record decays with the number of records after it
+        n = len(xs)
+        weights = self.alpha * (1 - self.alpha) ** np.arange(n - 1, -1, -1)
+        self.ema = (1 - self.alpha) ** n * self.ema + np.tensordot(weights, xs, axes=1)
+
+    def result(self):
+        if self.ema is None:
+            return {}
+        return dict(ema=self.ema)
+
+
+def _as_reducible(obj):
+    """
+    `obj` as a float64 array if it is a number or numeric numpy array, else None
+    """
+    if isinstance(obj, (int, float, np.number, np.bool_)):
+        return np.asarray(obj, dtype=np.float64)
+    if isinstance(obj, np.ndarray) and obj.dtype.kind in 'biuf':
+        return obj.astype(np.float64)
+    return None
+
+
+class ReducerDataStore(DataStore):
+    """
+    Datastore that keeps streaming statistics of the records of every key (see :class:`MeanVariance`,
+    :class:`MinMax`, :class:`Histogram` and :class:`ExponentialMovingAverage`), which are updated when a record is
+    appended, and written to a backing datastore on :meth:`.flush` and :meth:`.close`. The records themselves are only
+    stored if `store_raw` is True.
+
+    The statistics of key `key` are stored with :meth:`.DataStore.set` under `<prefix>/<key>/<reducer name>/<name>`,
+    e.g. ``reduced/train/loss/moments/mean``. Records that can't be reduced (anything but numbers and numeric arrays,
+    or records whose shape differs from the first record of the key) and records of keys without reducers are always
+    stored in the backing datastore. Values stored with :meth:`.set` go to the backing datastore right away.
+
+    :param datastore: The backing datastore
+    :param reducers: Dictionary from key (or `fnmatch` pattern, e.g. ``'train/*'``) to the list of reducers for the
+        matching keys. Every key gets its own copy of the reducers. The first matching pattern is used
+    :param default_reducers: Reducers for keys that match none of `reducers`
+    :param store_raw: If True, records are also stored in the backing datastore
+    :param prefix: Prefix of the keys of the statistics in the backing datastore
+    """
+
+    def __init__(self, datastore, reducers=None, default_reducers=(MeanVariance(), MinMax()), store_raw=False,
+                 prefix='reduced'):
+        self.datastore = datastore
+        self.reducers = dict(reducers or {})
+        self.default_reducers = list(default_reducers)
+        self.store_raw = store_raw
+        self.prefix = prefix
+        # Reducers and the shape of the records, by key
+        self.key_reducers = {}
+        self.key_shapes = {}
+
+    def connect(self):
+        self.datastore.connect()
+        return self
+
+    def set(self, key, value):
+        self.datastore.set(key, value)
+
+    def get(self, key):
+        return self.datastore.get(key)
+
+    def append(self, key, obj):
+        x = _as_reducible(obj)
+        reducers = self._reducers(key, x)
+        if reducers:
+            for reducer in reducers:
+                reducer.update(x)
+        if self.store_raw or not reducers:
+            self.datastore.append(key, obj)
+
+    def extend(self, key, objs):
+        """
+        Update the reducers of `key` with all records at once. For a numeric numpy array with one record per row, the
+        reducers are updated without iterating over the records
+        """
+        if isinstance(objs, np.ndarray) and objs.dtype.kind in 'biuf' and objs.ndim > 0 and len(objs) > 0:
+            xs = objs.astype(np.float64)
+            reducers = self._reducers(key, xs[0])
+            if reducers:
+                for reducer in reducers:
+                    reducer.update_batch(xs)
+            if self.store_raw or not reducers:
+                self.datastore.extend(key, objs)
+        else:
+            super().extend(key, objs)
+
+    def _reducers(self, key, x):
+        """
+        The reducers of `key`, created when `x` is its first record. None if `x` can't be reduced with them
+        """
+        if x is None:
+            return None
+        reducers = self.key_reducers.get(key)
+        if reducers is None:
+            templates = self.default_reducers
+            for pattern, pattern_reducers in self.reducers.items():
+                if key == pattern or fnmatch.fnmatchcase(key, pattern):
+                    templates = pattern_reducers
+                    break
+            reducers = self.key_reducers[key] = [copy.deepcopy(reducer) for reducer in templates]
+            self.key_shapes[key] = x.shape
+        elif x.shape != self.key_shapes[key]:
+            return None
+        return reducers
+
+    def results(self, key):
+        """
+        :return: The statistics of `key` so far, as a dictionary from reducer name to the dictionary of statistics
+        """
+        return {reducer.name: reducer.result() for reducer in self.key_reducers.get(key, [])}
+
+    def get_all(self, key):
+        """
+        Returns the records stored in the backing datastore (only those that were not reduced, unless `store_raw` is
+        True). Use :meth:`.results` for the statistics
+        """
+        return self.datastore.get_all(key)
+
+    def write_results(self):
+        """
+        Store the statistics of all keys in the backing datastore, overwriting the ones stored before
+        :return:
+        """
+        for key in self.key_reducers:
+            for reducer_name, result in self.results(key).items():
+                for name, value in result.items():
+                    self.datastore.set('/'.join([self.prefix, key, reducer_name, name]), value)
+
+    def flush(self):
+        self.write_results()
+        self.datastore.flush()
+
+    def close(self):
+        self.write_results()
+        self.datastore.close()
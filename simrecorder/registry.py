@@ -0,0 +1,93 @@
+"""
+Registry of datastore classes by name. Datastores are registered as ``'module:ClassName'`` strings and only imported
+when they are looked up, so that registering a datastore costs nothing at import time.
+
+Third-party packages can register their datastores without simrecorder importing them by declaring an entry point in
+the ``simrecorder.datastores`` group, e.g. in their ``setup.py``::
+
+    setup(
+        ...
+        entry_points={'simrecorder.datastores': ['mystore = mypackage.mystore:MyDataStore']},
+    )
+
+after which ``create_datastore('mystore', ...)`` creates a ``MyDataStore``.
+"""
+import importlib
+
+ENTRY_POINT_GROUP = 'simrecorder.datastores'
+
+_datastores = {
+    'inmemory': 'simrecorder.datastore:InMemoryDataStore',
+    'hdf5': 'simrecorder.hdf_datastore:HDF5DataStore',
+    'zarr': 'simrecorder.zarr_datastore:ZarrDataStore',
+    'redis': 'simrecorder.redis_datastore:RedisDataStore',
+    'memmap': 'simrecorder.memmap_datastore:MemmapDataStore',
+    'tiered': 'simrecorder.tiered_datastore:TieredDataStore',
+    'reducer': 'simrecorder.reducers:ReducerDataStore',
+}
+_entry_points_loaded = False
+
+
+def register_datastore(name, datastore):
+    """
+    Register a datastore under `name`, replacing any datastore registered under the same name.
+    :param name: Name of the datastore
+    :param datastore: The datastore class (or any other callable returning a datastore), or a ``'module:attribute'``
+        string, which is imported on first use
+    :return:
+    """
+    _datastores[name] = datastore
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    from importlib.metadata import entry_points
+
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group=ENTRY_POINT_GROUP)
+    else:
+        eps = eps.get(ENTRY_POINT_GROUP, [])
+    for ep in eps:
+        # Datastores registered explicitly take precedence
+        _datastores.setdefault(ep.name, ep.value)
+
+
+def available_datastores():
+    """
+    :return: Sorted list of the names of all registered datastores, including those registered through entry points
+    """
+    _load_entry_points()
+    return sorted(_datastores)
+
+
+def get_datastore_class(name):
+    """
+    Look up the datastore registered under `name`, importing it if necessary
+    :param name:
+    :return: The datastore class
+    """
+    datastore = _datastores.get(name)
+    if datastore is None:
+        _load_entry_points()
+        datastore = _datastores.get(name)
+    if datastore is None:
+        raise KeyError("No datastore registered under the name {}. Available datastores: {}".format(
+            name, ', '.join(available_datastores())))
+    if isinstance(datastore, str):
+        module_name, _, attribute = datastore.partition(':')
+        datastore = getattr(importlib.import_module(module_name), attribute)
+        _datastores[name] = datastore
+    return datastore
+
+
+def create_datastore(name, *args, **kwargs):
+    """
+    Create a datastore of the type registered under `name`. The remaining arguments are passed to its constructor.
+    :param name:
+    :return: The datastore
+    """
+    return get_datastore_class(name)(*args, **kwargs)
@@ -0,0 +1,364 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from numbers import Integral
+
+import numpy as np
+
+from simrecorder.append_buffer import split_packed
+
+# Number of records per block for sequences that have no natural block (chunk) size
+DEFAULT_BLOCK_SIZE = 1024
+
+
+class RecordSequence:
+    """
+    Lazy, read-only sequence of the records stored under a key, as returned by `get_all` of every datastore. Records
+    are only read from the storage when they are accessed, so analysis code can work with just the part it needs.
+
+    * ``len(seq)`` is the number of records
+    * ``seq[i]`` reads record `i` (negative indices count from the end)
+    * ``seq[start:stop:step]`` reads only the records in the slice, and ``seq[...]`` reads all records
+    * ``seq[[i, j, ...]]`` (a list or numpy array of indices, or a boolean mask) reads the records at these indices
+    * ``iter(seq)`` iterates over records, reading a block at a time, and :meth:`.iter_blocks` iterates over the blocks
+    * :meth:`.to_numpy` (and ``np.array(seq)``) reads everything into one numpy array, optionally a preallocated one
+
+    Subclasses implement :meth:`.__len__` and :meth:`._read`, and may override the other methods with more efficient
+    versions.
+    """
+
+    #: Number of records read at once when iterating. Subclasses set this to the chunk size of the storage
+    block_size = DEFAULT_BLOCK_SIZE
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def _read(self, start, stop):
+        """
+        Read the records in [start, stop), with 0 <= start <= stop <= len(self)
+        :return: A numpy array (for sequences of arrays) or a list of records
+        """
+        raise NotImplementedError
+
+    def _get(self, index):
+        """
+        Read the record at `index`, with 0 <= index < len(self)
+        """
+        return self._read(index, index + 1)[0]
+
+    def _take(self, indices):
+        """
+        Read the records at `indices`, a 1-D numpy array of indices with 0 <= index < len(self) (in any order, possibly
+        repeated)
+        """
+        return [self._get(i) for i in indices]
+
+    def _indices(self, index):
+        """
+        `index` (a list or numpy array of indices, or a boolean mask) as a 1-D numpy array of indices in
+        [0, len(self))
+        """
+        n = len(self)
+        index = np.asarray(index)
+        if index.dtype == np.bool_:
+            if index.shape != (n, ):
+                raise IndexError("Boolean index of shape {} for sequence of length {}".format(index.shape, n))
+            return np.flatnonzero(index)
+        if index.size == 0:
+            return np.empty((0, ), dtype=np.intp)
+        if index.ndim != 1 or index.dtype.kind not in 'iu':
+            raise TypeError("Index arrays must be 1-D arrays of integers, not {} arrays of {}".format(
+                index.shape, index.dtype))
+        indices = np.where(index < 0, index + n, index)
+        if not ((0 <= indices) & (indices < n)).all():
+            raise IndexError("Index {} out of range for sequence of length {}".format(
+                index[(indices < 0) | (indices >= n)][0], n))
+        return indices
+
+    def __getitem__(self, index):
+        if index is Ellipsis:
+            index = slice(None)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return self._read(start, max(start, stop))
+            return [self._get(i) for i in range(start, stop, step)]
+        if isinstance(index, (list, np.ndarray)):
+            return self._take(self._indices(index))
+        if not isinstance(index, Integral):
+            raise TypeError("Indices must be integers, slices, Ellipsis or lists or arrays of integers, not {}".format(
+                type(index).__name__))
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("Index {} out of range for sequence of length {}".format(index, n))
+        return self._get(index)
+
+    def __iter__(self):
+        for block in self.iter_blocks():
+            yield from block
+
+    def iter_blocks(self, block_size=None, start=0, stop=None):
+        """
+        Iterate over blocks of consecutive records in [start, stop).
+        :param block_size: Number of records per block. Defaults to :attr:`.block_size`, which is aligned with the
+            chunks of the storage where possible
+        :param start: Index of the first record
+        :param stop: Index after the last record. None for the end of the sequence
+        :return: Generator of blocks (numpy arrays or lists, like slices of the sequence)
+        """
+        block_size = block_size or self.block_size
+        if stop is None:
+            stop = len(self)
+        for block_start in range(start, stop, block_size):
+            yield self._read(block_start, min(block_start + block_size, stop))
+
+    def to_numpy(self, out=None):
+        """
+        Read all records into a numpy array of shape ``(len(seq), *record_shape)``, one block at a time.
+        :param out: Optional preallocated array to read into. Its first dimension must be ``len(seq)``
+        :return: `out`, or a new array
+        """
+        n = len(self)
+        i = 0
+        for block in self.iter_blocks(stop=n):
+            block = np.asarray(block)
+            if out is None:
+                out = np.empty((n, *block.shape[1:]), dtype=block.dtype)
+            out[i:i + len(block)] = block
+            i += len(block)
+        if out is None:
+            return np.empty((0, ))
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.to_numpy()
+        if dtype is not None:
+            array = array.astype(dtype, copy=False)
+        return array
+
+    def __repr__(self):
+        return '<{} of {} records>'.format(type(self).__name__, len(self))
+
+
+class ArraySequence(RecordSequence):
+    """
+    Sequence of the records in an array whose first axis is the record axis (h5py Dataset, zarr Array or numpy array).
+    Slices are read as hyperslabs (h5py) or chunk reads (zarr), and indexing with tuples (e.g. ``seq[:, 0, 5]`` or
+    ``seq[..., 0]``) is passed on to the array, so only the selected part is read. Index arrays read every selected
+    record once, in increasing order (as h5py requires), and return the records in the order of the index.
+
+    :param array: The array
+    :param length: Number of valid records, if the array may be longer than that (e.g. while it is being appended to
+        with buffering). None to always use the length of the array
+    """
+
+    def __init__(self, array, length=None):
+        self.array = array
+        self.length = length
+        chunks = getattr(array, 'chunks', None)
+        if chunks:
+            self.block_size = chunks[0]
+
+    def __len__(self):
+        return self.array.shape[0] if self.length is None else self.length
+
+    @property
+    def shape(self):
+        return (len(self), *self.array.shape[1:])
+
+    @property
+    def dtype(self):
+        return self.array.dtype
+
+    @property
+    def ndim(self):
+        return len(self.array.shape)
+
+    @property
+    def chunks(self):
+        return getattr(self.array, 'chunks', None)
+
+    def _read(self, start, stop):
+        return np.asarray(self.array[start:stop])
+
+    def _get(self, index):
+        return self.array[index]
+
+    def _take(self, indices):
+        if len(indices) == 0:
+            return np.empty((0, *self.array.shape[1:]), dtype=self.dtype)
+        unique, inverse = np.unique(indices, return_inverse=True)
+        if hasattr(self.array, 'oindex'):
+            # zarr
+            records = self.array.oindex[unique]
+        else:
+            records = self.array[unique.tolist()]
+        return np.asarray(records)[inverse]
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            if len(index) > 0 and index[0] is Ellipsis:
+                # The record axis is part of the Ellipsis
+                index = (slice(None), *index)
+            if len(index) > 0 and isinstance(index[0], slice):
+                # Restrict the record axis to the valid records
+                index = (slice(*index[0].indices(len(self))), *index[1:])
+            return self.array[index]
+        if isinstance(index, slice) and index.step not in (None, 1):
+            return self.array[slice(*index.indices(len(self)))]
+        return super().__getitem__(index)
+
+    def to_numpy(self, out=None, n_threads=1):
+        """
+        Read all records into a numpy array. If the array is a numpy array (and `out` is None), it is returned as is,
+        without copying.
+        :param out: Optional preallocated array to read into. Its first dimension must be ``len(seq)``
+        :param n_threads: Number of threads used for reading. See :meth:`.read`
+        :return: `out`, or a new array
+        """
+        if out is None and isinstance(self.array, np.ndarray):
+            # Already in memory, so no copy is made
+            return self.array[:len(self)]
+        return self.read(out=out, n_threads=n_threads)
+
+    def read(self, start=0, stop=None, out=None, n_threads=None):
+        """
+        Read the records in [start, stop) into one numpy array, decoding chunks in parallel. The range is split into
+        pieces aligned with the chunks of the array along the record axis, and every piece is read and decoded
+        directly into its part of `out` on a pool of threads. The codecs of zarr (blosc, zlib, lzma, ...) release the
+        GIL, so this scales with the number of cores for compressed data.
+        :param start: Index of the first record
+        :param stop: Index after the last record. None for the end of the sequence
+        :param out: Optional preallocated array to read into, of shape ``(stop - start, *record_shape)``
+        :param n_threads: Number of threads. None for the number of CPUs
+        :return: `out`, or a new array
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        stop = max(start, stop)
+        if out is None:
+            out = np.empty((stop - start, *self.array.shape[1:]), dtype=self.dtype)
+        assert out.shape[0] == stop - start, \
+            "out has {} rows, but {} records are read".format(out.shape[0], stop - start)
+        if start == stop:
+            return out
+
+        rows = self.block_size
+        boundaries = list(range(start - start % rows + rows, stop, rows))
+        pieces = list(zip([start] + boundaries, boundaries + [stop]))
+        n_threads = min(n_threads or os.cpu_count() or 1, len(pieces))
+
+        def read_piece(piece):
+            self._read_into(out[piece[0] - start:piece[1] - start], *piece)
+
+        if n_threads <= 1:
+            for piece in pieces:
+                read_piece(piece)
+        else:
+            with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                # list() to raise exceptions from the workers
+                list(executor.map(read_piece, pieces))
+        return out
+
+    def _read_into(self, out, start, stop):
+        """
+        Read the records in [start, stop) into `out`. Called from several threads at once by :meth:`.read`
+        """
+        if hasattr(self.array, 'get_basic_selection'):
+            # zarr decodes directly into out
+            self.array.get_basic_selection(slice(start, stop), out=out)
+        else:
+            out[...] = self.array[start:stop]
+
+
+class ListSequence(RecordSequence):
+    """
+    Sequence view of a python list. Nothing is copied, and the view reflects later changes of the list.
+
+    :param records: The list
+    """
+
+    def __init__(self, records):
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    def _read(self, start, stop):
+        return self.records[start:stop]
+
+    def _get(self, index):
+        return self.records[index]
+
+    def __iter__(self):
+        return iter(self.records)
+
+
+class PackedSequence(RecordSequence):
+    """
+    Sequence of the records of a packed log (see :class:`simrecorder.append_buffer.PackedAppendBuffer`). Reading a
+    range of records reads the corresponding offsets and one contiguous range of `data`.
+
+    :param data: The data array (h5py Dataset, zarr Array or numpy array)
+    :param offsets: The offsets array
+    :param decode: Function called on the values of every record (a 1-D numpy array) to get the record. None to return
+        the values as they are
+    """
+
+    def __init__(self, data, offsets, decode=None):
+        self.data = data
+        self.offsets = offsets
+        self.decode = decode
+        chunks = getattr(offsets, 'chunks', None)
+        if chunks:
+            self.block_size = chunks[0]
+
+    def __len__(self):
+        return self.offsets.shape[0]
+
+    def _read(self, start, stop):
+        if start >= stop:
+            return []
+        first_offset = int(self.offsets[start - 1]) if start > 0 else 0
+        offsets = np.asarray(self.offsets[start:stop])
+        values = np.asarray(self.data[first_offset:int(offsets[-1])])
+        records = split_packed(values, offsets, first_offset)
+        if self.decode is not None:
+            records = [self.decode(r) for r in records]
+        return records
+
+
+class ConcatSequence(RecordSequence):
+    """
+    Sequence of the records of several sequences, one after the other. Slices spanning several sequences read only
+    the needed part of each.
+
+    :param sequences: The sequences. None entries (e.g. for keys missing in a datastore) are skipped
+    """
+
+    def __init__(self, sequences):
+        self.sequences = [s for s in sequences if s is not None]
+        if self.sequences:
+            self.block_size = self.sequences[0].block_size
+
+    def __len__(self):
+        return sum(len(s) for s in self.sequences)
+
+    def _read(self, start, stop):
+        pieces = []
+        offset = 0
+        for s in self.sequences:
+            n = len(s)
+            if start < offset + n and stop > offset:
+                pieces.append(s[max(start - offset, 0):min(stop - offset, n)])
+            offset += n
+        if pieces and all(isinstance(p, np.ndarray) for p in pieces):
+            return np.concatenate(pieces)
+        return [r for p in pieces for r in p]
+
+    def _get(self, index):
+        for s in self.sequences:
+            if index < len(s):
+                return s[index]
+            index -= len(s)
+        raise IndexError(index)
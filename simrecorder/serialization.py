@@ -1,21 +1,159 @@
+import os
 import pickle
+import struct
 from enum import Enum
-from multiprocessing.pool import Pool
+from functools import partial
+from multiprocessing.pool import Pool, ThreadPool
 
-try:
-    import lz4.frame
-    import pyarrow
-except ImportError:
-    pass
+import numpy as np
 
-Serialization = Enum('Serialization', ['PICKLE', 'PYARROW'])
+# lz4 and pyarrow are imported where they are used, since importing them (pyarrow in particular) takes long and they
+# are only needed by the redis datastore
+
+Serialization = Enum('Serialization', ['PICKLE', 'PYARROW', 'NUMPY'])
+PoolType = Enum('PoolType', ['PROCESS', 'THREAD'])
+
+## Frame format of the NUMPY serialization:
+## magic | uint32 number of segments | (uint8 compressed flag, uint64 length) per segment | segments
+## The first segment is a protocol 5 pickle, the rest are its out-of-band buffers. Every segment starts at an offset
+## aligned to _NUMPY_ALIGNMENT bytes.
+_NUMPY_MAGIC = b'SRNP'
+_NUMPY_SEGMENT = struct.Struct('<BQ')
+_NUMPY_ALIGNMENT = 64
+# Buffers smaller than this are never compressed
+_NUMPY_MIN_COMPRESS_BYTES = 1024
+
+
+def numpy_serialize(obj, compress=False):
+    """
+    Serialize `obj` with pickle protocol 5, keeping the data of all (contiguous) numpy arrays as raw out-of-band
+    buffers, instead of copying them into the pickle stream.
+    :param obj: Any picklable object
+    :param compress: Compress each buffer separately with lz4. Buffers that don't get smaller are stored uncompressed
+    :return: bytes
+    """
+    buffers = []
+    segments = [pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)]
+    segments.extend(b.raw() for b in buffers)
+
+    flags = []
+    if compress:
+        import lz4.frame
+        for i, segment in enumerate(segments):
+            if len(segment) >= _NUMPY_MIN_COMPRESS_BYTES:
+                compressed = lz4.frame.compress(segment)
+                if len(compressed) < len(segment):
+                    segments[i] = compressed
+                    flags.append(1)
+                    continue
+            flags.append(0)
+    else:
+        flags = [0] * len(segments)
+
+    header = [_NUMPY_MAGIC, struct.pack('<I', len(segments))]
+    header.extend(_NUMPY_SEGMENT.pack(flag, len(segment)) for flag, segment in zip(flags, segments))
+    parts = header
+    offset = sum(len(h) for h in header)
+    for segment in segments:
+        padding = -offset % _NUMPY_ALIGNMENT
+        parts.append(b'\0' * padding)
+        parts.append(segment)
+        offset += padding + len(segment)
+    return b''.join(parts)
+
+
+def numpy_deserialize(bstring):
+    """
+    Deserialize data serialized by :func:`.numpy_serialize`. Uncompressed numpy arrays are created directly on top of
+    the memory of `bstring` without copying, so they are read-only if `bstring` is immutable (e.g. `bytes`).
+    :param bstring: bytes-like object
+    :return: The deserialized object
+    """
+    view = memoryview(bstring)
+    if view[:len(_NUMPY_MAGIC)] != _NUMPY_MAGIC:
+        raise ValueError("Data was not serialized with the NUMPY serialization")
+    offset = len(_NUMPY_MAGIC)
+    n_segments, = struct.unpack_from('<I', view, offset)
+    offset += 4
+    headers = []
+    for _ in range(n_segments):
+        headers.append(_NUMPY_SEGMENT.unpack_from(view, offset))
+        offset += _NUMPY_SEGMENT.size
+
+    segments = []
+    for compressed, length in headers:
+        offset += -offset % _NUMPY_ALIGNMENT
+        segment = view[offset:offset + length]
+        if compressed:
+            import lz4.frame
+            segment = lz4.frame.decompress(segment)
+        segments.append(segment)
+        offset += length
+    return pickle.loads(segments[0], buffers=segments[1:])
+
+
+class _SharedArray:
+    """
+    Handle to a numpy array that a worker process has put in shared memory
+    """
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+    def load(self):
+        """
+        Copy the array out of shared memory into a regular numpy array, and free the shared memory.
+        """
+        from multiprocessing.shared_memory import SharedMemory
+        shm = SharedMemory(name=self.name)
+        try:
+            return np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+
+def _decode(bstring, deserialize, use_compression):
+    if use_compression:
+        import lz4.frame
+        bstring = lz4.frame.decompress(bstring)
+    return deserialize(bstring)
+
+
+def _decode_to_shared_memory(bstring, deserialize, use_compression):
+    """
+    Decompress and deserialize in a worker process. Numpy arrays are returned through shared memory instead of being
+    pickled back to the parent process.
+    """
+    obj = _decode(bstring, deserialize, use_compression)
+    if not isinstance(obj, np.ndarray) or obj.dtype.hasobject or obj.nbytes == 0:
+        return obj
+
+    from multiprocessing import resource_tracker
+    from multiprocessing.shared_memory import SharedMemory
+    shm = SharedMemory(create=True, size=obj.nbytes)
+    np.ndarray(obj.shape, dtype=obj.dtype, buffer=shm.buf)[...] = obj
+    # The parent process takes over the segment and unlinks it
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    shm.close()
+    return _SharedArray(shm.name, obj.shape, obj.dtype)
 
 
 class SerializationMixin:
     """
     Mixin to do serialization for a datastore if required. Supports ability to do serialization in a separate process.
+
+    The worker pool used for multiprocess deserialization is started on first use and kept until :meth:`._close_pool`
+    is called. `deserialization_pool_type` and `n_deserialization_workers` attributes can be set by the datastore to
+    choose between a process and a thread pool and its size.
     """
 
+    deserialization_pool_type = PoolType.PROCESS
+    n_deserialization_workers = None
+    _pool = None
+
     ## Private methods
     @staticmethod
     def _pickle_serialize(obj):
@@ -27,25 +165,61 @@ class SerializationMixin:
 
     @staticmethod
     def _pyarrow_serialize(obj):
+        import pyarrow
         return pyarrow.serialize(obj).to_buffer().to_pybytes()
 
     @staticmethod
     def _pyarrow_deserialize(bstring):
+        import pyarrow
         return pyarrow.deserialize(pyarrow.frombuffer(bstring))
 
+    @staticmethod
+    def _numpy_serialize(obj, compress=False):
+        return numpy_serialize(obj, compress=compress)
+
+    @staticmethod
+    def _numpy_deserialize(bstring):
+        return numpy_deserialize(bstring)
+
     def _singleprocess_deserialize_list(self, results):
         return [self._deserialize(self._decompress(r)) for r in results]
 
     def _multiprocess_deserialize_list(self, results):
-        with Pool() as p:
-            return p.map(self._deserialize, p.map(self._decompress, results))
+        if len(results) == 0:
+            return []
+        pool = self._get_pool()
+        n_workers = self.n_deserialization_workers or os.cpu_count() or 1
+        chunksize = max(1, len(results) // (4 * n_workers))
+        if self.deserialization_pool_type == PoolType.THREAD:
+            # lz4 releases the GIL, so threads decompress in parallel without any copies between processes
+            decode = partial(_decode, deserialize=self._deserialize, use_compression=self.use_compression)
+            return list(pool.imap(decode, results, chunksize=chunksize))
+
+        decode = partial(_decode_to_shared_memory, deserialize=self._deserialize, use_compression=self.use_compression)
+        return [r.load() if isinstance(r, _SharedArray) else r for r in pool.imap(decode, results, chunksize=chunksize)]
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.deserialization_pool_type == PoolType.THREAD:
+                self._pool = ThreadPool(self.n_deserialization_workers)
+            else:
+                self._pool = Pool(self.n_deserialization_workers)
+        return self._pool
+
+    def _close_pool(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
 
     def _compress(self, bstring):
         if self.use_compression:
+            import lz4.frame
             return lz4.frame.compress(bstring)
         return bstring
 
     def _decompress(self, bstring):
         if self.use_compression:
+            import lz4.frame
             return lz4.frame.decompress(bstring)
         return bstring
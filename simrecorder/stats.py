@@ -0,0 +1,205 @@
+"""
+Low-overhead performance counters of datastore operations, as returned by :meth:`simrecorder.Recorder.stats`.
+
+Operations are counted exactly, but only one in `sample_every` operations is timed (and its size measured), so that
+the counters cost next to nothing on the hot path. Latencies, phase times and byte counts are therefore estimates
+extrapolated from the sampled operations.
+"""
+import bisect
+import json
+import os
+import threading
+
+import numpy as np
+
+# Upper bounds of the buckets of the latency histograms in seconds: 1us, 2us, 4us, ... ~34s, and a last bucket for
+# everything slower
+LATENCY_BUCKETS = [1e-6 * 2 ** i for i in range(26)]
+
+DEFAULT_SAMPLE_EVERY = 256
+
+
+class OpStats:
+    """
+    Count and sampled latencies of one type of operation
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.n_sampled = 0
+        self.sampled_seconds = 0.
+        self.max_seconds = 0.
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        # Uncompressed size of the sampled operations with a known size, and their number
+        self.sampled_bytes = 0
+        self.n_sampled_bytes = 0
+
+    def add_sample(self, seconds, nbytes=None):
+        self.n_sampled += 1
+        self.sampled_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        if nbytes is not None:
+            self.sampled_bytes += nbytes
+            self.n_sampled_bytes += 1
+
+    def _percentile(self, q):
+        """
+        Upper bound of the histogram bucket of the `q`-th percentile
+        """
+        target = q / 100 * self.n_sampled
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS + [self.max_seconds], self.histogram):
+            cumulative += n
+            if cumulative >= target:
+                return min(bound, self.max_seconds)
+        return self.max_seconds
+
+    def snapshot(self, n_uncounted=0):
+        """
+        :param n_uncounted: Number of calls not added to `count` yet
+        """
+        count = self.count + n_uncounted
+        snapshot = dict(count=count, n_sampled=self.n_sampled)
+        if self.n_sampled > 0:
+            snapshot.update(
+                mean_us=self.sampled_seconds / self.n_sampled * 1e6,
+                p50_us=self._percentile(50) * 1e6,
+                p99_us=self._percentile(99) * 1e6,
+                max_us=self.max_seconds * 1e6,
+                # Estimated total time spent in this operation
+                total_seconds=self.sampled_seconds / self.n_sampled * count,
+                histogram=dict(bucket_upper_bounds_us=[b * 1e6 for b in LATENCY_BUCKETS], counts=list(self.histogram)))
+        if self.n_sampled_bytes > 0:
+            snapshot['bytes_in'] = int(self.sampled_bytes / self.n_sampled_bytes * count)
+        return snapshot
+
+
+class DataStoreStats:
+    """
+    Performance counters of one datastore. The :class:`.Recorder` counts and times the operations on the datastore.
+    Datastores report the time spent in the phases of an operation (e.g. serialize, compress, io) and the number of
+    bytes before and after compression with :meth:`.add_phase` and :meth:`.add_bytes`, for the operations for which
+    :meth:`.sample` returns True.
+
+    :param name: Name of the datastore in the snapshot
+    :param sample_every: Time one in these many operations
+    """
+
+    def __init__(self, name, sample_every=DEFAULT_SAMPLE_EVERY):
+        assert sample_every >= 1, "sample_every must be at least 1"
+        self.name = name
+        self.sample_every = sample_every
+        self.ops = {}
+        self.phases = {}
+        self.sampled_bytes_uncompressed = 0
+        self.sampled_bytes_compressed = 0
+        self.n_bytes_samples = 0
+        self.n_compressed_samples = 0
+        self.n_bytes_ops = 0
+        self._countdown = sample_every
+        self._lock = threading.Lock()
+
+    def op(self, op):
+        ops = self.ops.get(op)
+        if ops is None:
+            with self._lock:
+                ops = self.ops.setdefault(op, OpStats())
+        return ops
+
+    def sample(self):
+        """
+        Called by datastores once per operation that may report phases or bytes.
+        :return: True if the phases and bytes of this operation should be measured and reported
+        """
+        self.n_bytes_ops += 1
+        self._countdown -= 1
+        # Writer threads may count down at the same time, so the countdown can skip 0
+        if self._countdown > 0:
+            return False
+        self._countdown = self.sample_every
+        return True
+
+    def add_phase(self, phase, seconds):
+        """
+        Report the time spent in a phase (e.g. 'serialize', 'compress', 'io') of a sampled operation
+        """
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.) + seconds
+
+    def add_bytes(self, uncompressed, compressed=None):
+        """
+        Report the size of the data of a sampled operation before and after compression. Datastores that compress
+        whole chunks of records at a time don't know the compressed size of one operation, and leave it None
+        """
+        with self._lock:
+            self.n_bytes_samples += 1
+            self.sampled_bytes_uncompressed += uncompressed
+            if compressed is not None:
+                self.n_compressed_samples += 1
+                self.sampled_bytes_compressed += compressed
+
+    def snapshot(self, n_uncounted=None):
+        """
+        :param n_uncounted: Dict with the number of calls of some operations not counted yet
+        :return: A dict that can be serialized as JSON
+        """
+        n_uncounted = n_uncounted or {}
+        with self._lock:
+            ops = {op: self.ops.get(op, OpStats()).snapshot(n_uncounted.get(op, 0))
+                   for op in set(self.ops) | set(n_uncounted)}
+            snapshot = dict(name=self.name, ops=ops)
+            if self.n_bytes_samples > 0:
+                scale = self.n_bytes_ops / self.n_bytes_samples
+                snapshot['phase_seconds'] = {phase: seconds * scale for phase, seconds in self.phases.items()}
+                snapshot['bytes_uncompressed'] = int(self.sampled_bytes_uncompressed * scale)
+                if self.n_compressed_samples > 0:
+                    snapshot['bytes_compressed'] = int(
+                        self.sampled_bytes_compressed * self.n_bytes_ops / self.n_compressed_samples)
+        return snapshot
+
+
+def record_nbytes(obj):
+    """
+    Size of a record in bytes, if it can be known cheaply (numpy arrays, numbers and bytes), else None
+    """
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.nbytes
+    elif isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    elif isinstance(obj, (int, float)):
+        return 8
+    return None
+
+
+class StatsExporter:
+    """
+    Writes the snapshot returned by `get_stats` as JSON to `pth` every `interval_seconds` on a background thread. The
+    file is replaced atomically, so readers never see a half-written file.
+    """
+
+    def __init__(self, get_stats, pth, interval_seconds=60.):
+        self.get_stats = get_stats
+        self.pth = pth
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='simrecorder-stats', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            self.export()
+
+    def export(self):
+        tmp_pth = self.pth + '.tmp'
+        with open(tmp_pth, 'w') as f:
+            json.dump(self.get_stats(), f, indent=2)
+        os.replace(tmp_pth, self.pth)
+
+    def stop(self):
+        """
+        Stop the thread and write a last snapshot
+        """
+        self._stop.set()
+        self.thread.join()
+        self.export()
@@ -0,0 +1,107 @@
+import sys
+from collections import OrderedDict
+from enum import Enum
+
+import numpy as np
+
+from simrecorder.datastore import DataStore, InMemoryDataStore
+from simrecorder.sequence import ConcatSequence
+
+EvictionPolicy = Enum('EvictionPolicy', ['OLDEST', 'LRU'])
+
+
+class TieredDataStore(DataStore):
+    """
+    Datastore that appends to a fast in-memory tier (an :class:`.InMemoryDataStore`) and moves data to a persistent
+    tier (e.g. an :class:`.HDF5DataStore` or a :class:`.ZarrDataStore`) when the in-memory tier exceeds a memory budget.
+
+    Data is evicted a whole key at a time, with one :meth:`.DataStore.extend` call, until the in-memory tier uses at
+    most `evict_to_fraction` of the budget, so the persistent tier is always written in large batches. :meth:`.get_all`
+    returns the records in the persistent tier followed by the ones still in memory. Values stored with :meth:`.set`
+    go to the persistent tier right away.
+
+    Everything still in memory is written to the persistent tier on :meth:`.flush` and :meth:`.close`.
+
+    :param persistent_datastore: The datastore data is evicted to
+    :param memory_budget_bytes: Maximum number of bytes of records kept in memory. Only the records themselves are
+        counted (the data of numpy arrays, and the size of other objects as reported by `sys.getsizeof`)
+    :param eviction_policy: With :attr:`EvictionPolicy.LRU`, the keys least recently appended to or read are evicted
+        first. With :attr:`EvictionPolicy.OLDEST`, the keys whose data has been in memory for the longest are evicted
+        first
+    :param evict_to_fraction: Fraction of the budget the in-memory tier is reduced to by an eviction
+    """
+
+    def __init__(self, persistent_datastore, memory_budget_bytes=1024 ** 3, eviction_policy=EvictionPolicy.LRU,
+                 evict_to_fraction=0.5):
+        assert memory_budget_bytes > 0, "memory_budget_bytes must be positive"
+        assert 0 <= evict_to_fraction < 1, "evict_to_fraction must be in [0, 1)"
+        self.memory_datastore = InMemoryDataStore()
+        self.persistent_datastore = persistent_datastore
+        self.memory_budget_bytes = memory_budget_bytes
+        self.eviction_policy = eviction_policy
+        self.evict_to_fraction = evict_to_fraction
+
+        # Bytes in memory per key, in eviction order (the first key is evicted first)
+        self.key_bytes = OrderedDict()
+        self.memory_bytes = 0
+        self.n_evictions = 0
+
+    def connect(self):
+        self.persistent_datastore.connect()
+        return self
+
+    def set(self, key, value):
+        self.persistent_datastore.set(key, value)
+
+    def get(self, key):
+        return self.persistent_datastore.get(key)
+
+    def append(self, key, obj):
+        self.memory_datastore.append(key, obj)
+        nbytes = obj.nbytes if isinstance(obj, (np.ndarray, np.generic)) else sys.getsizeof(obj)
+        self.key_bytes[key] = self.key_bytes.get(key, 0) + nbytes
+        self.memory_bytes += nbytes
+        self._touch(key)
+        if self.memory_bytes > self.memory_budget_bytes:
+            self.evict(self.memory_budget_bytes * self.evict_to_fraction)
+
+    def _touch(self, key):
+        if self.eviction_policy == EvictionPolicy.LRU and key in self.key_bytes:
+            self.key_bytes.move_to_end(key)
+
+    def evict(self, target_bytes=0):
+        """
+        Move keys from memory to the persistent tier, in the order given by the eviction policy, until at most
+        `target_bytes` are left in memory.
+        :param target_bytes: Number of bytes that may be left in memory. 0 evicts everything
+        :return:
+        """
+        while self.key_bytes and self.memory_bytes > target_bytes:
+            key, nbytes = self.key_bytes.popitem(last=False)
+            self.persistent_datastore.extend(key, self.memory_datastore.pop_all(key))
+            self.memory_bytes -= nbytes
+            self.n_evictions += 1
+
+    def get_all(self, key):
+        self._touch(key)
+        in_memory = self.memory_datastore.get_all(key) if key in self.key_bytes else None
+        on_disk = self.persistent_datastore.get_all(key)
+        if on_disk is None:
+            return in_memory
+        if in_memory is None:
+            return on_disk
+        return ConcatSequence([on_disk, in_memory])
+
+    def memory_usage(self):
+        """
+        :return: Dictionary with the number of bytes of records in memory per key
+        """
+        return dict(self.key_bytes)
+
+    def flush(self):
+        self.evict()
+        self.persistent_datastore.flush()
+
+    def close(self):
+        self.evict()
+        self.persistent_datastore.close()
@@ -0,0 +1,199 @@
+"""
+Hooks called around every operation of a :class:`.Recorder` or :class:`.DataStore`, and an exporter that writes them
+as a Chrome trace (viewable in chrome://tracing or https://ui.perfetto.dev).
+
+Tracing costs nothing while no hook is added: the traced methods are only wrapped (by setting instance attributes that
+shadow them) when the first hook is added, and the wrappers are removed again with the last hook.
+"""
+import json
+import os
+import threading
+import time
+
+from simrecorder.stats import record_nbytes
+
+DATASTORE_OPS = ('set', 'get', 'append', 'extend', 'get_all', 'flush', 'close')
+RECORDER_OPS = ('set', 'get', 'record', 'get_all', 'flush', 'close')
+
+# Operations whose second argument is the value written
+_VALUE_OPS = ('set', 'append', 'record')
+# Operations without a key
+_KEYLESS_OPS = ('flush', 'close')
+
+
+class TraceEvent:
+    """
+    One traced operation, passed to the `on_start` and `on_end` callbacks of the hooks.
+
+    :ivar source: Name of the traced object (e.g. 'Recorder' or 'HDF5DataStore')
+    :ivar op: Name of the operation (e.g. 'record' or 'append')
+    :ivar key: The key, or None for operations without a key (flush and close)
+    :ivar nbytes: Size of the written value in bytes if it is known cheaply (numpy arrays, numbers, bytes), else None
+    :ivar thread_id: Identifier of the thread doing the operation
+    :ivar start: :func:`time.perf_counter` at the start of the operation
+    :ivar end: :func:`time.perf_counter` at the end of the operation (None in `on_start`)
+    :ivar error: The exception raised by the operation, if any
+    """
+    __slots__ = ('source', 'op', 'key', 'nbytes', 'thread_id', 'start', 'end', 'error')
+
+    def __init__(self, source, op, key, nbytes):
+        self.source = source
+        self.op = op
+        self.key = key
+        self.nbytes = nbytes
+        self.thread_id = threading.get_ident()
+        self.start = None
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self):
+        """
+        Duration of the operation in seconds (None in `on_start`)
+        """
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    def __repr__(self):
+        return '{}(source={!r}, op={!r}, key={!r}, nbytes={!r}, duration={!r})'.format(
+            type(self).__name__, self.source, self.op, self.key, self.nbytes, self.duration)
+
+
+class TraceHook:
+    """
+    Handle of a hook added with :func:`add_trace_hook`
+    """
+
+    def __init__(self, on_start=None, on_end=None):
+        self.on_start = on_start
+        self.on_end = on_end
+
+
+def add_trace_hook(obj, ops, on_start=None, on_end=None):
+    """
+    Call `on_start(event)` before and `on_end(event)` after every call of the methods `ops` of `obj`, with a
+    :class:`TraceEvent`. Exceptions raised by the callbacks are not caught.
+    :return: The :class:`TraceHook`, to pass to :func:`remove_trace_hook`
+    """
+    hooks = obj.__dict__.get('_trace_hooks')
+    if hooks is None:
+        hooks = []
+        originals = {op: obj.__dict__[op] for op in ops if op in obj.__dict__}
+        source = type(obj).__name__
+        for op in ops:
+            setattr(obj, op, _traced(source, op, getattr(obj, op), hooks))
+        obj._trace_hooks = hooks
+        obj._untraced_methods = (ops, originals)
+    hook = TraceHook(on_start, on_end)
+    hooks.append(hook)
+    return hook
+
+
+def remove_trace_hook(obj, hook):
+    """
+    Remove a hook added with :func:`add_trace_hook`. The methods are unwrapped when the last hook is removed.
+    """
+    hooks = obj.__dict__.get('_trace_hooks')
+    if hooks is None or hook not in hooks:
+        raise ValueError("{!r} is not a trace hook of {!r}".format(hook, obj))
+    hooks.remove(hook)
+    if not hooks:
+        ops, originals = obj._untraced_methods
+        for op in ops:
+            if op in originals:
+                setattr(obj, op, originals[op])
+            else:
+                delattr(obj, op)
+        del obj._trace_hooks
+        del obj._untraced_methods
+
+
+def _traced(source, op, method, hooks):
+    has_key = op not in _KEYLESS_OPS
+    has_value = op in _VALUE_OPS
+
+    def traced(*args, **kwargs):
+        key = (args[0] if args else kwargs.get('key')) if has_key else None
+        nbytes = record_nbytes(args[1]) if has_value and len(args) > 1 else None
+        event = TraceEvent(source, op, key, nbytes)
+        event.start = time.perf_counter()
+        for hook in hooks:
+            if hook.on_start is not None:
+                hook.on_start(event)
+        try:
+            return method(*args, **kwargs)
+        except Exception as e:
+            event.error = e
+            raise
+        finally:
+            event.end = time.perf_counter()
+            for hook in hooks:
+                if hook.on_end is not None:
+                    hook.on_end(event)
+
+    traced.__name__ = op
+    traced.__doc__ = method.__doc__
+    traced.__wrapped__ = method
+    return traced
+
+
+class ChromeTraceExporter:
+    """
+    Collects traced operations as complete events of the Chrome trace event format, and writes them as JSON with
+    :meth:`.save`. Every traced object shows up as a category, and every thread as its own track, so that stalls of
+    background writer threads can be lined up with the calls of the simulation.
+
+    :param pth: Default path for :meth:`.save`
+    """
+
+    def __init__(self, pth=None):
+        self.pth = pth
+        self.events = []
+        self._attached = []
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    def attach(self, obj):
+        """
+        Trace all operations of `obj` (a :class:`.Recorder` or :class:`.DataStore`)
+        """
+        self._attached.append((obj, obj.add_trace_hook(on_end=self.on_end)))
+        return self
+
+    def detach(self):
+        """
+        Stop tracing all objects attached with :meth:`.attach`
+        """
+        for obj, hook in self._attached:
+            obj.remove_trace_hook(hook)
+        self._attached = []
+
+    def on_end(self, event):
+        args = dict(key=event.key)
+        if event.nbytes is not None:
+            args['nbytes'] = event.nbytes
+        if event.error is not None:
+            args['error'] = repr(event.error)
+        name = event.op if event.key is None else '{} {}'.format(event.op, event.key)
+        self.events.append(dict(name=name, cat=event.source, ph='X', ts=self._us(event.start),
+                                dur=event.duration * 1e6, pid=self._pid, tid=event.thread_id, args=args))
+
+    def mark(self, name, **args):
+        """
+        Add an instant event, e.g. to mark the steps of the simulation in the trace
+        """
+        self.events.append(dict(name=name, ph='i', s='p', ts=self._us(time.perf_counter()), pid=self._pid,
+                                tid=threading.get_ident(), args=args))
+
+    def save(self, pth=None):
+        """
+        Write all events collected so far to `pth` (or the path given to the constructor)
+        """
+        pth = pth or self.pth
+        assert pth is not None, "No path to save the trace to"
+        with open(pth, 'w') as f:
+            json.dump(dict(traceEvents=list(self.events), displayTimeUnit='ms'), f)
+
+    def _us(self, t):
+        return (t - self._origin) * 1e6
@@ -1,12 +1,21 @@
 import os
+import pickle
+import time
 from enum import Enum
 
 import numpy as np
 
+from simrecorder.append_buffer import AppendBuffer, FlushPolicy, PackedAppendBuffer, check_cast
+from simrecorder.chunking import ReadPattern, plan_chunks
+from simrecorder.codec_selection import (DEFAULT_MIN_WRITE_MB_PER_S, MIN_SAMPLE_BYTES, CodecTrial, as_sample,
+                                         select_codec, selection_metadata, trial_compress)
 from simrecorder.datastore import DataStore
+from simrecorder.sequence import ArraySequence, ListSequence, PackedSequence
+from simrecorder.stats import record_nbytes
 
 DatastoreType = Enum('DatastoreType', ['LMDB', 'DIRECTORY'])
-CompressionType = Enum('CompressionType', ['BLOSC', 'LZMA'])
+CompressionType = Enum('CompressionType', ['BLOSC', 'LZMA', 'AUTO'])
+ObjectCodec = Enum('ObjectCodec', ['PICKLE', 'MSGPACK'])
 
 
 class ZarrDataStore(DataStore):
@@ -14,12 +23,24 @@ class ZarrDataStore(DataStore):
     This is a zarr datastore. Uses lmdb underneath to store the data.
     """
 
-    def __init__(self, data_dir_pth, desired_chunk_size_bytes=1. * 1024 ** 2, datastore_type=DatastoreType.LMDB, compression_type=CompressionType.BLOSC):
+    def __init__(self, data_dir_pth, desired_chunk_size_bytes=1. * 1024 ** 2, datastore_type=DatastoreType.LMDB, compression_type=CompressionType.BLOSC,
+                 buffered_append=False, flush_every_n_records=None, flush_every_seconds=None, growth_factor=2.,
+                 read_pattern=ReadPattern.PER_TIMESTEP, expected_n_records=None, object_codec=ObjectCodec.PICKLE,
+                 ragged_keys=(), min_write_mb_per_s=DEFAULT_MIN_WRITE_MB_PER_S):
         """
         :param data_dir_pth: Path to the zarr lmdb file
         :param desired_chunk_size_bytes: The size (in bytes) of chunk each array is split into
         :param datastore_type: LMDB uses the lmdb database which needs to be installed on the system. If not available, use DIRECTORY type, which uses os filesystem
-        :param compression_type: BLOSC uses the blosc library through numcodecs, but requires the blosc library to be installed on the system, or have a compatible system where blosc can be automatically installed when installing numcodes. If blosc is not available, use LZMA, which uses the python built-in compression library LZMA.
+        :param compression_type: BLOSC uses the blosc library through numcodecs, but requires the blosc library to be installed on the system, or have a compatible system where blosc can be automatically installed when installing numcodes. If blosc is not available, use LZMA, which uses the python built-in compression library LZMA. With AUTO, the compressor of every key is chosen when the key is created, by trial-compressing its first record with blosc (lz4 and zstd at several levels, with no shuffle, byte shuffle and bit shuffle), zlib and LZMA: the one with the best compression ratio that still compresses at least `min_write_mb_per_s` is used. zarr stores the compressor with every array, so reading needs no configuration, and the measured ratio and throughput are recorded in the attribute `compression_selection`.
+        :param buffered_append: If True, appended arrays and scalars are staged in memory and written a whole chunk at a time. The arrays are grown geometrically and trimmed to their actual length on :meth:`.close` (or when the key is read back with :meth:`.get_all`). If False, every append resizes the array by one and writes the record immediately (and commits to LMDB).
+        :param flush_every_n_records: (buffered_append only) Write out all staged records and commit the LMDB store every these many appended records. None disables this trigger.
+        :param flush_every_seconds: (buffered_append only) Write out all staged records and commit the LMDB store when these many seconds have passed since the last commit. None disables this trigger. If both triggers are None, data is committed only on close.
+        :param growth_factor: (buffered_append only) Factor by which the capacity of an array is grown when it is full
+        :param read_pattern: How the recorded arrays will mostly be read, which determines the shape of the chunks. See :class:`simrecorder.chunking.ReadPattern`. Chunks spanning several records (TIME_SERIES, WHOLE_RUN) are best combined with `buffered_append`, since otherwise every append rewrites a partially filled chunk.
+        :param expected_n_records: Expected number of records per key, if known. Used to plan the chunks
+        :param object_codec: How records that are not numbers or arrays are encoded. They are appended to a log per key, made of a chunked uint8 array `data` with the encoded records back to back and an int64 array `offsets` with the end offset of every record. MSGPACK is faster and more compact than PICKLE, but only supports basic python types. The codec is stored with the key, so it doesn't need to be given for reading.
+        :param min_write_mb_per_s: (CompressionType.AUTO only) Minimum compression throughput in MB/s of uncompressed data
+        :param ragged_keys: Keys whose records are 1-D numeric arrays of varying length (e.g. spike trains). These are stored in the same layout as objects, but with a typed `values` array instead of `data`, and are read back as a list of numpy arrays.
         """
 
         import zarr
@@ -42,6 +63,11 @@ class ZarrDataStore(DataStore):
             # lzma_filters = [dict(id=lzma.FILTER_DELTA, dist=4), dict(id=lzma.FILTER_LZMA2, preset=1)]
             from numcodecs import LZMA
             self.compressor = LZMA()
+        elif compression_type == CompressionType.AUTO:
+            # Chosen per key, see _create_array
+            self.compressor = None
+        self.compression_type = compression_type
+        self.min_write_mb_per_s = min_write_mb_per_s
 
         self.desired_chunk_size_bytes = desired_chunk_size_bytes
 
@@ -50,7 +76,17 @@ class ZarrDataStore(DataStore):
         else:
             self.f = zarr.group(store=self.store, overwrite=False)
 
-        self.i = 0
+        self.object_codec = object_codec
+        self.ragged_keys = set(ragged_keys)
+
+        self.buffered_append = buffered_append
+        self.flush_policy = FlushPolicy(flush_every_n_records, flush_every_seconds)
+        self.growth_factor = growth_factor
+        self.read_pattern = read_pattern
+        self.expected_n_records = expected_n_records
+        self.buffers = {}
+        # Sizes of the keys when the LMDB store was closed, for the last snapshot of the statistics
+        self._storage_size_on_close = None
 
     def set(self, key, value):
         d = self.f.get(key)
@@ -63,9 +99,35 @@ class ZarrDataStore(DataStore):
         return self.f.get(key)
 
     def append(self, key, obj):
-        if isinstance(obj, np.ndarray) or isinstance(obj, float) or isinstance(obj, int) or isinstance(obj, np.generic):
+        stats = self.stats
+        if stats is not None and stats.sample():
+            self._timed_append(stats, key, obj)
+            return
+        self._append(key, obj)
+
+    def _timed_append(self, stats, key, obj):
+        """
+        :meth:`._append`, reporting the time spent (as 'io', which includes compression) and the size of the record
+        (encoded, for objects). How much is stored after compression is reported by :meth:`.storage_size`.
+        """
+        encoded_before = _encoded_nbytes(self.buffers.get(key))
+        start = time.perf_counter()
+        self._append(key, obj)
+        stats.add_phase('io', time.perf_counter() - start)
+        nbytes = record_nbytes(obj)
+        if nbytes is None:
+            nbytes = _encoded_nbytes(self.buffers.get(key)) - encoded_before
+        stats.add_bytes(nbytes)
+
+    def _append(self, key, obj):
+        if key in self.ragged_keys:
+            self._ragged_append(key, obj)
+        elif isinstance(obj, np.ndarray) or isinstance(obj, float) or isinstance(obj, int) or isinstance(obj, np.generic):
             if isinstance(obj, float) or isinstance(obj, int) or isinstance(obj, np.generic):
                 obj = np.array(obj)
+            if self.buffered_append:
+                self._buffered_append(key, obj)
+                return
             d = self.f.get(key)
             if d is not None:
                 assert isinstance(d, self.zarr.core.Array)
@@ -75,56 +137,232 @@ class ZarrDataStore(DataStore):
                 if self.datastore_type == DatastoreType.LMDB:
                     self.store.flush()
             else:
-                self.f.create_dataset(
-                    key, data=obj[None, ...], compressor=self.compressor, chunks=self._get_chunk_size(obj))
+                self._create_array(self.f, key, obj, data=obj[None, ...], chunks=self._get_chunk_size(obj))
+        else:
+            self._packed_append(key, obj)
+
+    def extend(self, key, objs):
+        """
+        Append all records in `objs`. If `objs` is a numpy array of numeric records (one record per row), and `key` is
+        not appended to with a buffer, the records are written with a single resize and write.
+        """
+        if not (isinstance(objs, np.ndarray) and objs.dtype.kind in 'biufc' and objs.ndim > 0 and
+                not self.buffered_append and key not in self.buffers and key not in self.ragged_keys):
+            return super().extend(key, objs)
+        if len(objs) == 0:
+            return
+
+        d = self.f.get(key)
+        if d is not None:
+            assert isinstance(d, self.zarr.core.Array)
+            d.append(objs)
+        else:
+            # Records are written in batches, so chunks can span several of them
+            self._create_array(self.f, key, objs, data=objs, chunks=self._get_chunk_size(objs[0], pack_records=True))
+        if self.datastore_type == DatastoreType.LMDB:
+            self.store.flush()
+
+    def _buffered_append(self, key, obj):
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            d = self.f.get(key)
+            if d is not None:
+                assert isinstance(d, self.zarr.core.Array)
+            else:
+                chunks = self._get_chunk_size(obj, pack_records=True)
+                d = self._create_array(self.f, key, obj, shape=(0, *obj.shape), dtype=obj.dtype, chunks=chunks)
+            buffer = AppendBuffer(d, d.shape[0], d.chunks[0], lambda n, d=d: d.resize(n, *d.shape[1:]),
+                                  self.growth_factor)
+            self.buffers[key] = buffer
+
+        check_cast(key, obj.dtype, buffer.array.dtype)
+        buffer.append(obj)
+        if self.flush_policy.record_appended():
+            self.flush()
+
+    def _packed_append(self, key, obj):
+        if self.object_codec == ObjectCodec.MSGPACK:
+            import msgpack
+            record = msgpack.packb(obj, use_bin_type=True)
         else:
-            import numcodecs
+            record = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        buffer = self._get_packed_buffer(key, 'packed', 'data', np.frombuffer(record, dtype=np.uint8))
+        buffer.append(record)
+        if self.buffered_append and self.flush_policy.record_appended():
+            self.flush()
 
-            # self.f.create_dataset("{}/{}".format(key, self.i), data=obj)
-            z = self.f.array("{}/{}".format(key, self.i), obj, dtype=object, object_codec=numcodecs.Pickle())
-            self.i += 1
+    def _ragged_append(self, key, obj):
+        obj = np.asarray(obj)
+        if obj.ndim > 1:
+            raise ValueError("Records of ragged key {} must be 1-D, but got shape {}".format(key, obj.shape))
+        buffer = self._get_packed_buffer(key, 'ragged', 'values', obj.reshape(-1))
+        if not np.can_cast(obj.dtype, buffer.data.dtype, casting='same_kind'):
+            raise TypeError("Cannot append a value of type {} to key {} of type {}".format(
+                obj.dtype, key, buffer.data.dtype))
+        buffer.append(obj.reshape(-1))
+        if self.buffered_append and self.flush_policy.record_appended():
+            self.flush()
 
-    def _get_chunk_size(self, obj):
+    def _get_packed_buffer(self, key, layout, data_name, record):
         """
-        Tries to optimize the chunk size (assuming 32-bit floats used) so that the chunk size is close to
-        `desired_chunk_size_bytes`. The last dimension size is maintained without change.
-        :param obj:
-        :return:
+        Returns the buffer of the log under `key`, made of the arrays `<key>/<data_name>` and `<key>/offsets`, and
+        creates the log if necessary, with the dtype of `record` (a 1-D numpy array of the values of the first record).
         """
-        ## Makes sure chunk size is always `desired_chunk_size_bytes`!
-        desired_chunk_size_bytes = self.desired_chunk_size_bytes
-        if desired_chunk_size_bytes <= 0:
-            # Switch to h5py's automagic chunk size calculation
-            return True
+        buffer = self.buffers.get(key)
+        if buffer is not None:
+            return buffer
 
-        element_size_bytes = 4
-        # Assuming storage of 32-bit floats
-        if np.prod(obj.shape) * element_size_bytes <= desired_chunk_size_bytes:
-            return tuple([1] + list(obj.shape))
+        g = self.f.get(key)
+        if g is None:
+            g = self.f.create_group(key)
+            g.attrs['layout'] = layout
+            if layout == 'packed':
+                g.attrs['codec'] = self.object_codec.name
+            chunk_bytes = int(self.desired_chunk_size_bytes) if self.desired_chunk_size_bytes > 0 else 1024 ** 2
+            self._create_array(g, data_name, record, shape=(0, ), dtype=record.dtype,
+                               chunks=(max(1, chunk_bytes // record.dtype.itemsize), ))
+            # Offsets are increasing integers, which compress well with shuffle
+            offsets_compressor = self.compressor
+            if self.compression_type == CompressionType.AUTO:
+                from numcodecs import Blosc
+                offsets_compressor = Blosc(cname='lz4', clevel=5, shuffle=Blosc.SHUFFLE)
+            g.create_dataset('offsets', shape=(0, ), dtype=np.int64, compressor=offsets_compressor,
+                             chunks=(max(1, chunk_bytes // 8), ))
+        elif g.attrs.get('layout') != layout:
+            raise ValueError("Key {} does not contain a {} log".format(key, layout))
+
+        data, offsets = g[data_name], g['offsets']
+        if self.buffered_append:
+            block_values, block_records = data.chunks[0], offsets.chunks[0]
         else:
-            ndim = len(obj.shape)
-            total_elements = desired_chunk_size_bytes / element_size_bytes
-            cum_el = total_elements
-            last_el_s = obj.shape[-1]
-            cum_el /= last_el_s
-            shape = [1]
-            for i in range(ndim - 1):
-                s = np.minimum(obj.shape[i], np.power(cum_el, 1 / (ndim - i - 1)))
-                s = np.floor(s)
-                cum_el /= s
-                shape.append(int(s))
-            shape.append(int(last_el_s))
-            assert len(shape) == len(obj.shape) + 1
-            return tuple(shape)
+            # Write every record right away, and keep the offsets exactly as long as the log, so that it
+            # can be read even if the store is never closed
+            block_values, block_records = 0, 1
+        buffer = PackedAppendBuffer(
+            data, offsets, int(offsets[-1]) if offsets.shape[0] > 0 else 0, offsets.shape[0],
+            lambda n, d=data: d.resize(n), lambda n, d=offsets: d.resize(n),
+            block_values, block_records, self.growth_factor, exact_offsets=not self.buffered_append)
+        self.buffers[key] = buffer
+        return buffer
+
+    def _create_array(self, parent, name, sample, **kwargs):
+        """
+        Create the array `name` in the group `parent` with the compressor of the datastore. For CompressionType.AUTO,
+        the compressor is chosen by trial-compressing `sample`, and the choice is recorded in the attribute
+        `compression_selection` of the array.
+        """
+        if self.compression_type != CompressionType.AUTO:
+            return parent.create_dataset(name, compressor=self.compressor, **kwargs)
+        trial = self._select_compressor(as_sample(sample))
+        d = parent.create_dataset(name, compressor=trial.codec, **kwargs)
+        d.attrs['compression_selection'] = selection_metadata(
+            trial, self.min_write_mb_per_s, 'none' if trial.codec is None else repr(trial.codec))
+        return d
+
+    def _select_compressor(self, sample):
+        from numcodecs import LZMA, Blosc, Zlib
+
+        candidates = [
+            Blosc(cname=cname, clevel=clevel, shuffle=shuffle)
+            for cname in ('lz4', 'zstd') for clevel in (1, 5, 9)
+            for shuffle in (Blosc.NOSHUFFLE, Blosc.SHUFFLE, Blosc.BITSHUFFLE)
+        ] + [Zlib(level=1), Zlib(level=6), LZMA(preset=1)]
+        if sample.nbytes < MIN_SAMPLE_BYTES:
+            return CodecTrial(Blosc(cname='lz4', clevel=5, shuffle=Blosc.SHUFFLE), None, None)
+        trials = [CodecTrial(None, 1., np.inf)] + [
+            trial_compress(codec, lambda codec=codec: len(codec.encode(sample)), sample.nbytes)
+            for codec in candidates
+        ]
+        return select_codec(trials, self.min_write_mb_per_s)
+
+    def flush(self):
+        """
+        Write out all staged records and, for LMDB, commit them to disk. The arrays keep their extra capacity.
+        :return:
+        """
+        for buffer in self.buffers.values():
+            buffer.write()
+        if self.datastore_type == DatastoreType.LMDB:
+            self.store.flush()
+        self.flush_policy.flushed()
+
+    def _get_chunk_size(self, obj, pack_records=False):
+        """
+        Chunk shape for an array of records like `obj`, planned by :func:`simrecorder.chunking.plan_chunks` according to
+        the dtype of `obj`, the declared read pattern and the expected number of records.
+        :param obj:
+        :param pack_records: Put several small records into one chunk even for the PER_TIMESTEP read pattern
+        :return:
+        """
+        return plan_chunks(obj.shape, obj.dtype, self.desired_chunk_size_bytes, read_pattern=self.read_pattern,
+                           expected_n_records=self.expected_n_records, pack_records=pack_records)
 
     def get_all(self, key):
+        buffer = self.buffers.get(key)
+        if buffer is not None:
+            buffer.trim()
         d = self.f.get(key)
         if d is not None:
             if isinstance(d, self.zarr.core.Array):
-                return d
+                return ArraySequence(d)
+            elif d.attrs.get('layout') == 'packed':
+                if d.attrs['codec'] == ObjectCodec.MSGPACK.name:
+                    import msgpack
+                    loads = lambda b: msgpack.unpackb(b, raw=False)
+                else:
+                    loads = pickle.loads
+                return PackedSequence(d['data'], d['offsets'], decode=loads)
+            elif d.attrs.get('layout') == 'ragged':
+                return PackedSequence(d['values'], d['offsets'])
             else:
-                return list(map(lambda x: x[1], sorted(d.items(), key=lambda x: int(x[0]))))
+                # Layout of older versions, with one array per record
+                return ListSequence(list(map(lambda x: x[1], sorted(d.items(), key=lambda x: int(x[0])))))
+
+    def storage_size(self, key=None):
+        """
+        Size of the stored (compressed) chunks and metadata of the arrays of `key`. See
+        :meth:`simrecorder.datastore.DataStore.storage_size`. This lists all chunks of the key (and reads them, for
+        LMDB), so it takes time proportional to their number.
+        """
+        if self._storage_size_on_close is not None:
+            return self._storage_size_on_close if key is None else self._storage_size_on_close[key]
+        if key is None:
+            return {key: self.storage_size(key) for key in _keys(self.f, self.zarr)}
+        d = self.f[key]
+        if isinstance(d, self.zarr.core.Array):
+            return d.nbytes_stored
+        # A packed or ragged log, or an array per record in older versions
+        return sum(a.nbytes_stored for _, a in d.arrays())
 
     def close(self):
+        for buffer in self.buffers.values():
+            buffer.trim()
+        self.buffers = {}
         if self.datastore_type == DatastoreType.LMDB:
+            self.store.flush()
+            if self.stats is not None:
+                self._storage_size_on_close = self.storage_size()
             self.store.close()
+
+
+def _keys(group, zarr):
+    """
+    The keys stored in `group` and its subgroups: arrays, packed and ragged logs and groups with an array per record
+    (of older versions)
+    """
+    for _, v in group.items():
+        if isinstance(v, zarr.core.Array) or 'layout' in v.attrs or \
+                (len(v) > 0 and all(name.isdigit() for name in v)):
+            yield v.path
+        else:
+            yield from _keys(v, zarr)
+
+
+def _encoded_nbytes(buffer):
+    """
+    Size of the encoded records (or values of ragged records) in the log of `buffer` (including the ones that are not
+    written yet), or 0
+    """
+    if isinstance(buffer, PackedAppendBuffer):
+        return (buffer.n_values + buffer.n_pending_values) * buffer.data.dtype.itemsize
+    return 0
@@ -0,0 +1,262 @@
+"""
+Parametrized benchmark of all datastores. Every case is run in a fresh process, and the results are written as JSON.
+
+Run a quick benchmark and save it as a baseline::
+
+    python -m tests.benchmark --preset quick --output baseline.json
+
+and compare a later run (e.g. on another commit) against it::
+
+    python -m tests.benchmark --preset quick --output results.json --baseline baseline.json
+
+The exit code is 1 if any metric regressed by more than ``--tolerance``.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKENDS = {
+    'inmemory': [None],
+    'hdf5': ['lzf', 'gzip', 'auto', None],
+    'memmap': [None],
+    'zarr-lmdb': ['BLOSC', 'LZMA', 'AUTO'],
+    'zarr-directory': ['BLOSC', 'LZMA', 'AUTO'],
+    'redis': ['lz4', None],
+}
+
+PRESETS = {
+    'quick': dict(record_shapes=[(10, ), (100, 100)], dtypes=['float32'], n_keys=[1, 10], n_records=200),
+    'default': dict(record_shapes=[(1, ), (100, ), (100, 100), (10, 100, 100)], dtypes=['float32', 'float64', 'int8'],
+                    n_keys=[1, 10, 100], n_records=1000),
+}
+
+# Metrics where larger values are better. For all other metrics, smaller is better.
+HIGHER_IS_BETTER = {'write_mb_per_s', 'write_records_per_s', 'read_mb_per_s'}
+COMPARED_METRICS = ['write_mb_per_s', 'write_records_per_s', 'read_mb_per_s', 'latency_p50_us', 'latency_p99_us',
+                    'peak_rss_mb', 'disk_mb']
+
+# Number of distinct records generated. They are recorded over and over, so that the benchmark itself doesn't use
+# n_records times the memory.
+N_DISTINCT_RECORDS = 16
+
+
+def disk_usage(start_path):
+    """
+    Space actually allocated on disk by all files under `start_path` (lmdb files are sparse, so their apparent size is
+    the whole map size)
+    """
+    total_size = 0
+    for dirpath, dirnames, filenames in os.walk(start_path):
+        for f in filenames:
+            total_size += os.stat(os.path.join(dirpath, f)).st_blocks * 512
+    return total_size
+
+
+def case_id(case):
+    return '{backend}/{compression}/{dtype}/{shape}/{n_keys}keys'.format(
+        backend=case['backend'], compression=case['compression'], dtype=case['dtype'],
+        shape='x'.join(str(s) for s in case['record_shape']) or 'scalar', n_keys=case['n_keys'])
+
+
+def make_datastore(backend, compression, data_dir):
+    from simrecorder import (CompressionType, DatastoreType, HDF5DataStore, InMemoryDataStore, MemmapDataStore,
+                             RedisDataStore, ZarrDataStore)
+    if backend == 'inmemory':
+        return InMemoryDataStore()
+    elif backend == 'hdf5':
+        return HDF5DataStore(os.path.join(data_dir, 'data.h5'), compression=compression)
+    elif backend == 'memmap':
+        return MemmapDataStore(os.path.join(data_dir, 'data.memmap'))
+    elif backend in ('zarr-lmdb', 'zarr-directory'):
+        datastore_type = DatastoreType.LMDB if backend == 'zarr-lmdb' else DatastoreType.DIRECTORY
+        return ZarrDataStore(os.path.join(data_dir, 'data.zarr'), datastore_type=datastore_type,
+                             compression_type=getattr(CompressionType, compression))
+    elif backend == 'redis':
+        return RedisDataStore(server_host='localhost')
+    raise ValueError("Unknown backend {}".format(backend))
+
+
+def run_case(case, data_dir, result_queue):
+    """
+    Runs a single benchmark case. This is run in its own process, so that the peak RSS is that of this case only.
+    """
+    try:
+        result_queue.put(_run_case(case, data_dir))
+    except Exception as e:
+        result_queue.put(dict(error=repr(e)))
+
+
+def _run_case(case, data_dir):
+    from simrecorder import Recorder, RedisServer
+
+    rng = np.random.RandomState(case['seed'])
+    records = (rng.rand(N_DISTINCT_RECORDS, *case['record_shape']) * 100).astype(case['dtype'])
+    keys = ['bench/key{}'.format(k) for k in range(case['n_keys'])]
+    n_records = case['n_records']
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    server = None
+    if case['backend'] == 'redis':
+        server = RedisServer(data_directory=data_dir, use_compression=case['compression'] is not None)
+        server.start()
+    try:
+        ## WRITE
+        recorder = Recorder(make_datastore(case['backend'], case['compression'], data_dir))
+        latencies = np.empty(n_records * len(keys))
+        i = 0
+        start = time.perf_counter()
+        for step in range(n_records):
+            record = records[step % N_DISTINCT_RECORDS]
+            for key in keys:
+                t = time.perf_counter()
+                recorder.record(key, record)
+                latencies[i] = time.perf_counter() - t
+                i += 1
+        if case['backend'] != 'inmemory':
+            recorder.close()
+        write_time = time.perf_counter() - start
+
+        ## READ
+        if case['backend'] != 'inmemory':
+            recorder = Recorder(make_datastore(case['backend'], case['compression'], data_dir))
+        start = time.perf_counter()
+        for key in keys:
+            values = np.asarray(recorder.get_all(key))
+            assert values.shape == (n_records, *case['record_shape']), values.shape
+        read_time = time.perf_counter() - start
+        recorder.close()
+    finally:
+        if server is not None:
+            server.stop()
+
+    total_mb = records[0].nbytes * n_records * len(keys) / 1024 ** 2
+    return dict(
+        write_mb_per_s=total_mb / write_time,
+        write_records_per_s=n_records * len(keys) / write_time,
+        read_mb_per_s=total_mb / read_time,
+        latency_p50_us=float(np.percentile(latencies, 50) * 1e6),
+        latency_p99_us=float(np.percentile(latencies, 99) * 1e6),
+        # ru_maxrss is in KiB on Linux
+        peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        peak_rss_increase_mb=(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+        disk_mb=disk_usage(data_dir) / 1024 ** 2,
+    )
+
+
+def make_cases(args):
+    preset = PRESETS[args.preset]
+    backends = args.backends or list(BACKENDS)
+    cases = []
+    for backend in backends:
+        compressions = BACKENDS[backend]
+        if args.compressions:
+            compressions = [c for c in compressions if str(c) in args.compressions]
+        for compression, record_shape, dtype, n_keys in itertools.product(
+                compressions, preset['record_shapes'], preset['dtypes'], preset['n_keys']):
+            cases.append(dict(backend=backend, compression=compression, record_shape=record_shape, dtype=dtype,
+                              n_keys=n_keys, n_records=args.n_records or preset['n_records'], seed=args.seed))
+    return cases
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(commit=commit, python=platform.python_version(), platform=platform.platform(),
+                numpy=np.__version__, cpu_count=os.cpu_count())
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare `results` against `baseline` and print the relative change of every metric.
+    :return: List of (case id, metric, baseline value, new value) of all regressions larger than `tolerance`
+    """
+    baseline_results = {r['id']: r for r in baseline['results'] if 'error' not in r}
+    regressions = []
+    for result in results:
+        old = baseline_results.get(result['id'])
+        if old is None or 'error' in result:
+            continue
+        changes = []
+        for metric in COMPARED_METRICS:
+            if not old[metric] or metric not in result:
+                continue
+            change = result[metric] / old[metric] - 1
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if worse > tolerance:
+                regressions.append((result['id'], metric, old[metric], result[metric]))
+            changes.append('{} {:+.0%}'.format(metric, change))
+        print('{:<50} {}'.format(result['id'], ', '.join(changes)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--preset', choices=list(PRESETS), default='quick')
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), help="Default: all backends")
+    parser.add_argument('--compressions', nargs='+', help="Only run these compressions (e.g. lzf BLOSC None)")
+    parser.add_argument('--n-records', type=int, help="Number of records per key (overrides the preset)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', help="Directory for the data files. Default: a temporary directory")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--baseline', help="Compare the results against this JSON file from an earlier run")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="Relative change of a metric counted as regression (default 0.1)")
+    args = parser.parse_args()
+
+    root_dir = args.data_dir or tempfile.mkdtemp(prefix='simrecorder-benchmark-')
+    # Every case runs in a fresh interpreter, so nothing is shared between cases
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for case in make_cases(args):
+        data_dir = os.path.join(root_dir, 'case')
+        shutil.rmtree(data_dir, ignore_errors=True)
+        os.makedirs(data_dir)
+
+        result_queue = ctx.Queue()
+        process = ctx.Process(target=run_case, args=(case, data_dir, result_queue))
+        process.start()
+        metrics = result_queue.get()
+        process.join()
+
+        result = dict(id=case_id(case), **case, **metrics)
+        results.append(result)
+        if 'error' in result:
+            print("{:<50} FAILED: {}".format(result['id'], result['error']))
+        else:
+            print("{id:<50} write {write_mb_per_s:8.1f} MB/s {write_records_per_s:10.0f} rec/s | "
+                  "p50 {latency_p50_us:8.1f} us p99 {latency_p99_us:8.1f} us | read {read_mb_per_s:8.1f} MB/s | "
+                  "RSS {peak_rss_mb:7.1f} MB | disk {disk_mb:7.1f} MB".format(**result))
+    if args.data_dir is None:
+        shutil.rmtree(root_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(environment=environment(), results=results), f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print("\nChange relative to baseline {} (commit {})".format(args.baseline, baseline['environment']['commit']))
+        regressions = compare(results, baseline, args.tolerance)
+        for case, metric, old, new in regressions:
+            print("REGRESSION {}: {} {:.2f} -> {:.2f}".format(case, metric, old, new))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
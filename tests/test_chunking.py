@@ -0,0 +1,52 @@
+import unittest
+
+import numpy as np
+
+from simrecorder.chunking import DEFAULT_TIME_SERIES_ROWS, ReadPattern, plan_chunks
+
+
+class TestChunkPlanner(unittest.TestCase):
+    desired_chunk_size_bytes = 1024 ** 2
+
+    def chunk_bytes(self, chunks, dtype):
+        return np.prod(chunks) * np.dtype(dtype).itemsize
+
+    def test_dtype_size(self):
+        for dtype in [np.int8, np.float32, np.float64]:
+            chunks = plan_chunks((10, 10000, 200), dtype, self.desired_chunk_size_bytes)
+            self.assertEqual(chunks[0], 1)
+            self.assertEqual(chunks[-1], 200)
+            self.assertLessEqual(self.chunk_bytes(chunks, dtype), self.desired_chunk_size_bytes)
+            self.assertGreater(self.chunk_bytes(chunks, dtype), self.desired_chunk_size_bytes / 2)
+
+    def test_per_timestep(self):
+        self.assertEqual(plan_chunks((10, 20), np.float64, self.desired_chunk_size_bytes), (1, 10, 20))
+        self.assertEqual(plan_chunks((10, 20), np.float64, 10 * 20 * 8 * 4, pack_records=True), (4, 10, 20))
+        self.assertEqual(plan_chunks((), np.float64, 800, pack_records=True), (100, ))
+        self.assertEqual(plan_chunks((), np.float64, 800, pack_records=True, expected_n_records=10), (10, ))
+        self.assertIs(plan_chunks((10, 20), np.float64, -1), True)
+
+    def test_time_series(self):
+        chunks = plan_chunks((10, 10000, 200), np.float32, self.desired_chunk_size_bytes,
+                             read_pattern=ReadPattern.TIME_SERIES)
+        self.assertEqual(chunks[0], DEFAULT_TIME_SERIES_ROWS)
+        self.assertLessEqual(self.chunk_bytes(chunks, np.float32), self.desired_chunk_size_bytes)
+        self.assertGreater(self.chunk_bytes(chunks, np.float32), self.desired_chunk_size_bytes / 2)
+
+        chunks = plan_chunks((100, 200), np.float64, self.desired_chunk_size_bytes,
+                             read_pattern=ReadPattern.TIME_SERIES, expected_n_records=500)
+        self.assertEqual(chunks[0], 500)
+        self.assertLessEqual(self.chunk_bytes(chunks, np.float64), self.desired_chunk_size_bytes)
+
+    def test_whole_run(self):
+        chunks = plan_chunks((10, 20), np.float64, self.desired_chunk_size_bytes, read_pattern=ReadPattern.WHOLE_RUN)
+        self.assertEqual(chunks, (self.desired_chunk_size_bytes // (10 * 20 * 8), 10, 20))
+
+        # Contiguous slabs for records larger than a chunk
+        chunks = plan_chunks((10, 1000, 200), np.float64, self.desired_chunk_size_bytes,
+                             read_pattern=ReadPattern.WHOLE_RUN)
+        self.assertEqual(chunks, (1, 1, 655, 200))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from simrecorder import CompressionType, DatastoreType, HDF5DataStore, Recorder, ZarrDataStore
+from simrecorder.codec_selection import CodecTrial, select_codec
+
+
+class TestCodecSelection(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        # Compressible (few distinct values) and incompressible records
+        self.compressible = np.random.randint(0, 10, size=(20, 100, 100)).astype(np.float32)
+        self.random = np.random.rand(20, 100, 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_select_codec(self):
+        trials = [CodecTrial('none', 1., np.inf), CodecTrial('fast', 2., 500.), CodecTrial('small', 4., 50.)]
+        self.assertEqual(select_codec(trials, 100.).codec, 'fast')
+        self.assertEqual(select_codec(trials, 10.).codec, 'small')
+        # If nothing is fast enough, the fastest codec is used
+        self.assertEqual(select_codec(trials[1:], 1000.).codec, 'fast')
+
+    def check_selection(self, selection, min_write_mb_per_s):
+        self.assertEqual(selection['min_write_mb_per_s'], min_write_mb_per_s)
+        self.assertGreaterEqual(selection['mb_per_s'], min_write_mb_per_s)
+
+    def test_hdf5_auto(self):
+        pth = os.path.join(self.data_dir, 'data.h5')
+        recorder = Recorder(HDF5DataStore(pth, compression='auto', min_write_mb_per_s=10.))
+        for compressible, random in zip(self.compressible, self.random):
+            recorder.record('compressible', compressible)
+            recorder.record('random', random)
+        recorder.record('other', {'name': 'obj'})
+        recorder.close()
+
+        recorder = Recorder(HDF5DataStore(pth))
+        self.assertTrue(np.array_equal(np.array(recorder.get_all('compressible')), self.compressible))
+        self.assertTrue(np.array_equal(np.array(recorder.get_all('random')), self.random))
+        self.assertEqual([{'name': 'obj'}], list(recorder.get_all('other')))
+        d = recorder.get_all('compressible').array
+        selection = json.loads(d.attrs['compression_selection'])
+        self.check_selection(selection, 10.)
+        self.assertGreater(selection['ratio'], 2.)
+        self.assertIsNotNone(d.compression)
+        recorder.close()
+
+    def test_zarr_auto(self):
+        pth = os.path.join(self.data_dir, 'data.zarr')
+        recorder = Recorder(ZarrDataStore(pth, datastore_type=DatastoreType.DIRECTORY,
+                                          compression_type=CompressionType.AUTO, min_write_mb_per_s=10.))
+        for compressible, random in zip(self.compressible, self.random):
+            recorder.record('compressible', compressible)
+            recorder.record('random', random)
+        recorder.record('other', {'name': 'obj'})
+        recorder.close()
+
+        recorder = Recorder(ZarrDataStore(pth, datastore_type=DatastoreType.DIRECTORY))
+        self.assertTrue(np.array_equal(np.array(recorder.get_all('compressible')), self.compressible))
+        self.assertTrue(np.array_equal(np.array(recorder.get_all('random')), self.random))
+        self.assertEqual([{'name': 'obj'}], list(recorder.get_all('other')))
+        d = recorder.get_all('compressible').array
+        selection = d.attrs['compression_selection']
+        self.check_selection(selection, 10.)
+        self.assertGreater(selection['ratio'], 2.)
+        self.assertEqual(selection['codec'], repr(d.compressor))
+        recorder.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
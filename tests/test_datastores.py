@@ -1,11 +1,13 @@
+import multiprocessing
 import os
 import shutil
 import unittest
 
 import numpy as np
 
-from simrecorder import (HDF5DataStore, InMemoryDataStore, Recorder,
-                         RedisDataStore, RedisServer, ZarrDataStore, DatastoreType, CompressionType)
+from simrecorder import (HDF5DataStore, InMemoryDataStore, MemmapDataStore, Recorder, TieredDataStore, EvictionPolicy,
+                         RedisDataStore, RedisServer, ZarrDataStore, DatastoreType, CompressionType, ObjectCodec)
+from simrecorder.memmap_datastore import HEADER_NBYTES
 
 
 class TestDatastores(unittest.TestCase):
@@ -49,6 +51,197 @@ class TestDatastores(unittest.TestCase):
         recorder.close()
         ## END READ
 
+    def test_hdf5datastore_buffered_list(self):
+        ## WRITE
+        self.file_pth = os.path.join(self.data_dir, 'data.h5')
+        # Small chunks so that several chunks and a partial one are written
+        hdf5_datastore = HDF5DataStore(self.file_pth, desired_chunk_size_bytes=3 * self.arrays[0].nbytes,
+                                       buffered_append=True, flush_every_n_records=4)
+        recorder = Recorder(hdf5_datastore)
+
+        for i in range(self.n_arrays):
+            array = self.arrays[i]
+            recorder.record(self.key, array)
+        self.assertEqual(hdf5_datastore.f[self.key].chunks[0], 3)
+        recorder.close()
+        ## END WRITE
+
+        ## READ
+        hdf5_datastore = HDF5DataStore(self.file_pth)
+        recorder = Recorder(hdf5_datastore)
+
+        l = recorder.get_all(self.key)
+        l = np.array(l)
+        self.assertEqual(l.shape, self.arrays.shape)
+        self.assertTrue((self.arrays == l).all())
+
+        recorder.close()
+        ## END READ
+
+    def test_hdf5datastore_object(self):
+        test_list = [dict(step=i, name='step {}'.format(i), values=[np.random.rand(3, 1), np.array([])])
+                     for i in range(self.n_arrays)]
+        for buffered_append in [False, True]:
+            ## WRITE
+            self.file_pth = os.path.join(self.data_dir, 'data-{}.h5'.format(buffered_append))
+            hdf5_datastore = HDF5DataStore(self.file_pth, desired_chunk_size_bytes=1024,
+                                           buffered_append=buffered_append)
+            recorder = Recorder(hdf5_datastore)
+            for obj in test_list:
+                recorder.record(self.key, obj)
+                recorder.record('other', obj['name'])
+            # Everything is packed in two datasets per key
+            self.assertEqual(set(hdf5_datastore.f[self.key].keys()), {'data', 'offsets'})
+            recorder.close()
+            ## END WRITE
+
+            ## READ
+            hdf5_datastore = HDF5DataStore(self.file_pth)
+            recorder = Recorder(hdf5_datastore)
+
+            l = recorder.get_all(self.key)
+            self.assertEqual(len(l), self.n_arrays)
+            for obj, read_obj in zip(test_list, l):
+                self.assertEqual(obj['step'], read_obj['step'])
+                self.assertEqual(obj['name'], read_obj['name'])
+                self.assertTrue((obj['values'][0] == read_obj['values'][0]).all())
+            self.assertEqual([obj['name'] for obj in test_list], list(recorder.get_all('other')))
+
+            recorder.close()
+            ## END READ
+
+    def test_hdf5datastore_object_unclosed(self):
+        self.file_pth = os.path.join(self.data_dir, 'data.h5')
+        hdf5_datastore = HDF5DataStore(self.file_pth)
+        for i in range(5):
+            hdf5_datastore.append(self.key, dict(step=i))
+        # As if the process was killed: the log is never trimmed
+        hdf5_datastore.f.close()
+
+        hdf5_datastore = HDF5DataStore(self.file_pth)
+        self.assertEqual([dict(step=i) for i in range(5)], list(hdf5_datastore.get_all(self.key)))
+        hdf5_datastore.close()
+
+    def test_hdf5datastore_list_scalar(self):
+        for buffered_append in [False, True]:
+            ## WRITE
+            self.file_pth = os.path.join(self.data_dir, 'data-{}.h5'.format(buffered_append))
+            hdf5_datastore = HDF5DataStore(self.file_pth, buffered_append=buffered_append)
+            recorder = Recorder(hdf5_datastore)
+
+            for i in range(1000):
+                recorder.record(self.key, float(i))
+                recorder.record('spikes', np.int32(i % 7))
+                # Python ints and floats can be mixed
+                recorder.record('loss', i if i % 2 == 0 else i + 0.5)
+            with self.assertRaises(TypeError):
+                recorder.record('spikes', 0.5)
+            recorder.close()
+            ## END WRITE
+
+            ## READ
+            hdf5_datastore = HDF5DataStore(self.file_pth)
+            recorder = Recorder(hdf5_datastore)
+
+            l = recorder.get_all(self.key)
+            self.assertEqual(l.shape, (1000, ))
+            self.assertTrue((np.arange(1000.) == np.array(l)).all())
+            l = recorder.get_all('spikes')
+            self.assertEqual(l.dtype, np.int32)
+            self.assertTrue((np.arange(1000) % 7 == np.array(l)).all())
+            l = recorder.get_all('loss')
+            self.assertEqual(l.dtype, np.float64)
+            self.assertTrue((np.arange(1000) + np.arange(1000) % 2 * 0.5 == np.array(l)).all())
+
+            recorder.close()
+            ## END READ
+
+    def test_hdf5datastore_list_scalar_int64(self):
+        for buffered_append in [False, True]:
+            self.file_pth = os.path.join(self.data_dir, 'data-{}.h5'.format(buffered_append))
+            hdf5_datastore = HDF5DataStore(self.file_pth, buffered_append=buffered_append)
+            # Python ints are stored as int64, without the precision loss of float64 above 2**53
+            for i in [2 ** 53 + 1, 2 ** 53 + 3]:
+                hdf5_datastore.append('step', i)
+            # A key of ints is converted to float64 by the first float
+            hdf5_datastore.append('loss', 1)
+            hdf5_datastore.append('loss', 0.5)
+            hdf5_datastore.append('loss', 2)
+            # ... unless its ints can't be converted exactly
+            with self.assertRaises(TypeError):
+                hdf5_datastore.append('step', 0.5)
+            hdf5_datastore.append('lr', 0.5)
+            with self.assertRaises(TypeError):
+                hdf5_datastore.append('lr', 2 ** 53 + 1)
+            hdf5_datastore.close()
+
+            hdf5_datastore = HDF5DataStore(self.file_pth)
+            l = hdf5_datastore.get_all('step')
+            self.assertEqual(l.dtype, np.int64)
+            self.assertEqual(np.array(l).tolist(), [2 ** 53 + 1, 2 ** 53 + 3])
+            l = hdf5_datastore.get_all('loss')
+            self.assertEqual(l.dtype, np.float64)
+            self.assertEqual(np.array(l).tolist(), [1., 0.5, 2.])
+            self.assertEqual(np.array(hdf5_datastore.get_all('lr')).tolist(), [0.5])
+            hdf5_datastore.close()
+
+    def test_hdf5datastore_extend_scalars(self):
+        self.file_pth = os.path.join(self.data_dir, 'data.h5')
+        hdf5_datastore = HDF5DataStore(self.file_pth)
+        hdf5_datastore.extend('loss', np.arange(3.))
+        hdf5_datastore.extend('loss', np.arange(3., 5.))
+        hdf5_datastore.extend('step', np.arange(3))
+        # A key of ints is converted to float64 by a batch of floats
+        hdf5_datastore.extend('step', np.array([0.5, 1.5]))
+        hdf5_datastore.extend('count', np.arange(3, dtype=np.int32))
+        with self.assertRaises(TypeError):
+            hdf5_datastore.extend('count', np.array([0.5]))
+        hdf5_datastore.close()
+
+        hdf5_datastore = HDF5DataStore(self.file_pth)
+        l = hdf5_datastore.get_all('loss')
+        self.assertEqual(l.dtype, np.float64)
+        self.assertEqual(np.array(l).tolist(), [0., 1., 2., 3., 4.])
+        l = hdf5_datastore.get_all('step')
+        self.assertEqual(l.dtype, np.float64)
+        self.assertEqual(np.array(l).tolist(), [0., 1., 2., 0.5, 1.5])
+        self.assertEqual(np.array(hdf5_datastore.get_all('count')).tolist(), [0, 1, 2])
+        hdf5_datastore.close()
+
+    def test_hdf5datastore_mixed_objects_and_numbers(self):
+        for buffered_append in [False, True]:
+            self.file_pth = os.path.join(self.data_dir, 'data-{}.h5'.format(buffered_append))
+            hdf5_datastore = HDF5DataStore(self.file_pth, buffered_append=buffered_append)
+            # Numbers appended to a key of objects are pickled into its packed log
+            for key, value in [('object-int', 1), ('object-float', 0.5)]:
+                hdf5_datastore.append(key, None)
+                hdf5_datastore.append(key, value)
+            # Objects can't be appended to a key of numbers
+            for key, value in [('int-object', 1), ('float-object', 0.5)]:
+                hdf5_datastore.append(key, value)
+                with self.assertRaises(TypeError):
+                    hdf5_datastore.append(key, None)
+            hdf5_datastore.close()
+
+            hdf5_datastore = HDF5DataStore(self.file_pth)
+            self.assertEqual(list(hdf5_datastore.get_all('object-int')), [None, 1])
+            self.assertEqual(list(hdf5_datastore.get_all('object-float')), [None, 0.5])
+            self.assertEqual(np.array(hdf5_datastore.get_all('int-object')).tolist(), [1])
+            self.assertEqual(np.array(hdf5_datastore.get_all('float-object')).tolist(), [0.5])
+            hdf5_datastore.close()
+
+    def test_hdf5datastore_list_scalar_unclosed(self):
+        self.file_pth = os.path.join(self.data_dir, 'data.h5')
+        hdf5_datastore = HDF5DataStore(self.file_pth)
+        for i in range(1000):
+            hdf5_datastore.append(self.key, float(i))
+        # Without buffered_append, every scalar is written right away, even if the datastore is never closed
+        hdf5_datastore.f.close()
+
+        hdf5_datastore = HDF5DataStore(self.file_pth)
+        self.assertTrue((np.arange(1000.) == np.array(hdf5_datastore.get_all(self.key))).all())
+        hdf5_datastore.close()
+
     def test_hdf5datastore_single_value(self):
         ## WRITE
         self.file_pth = os.path.join(self.data_dir, 'data.h5')
@@ -92,6 +285,37 @@ class TestDatastores(unittest.TestCase):
         recorder.close()
         ## END READ
 
+    def test_inmemorydatastore_growth_buffer(self):
+        inmem_datastore = InMemoryDataStore(initial_capacity=4)
+        recorder = Recorder(inmem_datastore)
+
+        for i in range(self.n_arrays):
+            recorder.record(self.key, self.arrays[i])
+            recorder.record('scalar', float(i))
+        # Arrays are copied into one contiguous buffer, and get_all returns a view of it
+        l = recorder.get_all(self.key).to_numpy()
+        self.assertTrue((self.arrays == l).all())
+        self.assertIs(l.base, inmem_datastore.data[self.key].array)
+        self.assertEqual(inmem_datastore.memory_usage(self.key), 16 * self.arrays[0].nbytes)
+        self.assertEqual(inmem_datastore.memory_usage()['scalar'], 16 * 8)
+
+        # A record of a different dtype makes the key fall back to a list
+        recorder.record('scalar', 'last')
+        self.assertEqual(list(range(self.n_arrays)) + ['last'], list(recorder.get_all('scalar')))
+        self.assertGreater(inmem_datastore.memory_usage('scalar'), 0)
+        recorder.close()
+
+    def test_inmemorydatastore_growth_buffer_large_records(self):
+        inmem_datastore = InMemoryDataStore()
+        large = np.zeros((1024, 1024))
+        # Space for only one record is allocated for a key of records larger than INITIAL_CAPACITY_BYTES
+        inmem_datastore.append('large', large)
+        self.assertEqual(inmem_datastore.memory_usage('large'), large.nbytes)
+        inmem_datastore.append('large', large)
+        inmem_datastore.append('large', large)
+        self.assertEqual(inmem_datastore.memory_usage('large'), 4 * large.nbytes)
+        self.assertEqual(len(inmem_datastore.get_all('large')), 3)
+
     def test_inmemorydatastore_single_value(self):
         ## WRITE
         inmem_datastore = InMemoryDataStore()
@@ -113,6 +337,135 @@ class TestDatastores(unittest.TestCase):
         recorder.close()
         ## END READ
 
+    def test_memmapdatastore_list(self):
+        ## WRITE
+        self.dir_pth = os.path.join(self.data_dir, 'data.memmap')
+        # Small initial capacity so that the files are grown a few times
+        memmap_datastore = MemmapDataStore(self.dir_pth, initial_capacity=3)
+        recorder = Recorder(memmap_datastore)
+
+        for i in range(self.n_arrays // 2):
+            recorder.record(self.key, self.arrays[i])
+            recorder.record('scalar', float(i))
+        # Keys can be read while they are being appended to
+        self.assertTrue((self.arrays[:self.n_arrays // 2] == np.array(recorder.get_all(self.key))).all())
+        recorder.close()
+
+        # Appending continues after reopening
+        recorder = Recorder(MemmapDataStore(self.dir_pth))
+        for i in range(self.n_arrays // 2, self.n_arrays):
+            recorder.record(self.key, self.arrays[i])
+        with self.assertRaises(TypeError):
+            recorder.record('other', {'name': 'obj'})
+        recorder.record('count', 1)
+        recorder.record('count', np.int32(2))
+        # Records are never truncated or broadcast to the dtype and shape of the key, also after reopening
+        with self.assertRaises(TypeError):
+            recorder.record('count', 0.5)
+        with self.assertRaises(TypeError):
+            recorder.record('scalar', 1 + 1j)
+        with self.assertRaises(ValueError):
+            recorder.record(self.key, self.arrays[0, 0])
+        recorder.close()
+        ## END WRITE
+
+        ## READ
+        memmap_datastore = MemmapDataStore(self.dir_pth)
+        recorder = Recorder(memmap_datastore)
+
+        l = recorder.get_all(self.key)
+        self.assertIsInstance(l.to_numpy(), np.memmap)
+        self.assertEqual(os.path.getsize(os.path.join(self.dir_pth, 'train', 'what.bin')),
+                         HEADER_NBYTES + self.arrays.nbytes)
+        self.assertTrue((self.arrays == np.array(l)).all())
+        self.assertEqual(list(range(self.n_arrays // 2)), np.array(recorder.get_all('scalar')).tolist())
+        self.assertEqual([1, 2], np.array(recorder.get_all('count')).tolist())
+        self.assertIsNone(recorder.get_all('missing'))
+
+        recorder.close()
+        ## END READ
+
+    def test_memmapdatastore_list_killed(self):
+        self.dir_pth = os.path.join(self.data_dir, 'data.memmap')
+
+        def record_and_kill(start, stop):
+            memmap_datastore = MemmapDataStore(self.dir_pth, initial_capacity=3)
+            for i in range(start, stop):
+                memmap_datastore.append(self.key, self.arrays[i])
+            # Killed without closing or flushing the datastore
+            os._exit(0)
+
+        # The records of a killed process are kept, and appending after reopening doesn't overwrite them
+        for start, stop in [(0, self.n_arrays // 2), (self.n_arrays // 2, self.n_arrays)]:
+            process = multiprocessing.get_context('fork').Process(target=record_and_kill, args=(start, stop))
+            process.start()
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+        memmap_datastore = MemmapDataStore(self.dir_pth)
+        self.assertTrue((self.arrays == np.array(memmap_datastore.get_all(self.key))).all())
+        memmap_datastore.close()
+
+    def test_memmapdatastore_single_value(self):
+        ## WRITE
+        self.dir_pth = os.path.join(self.data_dir, 'data.memmap')
+        memmap_datastore = MemmapDataStore(self.dir_pth)
+        recorder = Recorder(memmap_datastore)
+        recorder.set(self.key, self.val1)
+        recorder.set(self.key, self.val)
+        recorder.set('config', {'name': 'run'})
+        recorder.close()
+        ## END WRITE
+
+        ## READ
+        memmap_datastore = MemmapDataStore(self.dir_pth)
+        recorder = Recorder(memmap_datastore)
+
+        l = recorder.get(self.key)
+        l = np.array(l)
+        self.assertTrue((self.val == l).all())
+        self.assertEqual({'name': 'run'}, recorder.get('config'))
+
+        recorder.close()
+        ## END READ
+
+    def test_tiereddatastore_list(self):
+        for persistent in ['hdf5', 'zarr']:
+            for eviction_policy in EvictionPolicy:
+                ## WRITE
+                if persistent == 'hdf5':
+                    self.file_pth = os.path.join(self.data_dir, 'data-{}.h5'.format(eviction_policy.name))
+                    persistent_datastore = HDF5DataStore(self.file_pth)
+                else:
+                    self.file_pth = os.path.join(self.data_dir, 'data-{}.zarr'.format(eviction_policy.name))
+                    persistent_datastore = ZarrDataStore(self.file_pth, datastore_type=DatastoreType.DIRECTORY)
+                # Room for about 3 arrays, so that eviction happens a few times
+                tiered_datastore = TieredDataStore(persistent_datastore, memory_budget_bytes=3.5 * self.val.nbytes,
+                                                   eviction_policy=eviction_policy)
+                recorder = Recorder(tiered_datastore)
+
+                for i in range(self.n_arrays):
+                    recorder.record(self.key, self.arrays[i])
+                    recorder.record('other', {'step': i})
+                    # Both tiers are combined while recording
+                    self.assertTrue((self.arrays[:i + 1] == np.array(recorder.get_all(self.key))).all())
+                self.assertGreater(tiered_datastore.n_evictions, 0)
+                self.assertLessEqual(sum(tiered_datastore.memory_usage().values()), 3.5 * self.val.nbytes)
+                self.assertEqual([{'step': i} for i in range(self.n_arrays)], list(recorder.get_all('other')))
+                recorder.close()
+                ## END WRITE
+
+                ## READ
+                if persistent == 'hdf5':
+                    persistent_datastore = HDF5DataStore(self.file_pth)
+                else:
+                    persistent_datastore = ZarrDataStore(self.file_pth, datastore_type=DatastoreType.DIRECTORY)
+                recorder = Recorder(persistent_datastore)
+                self.assertTrue((self.arrays == np.array(recorder.get_all(self.key))).all())
+                self.assertEqual([{'step': i} for i in range(self.n_arrays)], list(recorder.get_all('other')))
+                recorder.close()
+                ## END READ
+
     def test_redisdatastore_list(self):
         with RedisServer(data_directory=self.data_dir):
             ## WRITE
@@ -160,6 +513,99 @@ class TestDatastores(unittest.TestCase):
             recorder.close()
             ## END READ
 
+    def test_redisdatastore_parts(self):
+        # Every array is split into several parts
+        part_size_bytes = self.val.nbytes // 3
+        with RedisServer(data_directory=self.data_dir, part_size_bytes=part_size_bytes,
+                         use_compression=False):
+            ## WRITE
+            redis_datastore = RedisDataStore(server_host='localhost')
+            recorder = Recorder(redis_datastore)
+
+            for i in range(self.n_arrays):
+                recorder.record(self.key, self.arrays[i])
+            recorder.set('single', self.val)
+            recorder.close()
+            ## END WRITE
+
+            ## READ
+            redis_datastore = RedisDataStore(server_host='localhost', n_part_fetch_threads=3)
+            recorder = Recorder(redis_datastore)
+
+            l = recorder.get_all(self.key)
+            self.assertTrue((self.arrays == np.array(l)).all())
+            self.assertTrue((self.arrays[1] == l[1]).all())
+            self.assertTrue((self.val == recorder.get('single')).all())
+
+            recorder.close()
+            ## END READ
+
+    def test_redisdatastore_parts_overwrite(self):
+        unix_socket_path = os.path.join(self.data_dir, 'redis.sock')
+        with RedisServer(data_directory=self.data_dir, redis_port='random', unix_socket_path=unix_socket_path,
+                         part_size_bytes=self.val.nbytes // 3, use_compression=False) as server:
+            for pipeline_max_commands in [None, 100]:
+                redis_datastore = RedisDataStore(server_host='localhost', redis_port=server.port,
+                                                 pipeline_max_commands=pipeline_max_commands)
+                redis_datastore.rj.config_resetstat()
+                # Small values are set without deleting any parts
+                redis_datastore.set('small', 1)
+                redis_datastore.set('small', 2)
+                redis_datastore.flush()
+                self.assertNotIn('cmdstat_del', redis_datastore.rj.info('commandstats'))
+                self.assertEqual(redis_datastore.get('small'), 2)
+
+                # The parts of a large value are deleted when it is overwritten with a small one
+                redis_datastore.set('value', self.val)
+                redis_datastore.flush()
+                self.assertTrue(redis_datastore.rj.exists('value/__parts__'))
+                self.assertTrue((redis_datastore.get('value') == self.val).all())
+                redis_datastore.set('value', 1)
+                redis_datastore.flush()
+                self.assertFalse(redis_datastore.rj.exists('value/__parts__'))
+                self.assertEqual(redis_datastore.get('value'), 1)
+                redis_datastore.close()
+
+    def test_redisdatastore_unix_socket_config_file(self):
+        unix_socket_path = os.path.join(self.data_dir, 'redis.sock')
+        config_file_path = os.path.join(self.data_dir, 'redis.conf')
+        with open(config_file_path, 'w') as f:
+            # The server must not daemonize anyway
+            f.write('daemonize yes\nmaxmemory-policy allkeys-lru\n')
+        with RedisServer(data_directory=self.data_dir, redis_port='random', unix_socket_path=unix_socket_path,
+                         config_file_path=config_file_path) as server:
+            redis_datastore = RedisDataStore(server_host='localhost', redis_port=server.port)
+            self.assertEqual(redis_datastore.rj.config_get('maxmemory-policy')['maxmemory-policy'], 'allkeys-lru')
+            redis_datastore.close()
+
+    def test_redisdatastore_unix_socket_fork(self):
+        unix_socket_path = os.path.join(self.data_dir, 'redis.sock')
+        with RedisServer(data_directory=self.data_dir, redis_port='random', unix_socket_path=unix_socket_path) as server:
+            redis_datastore = RedisDataStore(server_host='localhost', redis_port=server.port, pipeline_max_commands=100)
+            self.assertEqual(redis_datastore.unix_socket_path, unix_socket_path)
+            recorder = Recorder(redis_datastore)
+            # Still pending in the pipeline at the time of the fork
+            recorder.record(self.key, self.arrays[0])
+
+            def record_in_child():
+                recorder.record(self.key, self.arrays[1])
+                recorder.flush()
+
+            process = multiprocessing.get_context('fork').Process(target=record_in_child)
+            process.start()
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+            recorder.flush()
+
+            # The child flushed first
+            l = np.array(recorder.get_all(self.key))
+            self.assertTrue((self.arrays[[1, 0]] == l).all())
+            # Also readable over TCP
+            tcp_datastore = RedisDataStore(server_host='localhost', redis_port=server.port, unix_socket_path=None)
+            self.assertIsNone(tcp_datastore.unix_socket_path)
+            self.assertEqual(len(tcp_datastore.get_all(self.key)), 2)
+            recorder.close()
+
     def test_zarrdatastore_object(self):
         ## WRITE
         assert not os.path.exists(os.path.join(self.data_dir, 'test.mdb'))
@@ -187,6 +633,51 @@ class TestDatastores(unittest.TestCase):
         recorder.close()
         ## END READ
 
+    def test_zarrdatastore_object_msgpack_and_ragged(self):
+        data_pth = os.path.join(self.data_dir, 'test.mdb')
+        spike_trains = [np.random.randint(1000, size=n).astype(np.int32) for n in [3, 0, 10, 1, 7]]
+        test_list = [dict(step=i, name='step {}'.format(i)) for i in range(len(spike_trains))]
+        ## WRITE
+        zarr_datastore = ZarrDataStore(data_pth, datastore_type=DatastoreType.DIRECTORY,
+                                       compression_type=CompressionType.LZMA, object_codec=ObjectCodec.MSGPACK,
+                                       ragged_keys=['spikes'])
+        recorder = Recorder(zarr_datastore)
+        for obj, spike_train in zip(test_list, spike_trains):
+            recorder.record(self.key, obj)
+            recorder.record('spikes', spike_train)
+        recorder.close()
+        # Each key is one log, not one array per record
+        self.assertEqual(sorted(os.listdir(os.path.join(data_pth, 'spikes'))), ['.zattrs', '.zgroup', 'offsets', 'values'])
+        ## END WRITE
+
+        ## READ
+        zarr_datastore = ZarrDataStore(data_pth, datastore_type=DatastoreType.DIRECTORY,
+                                       compression_type=CompressionType.LZMA)
+        recorder = Recorder(zarr_datastore)
+        self.assertEqual(test_list, list(recorder.get_all(self.key)))
+        l = recorder.get_all('spikes')
+        self.assertEqual(len(l), len(spike_trains))
+        for spike_train, read_spike_train in zip(spike_trains, l):
+            self.assertEqual(read_spike_train.dtype, np.int32)
+            self.assertTrue((spike_train == read_spike_train).all())
+        recorder.close()
+        ## END READ
+
+    def test_zarrdatastore_object_unclosed(self):
+        data_pth = os.path.join(self.data_dir, 'test.mdb')
+        zarr_datastore = ZarrDataStore(data_pth, datastore_type=DatastoreType.DIRECTORY, ragged_keys=['spikes'])
+        for i in range(5):
+            zarr_datastore.append(self.key, dict(step=i))
+            zarr_datastore.append('spikes', np.arange(i))
+        # Reopened without closing, so the logs are never trimmed
+
+        zarr_datastore = ZarrDataStore(data_pth, datastore_type=DatastoreType.DIRECTORY)
+        self.assertEqual([dict(step=i) for i in range(5)], list(zarr_datastore.get_all(self.key)))
+        l = zarr_datastore.get_all('spikes')
+        self.assertEqual(len(l), 5)
+        self.assertTrue((np.arange(4) == l[4]).all())
+        zarr_datastore.close()
+
     def test_zarrdatastore_list(self):
         ## WRITE
         assert not os.path.exists(os.path.join(self.data_dir, 'test.mdb'))
@@ -232,6 +723,45 @@ class TestDatastores(unittest.TestCase):
         recorder.close()
         ## END READ
 
+    def test_zarrdatastore_buffered_list(self):
+        for datastore_type in [DatastoreType.DIRECTORY, DatastoreType.LMDB]:
+            data_pth = os.path.join(self.data_dir, 'test-{}.mdb'.format(datastore_type.name))
+            ## WRITE
+            # Small chunks so that several chunks and a partial one are written
+            zarr_datastore = ZarrDataStore(data_pth, desired_chunk_size_bytes=3 * self.arrays[0].nbytes,
+                                           datastore_type=datastore_type, compression_type=CompressionType.LZMA,
+                                           buffered_append=True, flush_every_n_records=4)
+            recorder = Recorder(zarr_datastore)
+
+            for i in range(self.n_arrays):
+                recorder.record(self.key, self.arrays[i])
+                recorder.record('scalar', float(i))
+                recorder.record('spikes', np.arange(3, dtype=np.int32))
+            # Records are never truncated to the dtype of the key
+            with self.assertRaises(TypeError):
+                recorder.record('spikes', np.full(3, 0.5))
+            with self.assertRaises(TypeError):
+                recorder.record('spikes', 0.5)
+            recorder.close()
+            ## END WRITE
+
+            ## READ
+            zarr_datastore = ZarrDataStore(data_pth, datastore_type=datastore_type,
+                                           compression_type=CompressionType.LZMA)
+            recorder = Recorder(zarr_datastore)
+
+            l = np.array(recorder.get_all(self.key))
+            self.assertEqual(l.shape, self.arrays.shape)
+            self.assertTrue((self.arrays == l).all())
+            l = np.array(recorder.get_all('scalar'))
+            self.assertTrue((np.arange(self.n_arrays) == l).all())
+            l = recorder.get_all('spikes')
+            self.assertEqual(l.dtype, np.int32)
+            self.assertEqual(l.shape, (self.n_arrays, 3))
+
+            recorder.close()
+            ## END READ
+
     def test_zarrdatastore_single_value(self):
         ## WRITE
         assert not os.path.exists(os.path.join(self.data_dir, 'test.mdb'))
@@ -0,0 +1,61 @@
+import json
+import subprocess
+import sys
+import unittest
+
+import simrecorder
+from simrecorder import InMemoryDataStore, create_datastore, register_datastore
+from simrecorder.registry import available_datastores, get_datastore_class
+
+HEAVY_MODULES = ['h5py', 'h5py_cache', 'zarr', 'numcodecs', 'redis', 'lz4', 'pyarrow', 'msgpack']
+
+
+def modules_loaded_by(code):
+    """
+    Runs `code` in a fresh interpreter and returns the top-level names of all modules loaded afterwards
+    """
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        code + '\nimport json, sys\nprint(json.dumps(sorted({m.split(".")[0] for m in sys.modules})))'
+    ])
+    return set(json.loads(output.decode().splitlines()[-1]))
+
+
+class TestImport(unittest.TestCase):
+
+    def test_no_heavy_imports(self):
+        loaded = modules_loaded_by("import simrecorder\n"
+                                   "from simrecorder import Recorder, InMemoryDataStore\n"
+                                   "Recorder(InMemoryDataStore()).record('a', 1)")
+        self.assertEqual([], [m for m in HEAVY_MODULES if m in loaded])
+
+    def test_backend_imports_only_its_dependencies(self):
+        loaded = modules_loaded_by("from simrecorder import HDF5DataStore, ZarrDataStore, RedisDataStore")
+        self.assertEqual([], [m for m in HEAVY_MODULES if m in loaded])
+
+    def test_lazy_attributes(self):
+        from simrecorder.hdf_datastore import HDF5DataStore
+        self.assertIs(simrecorder.HDF5DataStore, HDF5DataStore)
+        self.assertIn('ZarrDataStore', dir(simrecorder))
+        with self.assertRaises(AttributeError):
+            simrecorder.NoSuchDataStore
+
+    def test_registry(self):
+        self.assertIs(get_datastore_class('inmemory'), InMemoryDataStore)
+        self.assertIs(get_datastore_class('hdf5'), simrecorder.HDF5DataStore)
+        self.assertIsInstance(create_datastore('inmemory'), InMemoryDataStore)
+
+        class MyDataStore(InMemoryDataStore):
+            pass
+
+        register_datastore('test-mystore', MyDataStore)
+        register_datastore('test-lazy', 'simrecorder.memmap_datastore:MemmapDataStore')
+        self.assertIn('test-mystore', available_datastores())
+        self.assertIsInstance(create_datastore('test-mystore'), MyDataStore)
+        self.assertIs(get_datastore_class('test-lazy'), simrecorder.MemmapDataStore)
+        with self.assertRaises(KeyError):
+            get_datastore_class('test-missing')
+
+
+if __name__ == '__main__':
+    unittest.main()
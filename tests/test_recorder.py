@@ -0,0 +1,152 @@
+import os
+import shutil
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from simrecorder import (DatastoreType, DataStoreError, HDF5DataStore, InMemoryDataStore, QueueFullPolicy, Recorder,
+                         ZarrDataStore)
+
+
+class FailingDataStore(InMemoryDataStore):
+    """
+    Datastore that fails on every append
+    """
+
+    def append(self, key, obj):
+        raise ValueError("Cannot append {}".format(key))
+
+
+class BlockingDataStore(InMemoryDataStore):
+    """
+    Datastore whose appends wait until `event` is set
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.event = threading.Event()
+
+    def append(self, key, obj):
+        self.event.wait()
+        super().append(key, obj)
+
+
+class SlowDataStore(InMemoryDataStore):
+    """
+    Datastore whose appends take `delay` seconds
+    """
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def append(self, key, obj):
+        time.sleep(self.delay)
+        super().append(key, obj)
+
+
+class TestAsyncRecorder(unittest.TestCase):
+    n_arrays = 10
+
+    def setUp(self):
+        self.arrays = np.random.rand(self.n_arrays, 10, 5, 2, 6)
+        self.data_dir = os.path.expanduser('~/output/tmp/recorder-test')
+        if os.path.exists(self.data_dir):
+            shutil.rmtree(self.data_dir)
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.key = 'train/what'
+
+    def test_async_list(self):
+        inmem_datastore = InMemoryDataStore()
+        hdf5_datastore = HDF5DataStore(os.path.join(self.data_dir, 'data.h5'))
+        recorder = Recorder(inmem_datastore, hdf5_datastore, asynchronous=True, n_writer_threads=2)
+
+        array = np.empty_like(self.arrays[0])
+        for i in range(self.n_arrays):
+            # The recorder must not keep a reference to the caller's buffer
+            array[...] = self.arrays[i]
+            recorder.record(self.key, array)
+            recorder.record('other', i)
+        recorder.flush()
+
+        self.assertTrue((self.arrays == np.array(recorder.get_all(self.key))).all())
+        self.assertTrue((self.arrays == np.array(recorder.get_all(self.key, datastore=hdf5_datastore))).all())
+        self.assertEqual(list(range(self.n_arrays)), list(recorder.get_all('other')))
+        recorder.close()
+
+    def test_async_threads_not_thread_safe(self):
+        zarr_datastore = ZarrDataStore(os.path.join(self.data_dir, 'data.zarr'), datastore_type=DatastoreType.DIRECTORY,
+                                       buffered_append=True, flush_every_n_records=7)
+        recorder = Recorder(zarr_datastore, asynchronous=True, n_writer_threads=4)
+        # The writer threads take turns, since the buffers of the datastore are shared by all keys
+        for i in range(self.n_arrays):
+            for j in range(8):
+                recorder.record('key{}'.format(j), self.arrays[i])
+        recorder.flush()
+        for j in range(8):
+            self.assertTrue((self.arrays == np.array(recorder.get_all('key{}'.format(j)))).all())
+        recorder.close()
+
+    def test_async_errors(self):
+        failing_datastore = FailingDataStore()
+        recorder = Recorder(InMemoryDataStore(), failing_datastore, asynchronous=True)
+
+        recorder.record(self.key, self.arrays[0])
+        with self.assertRaises(DataStoreError) as cm:
+            recorder.flush()
+        self.assertEqual(len(cm.exception.errors), 1)
+        self.assertIs(cm.exception.errors[0][0], failing_datastore)
+        self.assertIsInstance(cm.exception.errors[0][1], ValueError)
+
+        recorder.record(self.key, self.arrays[0])
+        recorder.datastores[1].drain()
+        with self.assertRaises(DataStoreError):
+            recorder.record(self.key, self.arrays[1])
+        recorder.close()
+
+    def test_async_drop(self):
+        blocking_datastore = BlockingDataStore()
+        recorder = Recorder(blocking_datastore, asynchronous=True, max_queue_size=2,
+                            queue_full_policy=QueueFullPolicy.DROP)
+        for i in range(self.n_arrays):
+            recorder.record(self.key, i)
+        blocking_datastore.event.set()
+        recorder.flush()
+
+        n_stored = len(recorder.get_all(self.key))
+        self.assertEqual(n_stored + recorder.datastores[0].n_dropped, self.n_arrays)
+        self.assertLess(n_stored, self.n_arrays)
+        recorder.close()
+
+
+class TestParallelRecorder(unittest.TestCase):
+    n_records = 5
+    delay = 0.05
+
+    def test_parallel_fan_out(self):
+        datastores = [SlowDataStore(self.delay) for _ in range(4)]
+        recorder = Recorder(*datastores, parallel=True)
+        start = time.time()
+        for i in range(self.n_records):
+            recorder.record('key', i)
+        # Sequentially, this would take 4 * n_records * delay
+        self.assertLess(time.time() - start, 2 * self.n_records * self.delay)
+        for datastore in datastores:
+            self.assertEqual(list(range(self.n_records)), list(recorder.get_all('key', datastore=datastore)))
+        recorder.close()
+
+    def test_parallel_errors(self):
+        failing_datastores = [FailingDataStore(), FailingDataStore()]
+        inmem_datastore = InMemoryDataStore()
+        recorder = Recorder(failing_datastores[0], inmem_datastore, failing_datastores[1], parallel=True)
+        with self.assertRaises(DataStoreError) as cm:
+            recorder.record('key', 1)
+        self.assertEqual([datastore for datastore, _ in cm.exception.errors], failing_datastores)
+        self.assertEqual([1], list(recorder.get_all('key', datastore=inmem_datastore)))
+        recorder.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
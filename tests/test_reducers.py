@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from simrecorder import (ExponentialMovingAverage, HDF5DataStore, Histogram, InMemoryDataStore, MeanVariance, MinMax,
+                         Recorder, ReducerDataStore)
+
+
+class TestReducers(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        # Large offset, which loses precision if variances are computed from sums of squares
+        self.arrays = 1e6 + np.random.rand(100, 3, 4)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def check_reducers(self, update):
+        reducers = [MeanVariance(ddof=1), MinMax(), Histogram(bins=5, range=(1e6, 1e6 + 0.5)),
+                    ExponentialMovingAverage(alpha=0.1)]
+        for reducer in reducers:
+            update(reducer, self.arrays)
+        moments, extrema, histogram, ema = [reducer.result() for reducer in reducers]
+
+        self.assertEqual(moments['count'], len(self.arrays))
+        self.assertTrue(np.allclose(moments['mean'], self.arrays.mean(axis=0)))
+        self.assertTrue(np.allclose(moments['var'], self.arrays.var(axis=0, ddof=1), rtol=1e-6))
+        self.assertTrue(np.array_equal(extrema['min'], self.arrays.min(axis=0)))
+        self.assertTrue(np.array_equal(extrema['max'], self.arrays.max(axis=0)))
+        self.assertEqual(histogram['counts'].sum() + histogram['overflow'], self.arrays.size)
+        self.assertEqual(histogram['underflow'], 0)
+        expected_ema = self.arrays[0]
+        for x in self.arrays[1:]:
+            expected_ema = 0.1 * x + 0.9 * expected_ema
+        self.assertTrue(np.allclose(ema['ema'], expected_ema))
+
+    def test_update(self):
+        def update(reducer, xs):
+            for x in xs:
+                reducer.update(x)
+
+        self.check_reducers(update)
+
+    def test_update_batch(self):
+        def update(reducer, xs):
+            # Several batches, so that they are merged
+            for batch in np.array_split(xs, 3):
+                reducer.update_batch(batch)
+
+        self.check_reducers(update)
+
+    def test_reducer_datastore(self):
+        pth = os.path.join(self.data_dir, 'data.h5')
+        reducer_datastore = ReducerDataStore(
+            HDF5DataStore(pth), reducers={'train/*': [MinMax()], 'raw': []})
+        recorder = Recorder(reducer_datastore)
+        for i, array in enumerate(self.arrays):
+            recorder.record('rates', array)
+            recorder.record('train/loss', float(i))
+            recorder.record('raw', array)
+            recorder.record('info', {'step': i})
+        self.assertTrue(np.allclose(reducer_datastore.results('rates')['moments']['mean'], self.arrays.mean(axis=0)))
+        self.assertEqual(list(reducer_datastore.results('train/loss')), ['extrema'])
+        recorder.close()
+
+        recorder = Recorder(HDF5DataStore(pth))
+        self.assertTrue(np.allclose(np.array(recorder.get('reduced/rates/moments/mean')), self.arrays.mean(axis=0)))
+        self.assertTrue(np.array_equal(np.array(recorder.get('reduced/rates/extrema/max')), self.arrays.max(axis=0)))
+        self.assertEqual(np.array(recorder.get('reduced/train/loss/extrema/max')), len(self.arrays) - 1)
+        # Only records that were not reduced are stored
+        self.assertIsNone(recorder.get_all('rates'))
+        self.assertTrue(np.array_equal(np.array(recorder.get_all('raw')), self.arrays))
+        self.assertEqual([{'step': i} for i in range(len(self.arrays))], list(recorder.get_all('info')))
+        recorder.close()
+
+    def test_store_raw(self):
+        reducer_datastore = ReducerDataStore(InMemoryDataStore(), store_raw=True)
+        reducer_datastore.extend('rates', self.arrays)
+        reducer_datastore.append('rates', np.zeros(3))
+        self.assertTrue(np.array_equal(np.array(reducer_datastore.get_all('rates')[:len(self.arrays)]), self.arrays))
+        # The record of a different shape is stored, but not reduced
+        self.assertEqual(len(reducer_datastore.get_all('rates')), len(self.arrays) + 1)
+        self.assertEqual(reducer_datastore.results('rates')['moments']['count'], len(self.arrays))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from simrecorder import HDF5DataStore, InMemoryDataStore, Recorder, ZarrDataStore, DatastoreType
+from simrecorder.sequence import ArraySequence, ConcatSequence, ListSequence, PackedSequence, RecordSequence
+
+
+class TestRecordSequence(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.arrays = np.random.rand(25, 3, 4)
+        self.objects = [{'step': i, 'name': 'obj{}'.format(i)} for i in range(25)]
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def check_array_sequence(self, seq):
+        self.assertIsInstance(seq, RecordSequence)
+        self.assertEqual(len(seq), len(self.arrays))
+        self.assertTrue(np.array_equal(seq[3], self.arrays[3]))
+        self.assertTrue(np.array_equal(seq[-1], self.arrays[-1]))
+        self.assertTrue(np.array_equal(seq[5:12], self.arrays[5:12]))
+        self.assertTrue(np.array_equal(np.asarray(seq[2:20:3]), self.arrays[2:20:3]))
+        self.assertTrue(np.array_equal(seq[...], self.arrays))
+        self.assertTrue(np.array_equal(seq[[0, 2]], self.arrays[[0, 2]]))
+        self.assertTrue(np.array_equal(seq[np.array([4, -1, 4, 1])], self.arrays[[4, -1, 4, 1]]))
+        self.assertTrue(np.array_equal(seq[np.arange(25) % 3 == 0], self.arrays[::3]))
+        self.assertEqual(len(seq[[]]), 0)
+        self.assertTrue(np.array_equal(np.concatenate(list(seq.iter_blocks(block_size=4))), self.arrays))
+        self.assertEqual([len(b) for b in seq.iter_blocks(block_size=10)], [10, 10, 5])
+        self.assertTrue(np.array_equal(np.array(seq), self.arrays))
+        out = np.zeros_like(self.arrays)
+        self.assertIs(seq.to_numpy(out=out), out)
+        self.assertTrue(np.array_equal(out, self.arrays))
+        with self.assertRaises(IndexError):
+            seq[len(self.arrays)]
+        with self.assertRaises(IndexError):
+            seq[[0, len(self.arrays)]]
+
+    def check_object_sequence(self, seq):
+        self.assertIsInstance(seq, RecordSequence)
+        self.assertEqual(len(seq), len(self.objects))
+        self.assertEqual(seq[7], self.objects[7])
+        self.assertEqual(seq[-2], self.objects[-2])
+        self.assertEqual(seq[4:9], self.objects[4:9])
+        self.assertEqual(seq[1:20:5], self.objects[1:20:5])
+        self.assertEqual(seq[...], self.objects)
+        self.assertEqual(seq[[3, 0, -1]], [self.objects[i] for i in [3, 0, -1]])
+        self.assertEqual(seq[np.array([1, 1])], [self.objects[1]] * 2)
+        self.assertEqual(list(seq), self.objects)
+        self.assertEqual([r for b in seq.iter_blocks(block_size=6) for r in b], self.objects)
+
+    def record(self, datastore):
+        recorder = Recorder(datastore)
+        for array, obj in zip(self.arrays, self.objects):
+            recorder.record('arrays', array)
+            recorder.record('objects', obj)
+        return recorder
+
+    def test_inmemory(self):
+        recorder = self.record(InMemoryDataStore())
+        self.assertIsInstance(recorder.get_all('arrays'), ArraySequence)
+        self.assertIsInstance(recorder.get_all('objects'), ListSequence)
+        self.check_array_sequence(recorder.get_all('arrays'))
+        self.check_object_sequence(recorder.get_all('objects'))
+        self.assertEqual(len(recorder.get_all('missing')), 0)
+
+    def test_hdf5(self):
+        pth = os.path.join(self.data_dir, 'data.h5')
+        for buffered_append in [False, True]:
+            if os.path.exists(pth):
+                os.remove(pth)
+            recorder = self.record(HDF5DataStore(pth, buffered_append=buffered_append))
+            recorder.close()
+            recorder = Recorder(HDF5DataStore(pth))
+            arrays = recorder.get_all('arrays')
+            self.assertIsInstance(arrays, ArraySequence)
+            self.check_array_sequence(arrays)
+            self.assertEqual(arrays.shape, self.arrays.shape)
+            self.assertTrue(np.array_equal(arrays[:, 1, 2], self.arrays[:, 1, 2]))
+            self.assertTrue(np.array_equal(arrays[..., 2], self.arrays[..., 2]))
+            self.assertIsInstance(recorder.get_all('objects'), PackedSequence)
+            self.check_object_sequence(recorder.get_all('objects'))
+            recorder.close()
+
+    def test_zarr(self):
+        pth = os.path.join(self.data_dir, 'data.zarr')
+        recorder = self.record(ZarrDataStore(pth, datastore_type=DatastoreType.DIRECTORY, buffered_append=True))
+        recorder.close()
+        recorder = Recorder(ZarrDataStore(pth, datastore_type=DatastoreType.DIRECTORY))
+        self.check_array_sequence(recorder.get_all('arrays'))
+        self.check_object_sequence(recorder.get_all('objects'))
+        recorder.close()
+
+    def test_parallel_read(self):
+        pth = os.path.join(self.data_dir, 'data.h5')
+        for compression in ['gzip', 'lzf', None]:
+            if os.path.exists(pth):
+                os.remove(pth)
+            datastore = HDF5DataStore(pth, compression=compression, buffered_append=True,
+                                      desired_chunk_size_bytes=4 * self.arrays[0].nbytes)
+            self.record(datastore).close()
+            recorder = Recorder(HDF5DataStore(pth))
+            arrays = recorder.get_all('arrays')
+            self.assertEqual(arrays.chunks[0], 4)
+            for n_threads in [1, 3]:
+                self.assertTrue(np.array_equal(arrays.read(n_threads=n_threads), self.arrays))
+                self.assertTrue(np.array_equal(arrays.read(5, 18, n_threads=n_threads), self.arrays[5:18]))
+            out = np.zeros((10, 3, 4))
+            self.assertIs(arrays.read(2, 12, out=out, n_threads=2), out)
+            self.assertTrue(np.array_equal(out, self.arrays[2:12]))
+            recorder.close()
+
+        pth = os.path.join(self.data_dir, 'data.zarr')
+        datastore = ZarrDataStore(pth, datastore_type=DatastoreType.DIRECTORY, buffered_append=True,
+                                  desired_chunk_size_bytes=4 * self.arrays[0].nbytes)
+        self.record(datastore).close()
+        recorder = Recorder(ZarrDataStore(pth, datastore_type=DatastoreType.DIRECTORY))
+        self.assertTrue(np.array_equal(recorder.get_all('arrays').read(3, 21, n_threads=4), self.arrays[3:21]))
+        recorder.close()
+
+    def test_numpy_view(self):
+        seq = ArraySequence(self.arrays)
+        self.assertIs(seq.to_numpy().base, self.arrays)
+        self.assertEqual(len(ArraySequence(self.arrays, length=10).to_numpy()), 10)
+
+    def test_concat(self):
+        seq = ConcatSequence([ArraySequence(self.arrays[:10]), None, ArraySequence(self.arrays[10:])])
+        self.check_array_sequence(seq)
+        seq = ConcatSequence([ListSequence(self.objects[:3]), ListSequence(self.objects[3:])])
+        self.check_object_sequence(seq)
+
+    def test_packed(self):
+        values = np.arange(10)
+        offsets = np.array([2, 2, 7, 10])
+        seq = PackedSequence(values, offsets)
+        self.assertEqual([r.tolist() for r in seq], [[0, 1], [], [2, 3, 4, 5, 6], [7, 8, 9]])
+        self.assertEqual([r.tolist() for r in seq[2:4]], [[2, 3, 4, 5, 6], [7, 8, 9]])
+        self.assertEqual(seq[1:1], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
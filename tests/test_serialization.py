@@ -0,0 +1,44 @@
+import unittest
+
+import numpy as np
+
+from simrecorder.serialization import numpy_deserialize, numpy_serialize
+
+
+class TestNumpySerialization(unittest.TestCase):
+    def test_array_zero_copy(self):
+        array = np.random.rand(10, 5, 2, 6)
+        for compress in [False, True]:
+            bstring = numpy_serialize(array, compress=compress)
+            deserialized = numpy_deserialize(bstring)
+            self.assertTrue((array == deserialized).all())
+            self.assertEqual(array.dtype, deserialized.dtype)
+            # Random floats don't compress, so they must not be copied either way
+            self.assertFalse(deserialized.flags.owndata)
+            self.assertFalse(deserialized.flags.writeable)
+            self.assertEqual(deserialized.ctypes.data % 8, 0)
+
+    def test_compressed_buffers(self):
+        array = np.zeros((100, 100), dtype=np.int8)
+        bstring = numpy_serialize(array, compress=True)
+        self.assertLess(len(bstring), array.nbytes)
+        self.assertTrue((array == numpy_deserialize(bstring)).all())
+
+    def test_objects(self):
+        obj = dict(a=np.arange(10), b=[np.random.rand(3, 1), np.array([])], c='text', d=np.random.rand(4, 6).T)
+        for compress in [False, True]:
+            deserialized = numpy_deserialize(numpy_serialize(obj, compress=compress))
+            self.assertEqual(obj.keys(), deserialized.keys())
+            self.assertTrue((obj['a'] == deserialized['a']).all())
+            self.assertTrue((obj['b'][0] == deserialized['b'][0]).all())
+            self.assertEqual(obj['b'][1].shape, deserialized['b'][1].shape)
+            self.assertEqual(obj['c'], deserialized['c'])
+            self.assertTrue((obj['d'] == deserialized['d']).all())
+
+    def test_invalid_data(self):
+        with self.assertRaises(ValueError):
+            numpy_deserialize(b'not numpy')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from simrecorder import DatastoreType, HDF5DataStore, InMemoryDataStore, MemmapDataStore, Recorder, ZarrDataStore
+from simrecorder.stats import DataStoreStats
+
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_counts(self):
+        datastore1, datastore2 = InMemoryDataStore(), InMemoryDataStore()
+        recorder = Recorder(datastore1, datastore2, stats_sample_every=4)
+        for i in range(10):
+            recorder.record('a', np.zeros(10))
+        recorder.record('a', np.zeros(10), datastore=datastore2)
+        recorder.set('b', 1)
+        recorder.get('b')
+        recorder.get_all('a')
+
+        stats1, stats2 = recorder.stats()['datastores']
+        self.assertEqual(stats1['name'], 'InMemoryDataStore')
+        self.assertEqual(stats1['ops']['append']['count'], 10)
+        self.assertEqual(stats2['ops']['append']['count'], 11)
+        # Two of the ten calls on both datastores are timed
+        self.assertEqual(stats1['ops']['append']['n_sampled'], 2)
+        self.assertEqual(stats1['ops']['append']['bytes_in'], 10 * 80)
+        self.assertEqual(stats1['ops']['set']['count'], 1)
+        self.assertEqual(stats1['ops']['get']['count'], 1)
+        self.assertEqual(stats1['ops']['get_all']['count'], 1)
+        self.assertNotIn('get', stats2['ops'])
+
+        append = stats1['ops']['append']
+        self.assertLessEqual(append['p50_us'], append['max_us'])
+        self.assertEqual(sum(append['histogram']['counts']), append['n_sampled'])
+        json.dumps(recorder.stats())
+        recorder.close()
+
+    def test_latency_per_datastore(self):
+        class SlowDataStore(InMemoryDataStore):
+            def append(self, key, obj):
+                time.sleep(0.01)
+                super().append(key, obj)
+
+        for parallel in [False, True]:
+            recorder = Recorder(InMemoryDataStore(), SlowDataStore(), stats_sample_every=1, parallel=parallel)
+            for i in range(3):
+                recorder.record('a', 1.)
+            fast, slow = recorder.stats()['datastores']
+            # Every datastore is timed on its own
+            self.assertLess(fast['ops']['append']['max_us'], 5000)
+            self.assertGreaterEqual(slow['ops']['append']['mean_us'], 10000)
+            recorder.close()
+
+    def test_async(self):
+        recorder = Recorder(InMemoryDataStore(), asynchronous=True)
+        recorder.record('a', 1)
+        recorder.flush()
+        stats, = recorder.stats()['datastores']
+        self.assertEqual(stats['name'], 'InMemoryDataStore')
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(stats['ops']['append']['count'], 1)
+        recorder.close()
+
+    def test_phases(self):
+        stats = DataStoreStats('test', sample_every=2)
+        for i in range(4):
+            if stats.sample():
+                stats.add_phase('serialize', 1.)
+                stats.add_bytes(100, 10)
+        snapshot = stats.snapshot()
+        # Extrapolated from the two sampled operations to all four
+        self.assertEqual(snapshot['phase_seconds'], {'serialize': 4.})
+        self.assertEqual(snapshot['bytes_uncompressed'], 400)
+        self.assertEqual(snapshot['bytes_compressed'], 40)
+
+        # Without the compressed sizes
+        stats = DataStoreStats('test', sample_every=2)
+        for i in range(4):
+            if stats.sample():
+                stats.add_bytes(100)
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot['bytes_uncompressed'], 400)
+        self.assertNotIn('bytes_compressed', snapshot)
+
+    def test_file_datastores(self):
+        datastores = [
+            HDF5DataStore(os.path.join(self.data_dir, 'data.h5')),
+            ZarrDataStore(os.path.join(self.data_dir, 'data.zarr'), datastore_type=DatastoreType.DIRECTORY),
+            MemmapDataStore(os.path.join(self.data_dir, 'data.memmap')),
+        ]
+        pth = os.path.join(self.data_dir, 'stats.json')
+        recorder = Recorder(*datastores, stats_sample_every=4, stats_path=pth, stats_interval_seconds=60)
+        for i in range(16):
+            recorder.record('train/a', np.zeros(100))
+        for stats in recorder.stats()['datastores']:
+            # Extrapolated from four sampled appends
+            self.assertGreater(stats['phase_seconds']['io'], 0.)
+            self.assertEqual(stats['bytes_uncompressed'], 16 * 800)
+            self.assertGreater(stats['storage_bytes']['train/a'], 0)
+        # The zeros compress well
+        hdf5_stats, zarr_stats, memmap_stats = recorder.stats()['datastores']
+        self.assertLess(hdf5_stats['storage_bytes']['train/a'], 16 * 800)
+        self.assertLess(zarr_stats['storage_bytes']['train/a'], 16 * 800)
+        self.assertEqual(memmap_stats['bytes_compressed'], 16 * 800)
+        recorder.close()
+
+        # Also in the last snapshot, after the datastores are closed
+        with open(pth) as f:
+            stats = json.load(f)
+        for datastore_stats in stats['datastores']:
+            self.assertGreater(datastore_stats['storage_bytes']['train/a'], 0)
+
+    def test_export(self):
+        pth = os.path.join(self.data_dir, 'stats.json')
+        recorder = Recorder(InMemoryDataStore(), stats_path=pth, stats_interval_seconds=0.01)
+        recorder.record('a', 1)
+        recorder.close()
+        with open(pth) as f:
+            stats = json.load(f)
+        self.assertEqual(stats['datastores'][0]['ops']['append']['count'], 1)
+        self.assertEqual(stats['datastores'][0]['ops']['close']['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from simrecorder import ChromeTraceExporter, InMemoryDataStore, Recorder
+
+
+class FailingDataStore(InMemoryDataStore):
+    def append(self, key, obj):
+        raise ValueError("Cannot append {}".format(key))
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_hooks(self):
+        datastore = InMemoryDataStore()
+        recorder = Recorder(datastore)
+        started, ended = [], []
+        recorder_hook = recorder.add_trace_hook(on_start=started.append, on_end=ended.append)
+        datastore_hook = datastore.add_trace_hook(on_end=ended.append)
+
+        recorder.record('a', np.zeros(10))
+        self.assertEqual([(e.source, e.op, e.key, e.nbytes) for e in started], [('Recorder', 'record', 'a', 80)])
+        # The datastore finishes first
+        self.assertEqual([(e.source, e.op) for e in ended], [('InMemoryDataStore', 'append'), ('Recorder', 'record')])
+        self.assertGreaterEqual(ended[1].duration, ended[0].duration)
+
+        recorder.remove_trace_hook(recorder_hook)
+        datastore.remove_trace_hook(datastore_hook)
+        # Without hooks, the methods of the class are used again
+        self.assertNotIn('record', vars(recorder))
+        self.assertNotIn('append', vars(datastore))
+        n_ended = len(ended)
+        recorder.record('a', 1)
+        self.assertEqual(len(ended), n_ended)
+        with self.assertRaises(ValueError):
+            recorder.remove_trace_hook(recorder_hook)
+        recorder.close()
+
+    def test_error(self):
+        datastore = FailingDataStore()
+        ended = []
+        datastore.add_trace_hook(on_end=ended.append)
+        with self.assertRaises(ValueError):
+            datastore.append('a', 1)
+        self.assertIsInstance(ended[0].error, ValueError)
+
+    def test_chrome_trace(self):
+        pth = os.path.join(self.data_dir, 'trace.json')
+        recorder = Recorder(InMemoryDataStore(), asynchronous=True, trace_path=pth)
+        for step in range(3):
+            recorder.trace_exporter.mark('step', step=step)
+            recorder.record('a', np.zeros(10))
+        recorder.close()
+
+        with open(pth) as f:
+            events = json.load(f)['traceEvents']
+        self.assertEqual(len([e for e in events if e['ph'] == 'i']), 3)
+        records = [e for e in events if e.get('cat') == 'Recorder' and e['name'] == 'record a']
+        appends = [e for e in events if e.get('cat') == 'InMemoryDataStore' and e['name'] == 'append a']
+        self.assertEqual(len(records), 3)
+        self.assertEqual(len(appends), 3)
+        # The datastore is written to on the writer thread
+        self.assertNotEqual(records[0]['tid'], appends[0]['tid'])
+        self.assertEqual(appends[0]['args'], dict(key='a', nbytes=80))
+
+
+if __name__ == '__main__':
+    unittest.main()
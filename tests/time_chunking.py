@@ -0,0 +1,74 @@
+import os
+import shutil
+
+import numpy as np
+
+from simrecorder import HDF5DataStore, Recorder, ZarrDataStore, DatastoreType
+from simrecorder.chunking import ReadPattern
+from tests import Timer, get_size
+
+
+def make_datastore(backend, pth, **kwargs):
+    if backend == 'hdf5':
+        return HDF5DataStore(pth, **kwargs)
+    else:
+        return ZarrDataStore(pth, datastore_type=DatastoreType.DIRECTORY, **kwargs)
+
+
+def run(backend, pth, arrays, read_pattern):
+    if os.path.isdir(pth):
+        shutil.rmtree(pth)
+    elif os.path.exists(pth):
+        os.remove(pth)
+    key = 'train/what'
+    n_arrays = len(arrays)
+
+    ## WRITE
+    datastore = make_datastore(backend, pth, buffered_append=True, read_pattern=read_pattern,
+                               expected_n_records=n_arrays)
+    recorder = Recorder(datastore)
+    with Timer() as wt:
+        for array in arrays:
+            recorder.record(key, array)
+        recorder.close()
+    size = get_size(pth) if os.path.isdir(pth) else os.path.getsize(pth)
+
+    ## READ
+    datastore = make_datastore(backend, pth)
+    recorder = Recorder(datastore)
+    l = recorder.get_all(key)
+    chunks = l.chunks
+
+    with Timer() as per_timestep_time:
+        for i in np.random.randint(n_arrays, size=20):
+            np.array(l[i])
+    with Timer() as time_series_time:
+        for _ in range(20):
+            index = tuple(np.random.randint(s) for s in arrays.shape[1:-1])
+            np.array(l[(slice(None), *index, slice(None))])
+    with Timer() as whole_run_time:
+        np.array(l)
+    recorder.close()
+
+    mb = arrays.nbytes / 1024 ** 2
+    print("%-5s %-12s chunks=%-22s write %7.1f MB/s | 20 timesteps %.3fs | 20 time series %.3fs | "
+          "whole run %6.1f MB/s | %d MiB on disk" %
+          (backend, read_pattern.name, chunks, mb / wt.difftime, per_timestep_time.difftime,
+           time_series_time.difftime, mb / whole_run_time.difftime, size / 1024 ** 2))
+
+
+def main():
+    data_dir = os.path.expanduser('~/output/tmp/chunking-test')
+    os.makedirs(data_dir, exist_ok=True)
+    n_arrays = 500
+
+    for dtype in [np.float64, np.float32, np.int8]:
+        arrays = (np.random.rand(n_arrays, 10, 100, 200) * 100).astype(dtype)
+        print("Records of shape %s and dtype %s" % (arrays.shape[1:], np.dtype(dtype).name))
+        for read_pattern in ReadPattern:
+            run('hdf5', os.path.join(data_dir, 'data.h5'), arrays, read_pattern)
+            run('zarr', os.path.join(data_dir, 'data.zarr'), arrays, read_pattern)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+
+from simrecorder import Recorder, HDF5DataStore
+from tests import Timer
+
+
+def time_append(file_pth, arrays, **kwargs):
+    if os.path.exists(file_pth):
+        os.remove(file_pth)
+    key = 'train/what'
+
+    hdf5_datastore = HDF5DataStore(file_pth, **kwargs)
+    recorder = Recorder(hdf5_datastore)
+    with Timer() as wt:
+        for array in arrays:
+            recorder.record(key, array)
+        recorder.close()
+
+    hdf5_datastore = HDF5DataStore(file_pth)
+    recorder = Recorder(hdf5_datastore)
+    assert recorder.get_all(key).shape == arrays.shape
+    recorder.close()
+    return wt.difftime
+
+
+def main():
+    data_dir = os.path.expanduser('~/output/tmp/hdf5-buffered-test')
+    file_pth = os.path.join(data_dir, 'data.h5')
+    os.makedirs(data_dir, exist_ok=True)
+
+    n_arrays = 20000
+    for shape in [(1,), (10,), (100, 10), (10, 100, 10)]:
+        arrays = np.random.rand(n_arrays, *shape)
+        unbuffered_time = time_append(file_pth, arrays)
+        buffered_time = time_append(file_pth, arrays, buffered_append=True)
+        buffered_flush_time = time_append(file_pth, arrays, buffered_append=True, flush_every_seconds=1.)
+        print("Record shape %s: unbuffered %.0f rows/s, buffered %.0f rows/s, buffered (flush every 1s) %.0f rows/s" %
+              (shape, n_arrays / unbuffered_time, n_arrays / buffered_time, n_arrays / buffered_flush_time))
+
+
+if __name__ == "__main__":
+    main()
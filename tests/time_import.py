@@ -0,0 +1,49 @@
+"""
+Measures how long `import simrecorder` takes in a fresh interpreter, and fails (exit code 1) if the median is over
+the budget. numpy is imported before the measurement, since every user of simrecorder imports it anyway.
+"""
+import argparse
+import subprocess
+import sys
+
+import numpy as np
+
+# Budget for the median import time in seconds, not counting numpy
+IMPORT_TIME_BUDGET = 0.05
+
+STATEMENTS = {
+    'simrecorder': "import simrecorder",
+    'Recorder + InMemoryDataStore': "from simrecorder import Recorder, InMemoryDataStore",
+    'HDF5DataStore (module only)': "from simrecorder import HDF5DataStore",
+    'ZarrDataStore (module only)': "from simrecorder import ZarrDataStore",
+    'RedisDataStore (module only)': "from simrecorder import RedisDataStore",
+}
+
+
+def time_import(statement):
+    code = ("import time\nimport numpy\nstart = time.perf_counter()\n{}\n"
+            "print(time.perf_counter() - start)".format(statement))
+    return float(subprocess.check_output([sys.executable, '-c', code]).decode().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--budget', type=float, default=IMPORT_TIME_BUDGET,
+                        help="Budget for the median time of `import simrecorder` in seconds")
+    args = parser.parse_args()
+
+    medians = {}
+    for name, statement in STATEMENTS.items():
+        times = [time_import(statement) for _ in range(args.repeats)]
+        medians[name] = np.median(times)
+        print("%-32s median %6.1f ms, min %6.1f ms" % (name, medians[name] * 1e3, np.min(times) * 1e3))
+
+    if medians['simrecorder'] > args.budget:
+        print("`import simrecorder` takes %.1f ms, over the budget of %.1f ms" %
+              (medians['simrecorder'] * 1e3, args.budget * 1e3))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import os
+import shutil
+
+import numpy as np
+
+from simrecorder import CompressionType, DatastoreType, HDF5DataStore, Recorder, ZarrDataStore
+from tests import Timer
+
+
+def make_datastore(backend, compression, pth, **kwargs):
+    if backend == 'hdf5':
+        return HDF5DataStore(pth, compression=compression, **kwargs)
+    else:
+        return ZarrDataStore(pth, datastore_type=DatastoreType.DIRECTORY, compression_type=compression, **kwargs)
+
+
+def run(backend, compression, pth, arrays, thread_counts):
+    if os.path.isdir(pth):
+        shutil.rmtree(pth)
+    elif os.path.exists(pth):
+        os.remove(pth)
+    key = 'train/what'
+
+    ## WRITE
+    recorder = Recorder(make_datastore(backend, compression, pth, buffered_append=True))
+    for array in arrays:
+        recorder.record(key, array)
+    recorder.close()
+
+    ## READ
+    recorder = Recorder(make_datastore(backend, compression, pth))
+    l = recorder.get_all(key)
+    out = np.empty_like(arrays)
+    mb = arrays.nbytes / 1024 ** 2
+    # Untimed read, so that every timed read finds the file in the page cache
+    l.read(out=out, n_threads=1)
+    results = []
+    for n_threads in thread_counts:
+        with Timer() as rt:
+            l.read(out=out, n_threads=n_threads)
+        assert np.array_equal(out, arrays)
+        results.append(mb / rt.difftime)
+    recorder.close()
+
+    compression_name = getattr(compression, 'name', compression)
+    print("%-5s %-6s %s" % (backend, compression_name, ' | '.join(
+        "%2d threads %7.1f MB/s (x%.1f)" % (n_threads, mb_per_s, mb_per_s / results[0])
+        for n_threads, mb_per_s in zip(thread_counts, results))))
+
+
+def main():
+    data_dir = os.path.expanduser('~/output/tmp/parallel-read-test')
+    os.makedirs(data_dir, exist_ok=True)
+    n_cpus = os.cpu_count()
+    thread_counts = sorted({1, 2, 4, 8, 16, 32, 64, n_cpus} & set(range(1, n_cpus + 1)))
+
+    # Random data with a limited range of values, so that it compresses somewhat
+    n_arrays = 2000
+    arrays = np.random.randint(0, 100, size=(n_arrays, 200, 200)).astype(np.float32)
+    print("Reading %d records of shape %s (%d MiB) with %d CPUs" %
+          (n_arrays, arrays.shape[1:], arrays.nbytes / 1024 ** 2, n_cpus))
+
+    for compression in ['gzip', 'lzf', None]:
+        run('hdf5', compression, os.path.join(data_dir, 'data.h5'), arrays, thread_counts)
+    for compression in CompressionType:
+        run('zarr', compression, os.path.join(data_dir, 'data.zarr'), arrays, thread_counts)
+
+
+if __name__ == "__main__":
+    main()
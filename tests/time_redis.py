@@ -18,7 +18,10 @@ def main():
     ns = 200
     n_arrays = 100
     # serialization = Serialization.PYARROW
+    # serialization = Serialization.NUMPY
     serialization = Serialization.PICKLE
+    # Values larger than this are stored (and fetched in parallel) in parts. None stores every array in one piece
+    part_size_bytes = 8 * 1024 ** 2
 
     if not read_only:
         arrays = np.random.rand(n_arrays, bs, sts, ns)
@@ -28,7 +31,7 @@ def main():
             shutil.rmtree(data_dir)
         os.makedirs(data_dir, exist_ok=True)
 
-        with RedisServer(data_directory=data_dir, serialization=serialization):
+        with RedisServer(data_directory=data_dir, serialization=serialization, part_size_bytes=part_size_bytes):
             ## WRITE
             redis_datastore = RedisDataStore(server_host='localhost')
             recorder = Recorder(redis_datastore)
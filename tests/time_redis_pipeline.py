@@ -0,0 +1,47 @@
+import os
+import shutil
+
+import numpy as np
+
+from simrecorder import Recorder, RedisDataStore, RedisServer
+from tests import Timer
+
+
+def time_writes(data_dir, n_steps, n_keys, **kwargs):
+    if os.path.exists(data_dir):
+        shutil.rmtree(data_dir)
+    os.makedirs(data_dir, exist_ok=True)
+
+    with RedisServer(data_directory=data_dir):
+        redis_datastore = RedisDataStore(server_host='localhost', **kwargs)
+        recorder = Recorder(redis_datastore)
+
+        with Timer() as wt:
+            for step in range(n_steps):
+                for k in range(n_keys):
+                    recorder.record('train.key{}'.format(k), np.float32(step))
+            recorder.close()
+
+        redis_datastore = RedisDataStore(server_host='localhost')
+        assert len(redis_datastore.get_all('train.key0')) == n_steps
+    return wt.difftime
+
+
+def main():
+    data_dir = os.path.expanduser('~/output/tmp/redis-pipeline-test')
+    n_steps = 100
+    n_keys = 1000
+    n_records = n_steps * n_keys
+
+    for name, kwargs in [('unpipelined', dict()),
+                         ('pipelined (100 commands)', dict(pipeline_max_commands=100)),
+                         ('pipelined (1000 commands)', dict(pipeline_max_commands=1000)),
+                         ('pipelined (64 KiB)', dict(pipeline_max_bytes=64 * 1024)),
+                         ('pipelined (every 0.1s)', dict(pipeline_flush_seconds=0.1))]:
+        write_time = time_writes(data_dir, n_steps, n_keys, **kwargs)
+        print("%s: %d records of %d keys took %.2fs (%.0f records/s)" %
+              (name, n_records, n_keys, write_time, n_records / write_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Compares the throughput of the RedisDataStore over TCP (loopback) and over the unix socket of a local RedisServer,
+for many small records and for a few large ones. Needs `redis-server` in the PATH.
+"""
+import os
+import shutil
+
+import numpy as np
+
+from simrecorder import Recorder, RedisDataStore, RedisServer
+from tests import Timer
+
+
+def time_transport(port, unix_socket_path, records, key):
+    redis_datastore = RedisDataStore(server_host='localhost', redis_port=port, unix_socket_path=unix_socket_path)
+    recorder = Recorder(redis_datastore)
+    with Timer() as wt:
+        for record in records:
+            recorder.record(key, record)
+        recorder.flush()
+    with Timer() as rt:
+        l = list(recorder.get_all(key))
+    assert len(l) == len(records)
+    recorder.close()
+    return wt.difftime, rt.difftime
+
+
+def main():
+    data_dir = os.path.expanduser('~/output/tmp/redis-transport-test')
+    if os.path.exists(data_dir):
+        shutil.rmtree(data_dir)
+    os.makedirs(data_dir, exist_ok=True)
+    unix_socket_path = os.path.join(data_dir, 'redis.sock')
+
+    cases = [('small (10 floats)', [np.random.rand(10) for _ in range(20000)]),
+             ('large (8 MB)', [np.random.rand(1000, 1000) for _ in range(20)])]
+
+    with RedisServer(data_directory=data_dir, redis_port='random', unix_socket_path=unix_socket_path,
+                     use_compression=False) as server:
+        for name, records in cases:
+            nbytes = sum(r.nbytes for r in records)
+            for transport, socket_path in [('tcp', None), ('unix', unix_socket_path)]:
+                key = '{}.{}'.format(name, transport)
+                write_time, read_time = time_transport(server.port, socket_path, records, key)
+                print("%-18s %-4s write %8.0f records/s %8.1f MB/s, read %8.0f records/s %8.1f MB/s" %
+                      (name, transport, len(records) / write_time, nbytes / write_time / 1e6,
+                       len(records) / read_time, nbytes / read_time / 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Measures the overhead of the performance counters (see :meth:`simrecorder.Recorder.stats`) on the hot path of
+:meth:`simrecorder.Recorder.record` with an :class:`simrecorder.InMemoryDataStore`, and fails (exit code 1) if it is
+over the budget of 1%. The baseline is the loop of `record` before the recorder had any counters.
+
+Short runs of both recorders are interleaved in random order, and the overhead is the median of their ratios, so that
+other load on the machine affects both the same way.
+"""
+import argparse
+import random
+import sys
+import timeit
+
+import numpy as np
+
+from simrecorder import InMemoryDataStore, Recorder
+
+# Budget for the overhead relative to the uninstrumented recorder
+OVERHEAD_BUDGET = 0.01
+# Upper bound of the memory used by the records of one timing run
+MAX_BYTES = 64 * 1024 ** 2
+
+
+class UninstrumentedRecorder(Recorder):
+    def record(self, key, val, datastore=None):
+        # The loop of the recorder before it had any performance counters
+        datastores = self.datastores
+        if datastore is not None:
+            datastores = [datastore]
+
+        for datastore in datastores:
+            datastore.append(key, val)
+
+
+def time_record(recorder_class, val, n_records):
+    recorder = recorder_class(InMemoryDataStore())
+    record = recorder.record
+    start = timeit.default_timer()
+    for _ in range(n_records):
+        record('key', val)
+    elapsed = timeit.default_timer() - start
+    recorder.close()
+    return elapsed / n_records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n-records', type=int, default=2560,
+                        help="Number of records of one run (a multiple of the sampling interval of the counters)")
+    parser.add_argument('--repeats', type=int, default=300)
+    parser.add_argument('--budget', type=float, default=OVERHEAD_BUDGET,
+                        help="Budget for the relative overhead of the counters")
+    args = parser.parse_args()
+
+    failed = False
+    for name, val in [('float', 1.), ('array (10,)', np.arange(10.)), ('array (100, 100)', np.zeros((100, 100)))]:
+        n_records = min(args.n_records, MAX_BYTES // np.asarray(val).nbytes)
+        baseline, ratios = [], []
+        for _ in range(args.repeats):
+            recorder_classes = [UninstrumentedRecorder, Recorder]
+            random.shuffle(recorder_classes)
+            times = {recorder_class: time_record(recorder_class, val, n_records)
+                     for recorder_class in recorder_classes}
+            baseline.append(times[UninstrumentedRecorder])
+            ratios.append(times[Recorder] / times[UninstrumentedRecorder])
+        overhead = np.median(ratios) - 1
+        print("%-18s uninstrumented %6.3f us, overhead %+5.2f%% (interquartile range %+5.2f%% to %+5.2f%%)" %
+              (name, np.median(baseline) * 1e6, overhead * 100, (np.percentile(ratios, 25) - 1) * 100,
+               (np.percentile(ratios, 75) - 1) * 100))
+        failed = failed or overhead > args.budget
+
+    if failed:
+        print("The overhead of the statistics is over the budget of %.1f%%" % (args.budget * 100))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()